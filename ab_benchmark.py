@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Seeded A/B benchmark of 2 or more configurations, such as Talon vs. Dragonfly mappings, or 2 versions of "alphabet.csv".
+# Each configuration plays the same seeded sequence of rounds in "practice_mappings.py", with a journal of every round, then the
+# per-round speed & accuracy of each configuration are compared against the first one, with bootstrap confidence intervals.
+#
+# With "--blocks", the rounds are split into blocks played in ABBA order (A B, then B A, ...), so that getting warmed up or tired
+# doesn't favour whichever configuration is played first. When the configurations show the same characters in each round (such as
+# 2 versions of the same alphabet), the rounds are compared in pairs, which needs far fewer rounds to show a real difference.
+#
+# eg:
+#   python ab_benchmark.py --config "old=--weights_file old.csv" --config "new=--weights_file new.csv" --rounds 40 --blocks 2 -- 3 --symbols
+#   python ab_benchmark.py --config talon= --config dragonfly=--dragonfly --rounds 200 -- 3 --synthetic 0.3 --synthetic_error 5
+
+from __future__ import print_function
+
+import os
+import sys
+import math
+import shlex
+import random
+import argparse
+import tempfile
+import subprocess
+
+from session_journal import JournalReader
+
+PRACTICE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "practice_mappings.py")
+DEFAULT_RESAMPLES = 2000
+
+
+class Configuration:
+    '''One side of the comparison: a label, and the extra args of "practice_mappings.py" for it.'''
+    def __init__(self, label, args):
+        self.label = label
+        self.args = args
+        self.rounds = []        # List of BenchmarkRound, in the order they were played
+
+# Parse a "LABEL=ARGS" command-line option, such as "dragonfly=--dragonfly".
+def parse_configuration(text):
+    if "=" not in text:
+        raise argparse.ArgumentTypeError("Expected LABEL=ARGS, such as \"dragonfly=--dragonfly\", but got %r" % text)
+    (label, args) = text.split("=", 1)
+    return Configuration(label.strip(), shlex.split(args))
+
+
+class BenchmarkRound:
+    '''
+    The numbers of one round that get compared.
+    key: (block, round number), to pair up the same round of different configurations.
+    secondsPerKey: time from showing the prompt to the last key, divided by the number of characters, or NaN if nothing was typed.
+    firstKey: seconds until the first key arrived (the recognizer's delay), or NaN.
+    '''
+    def __init__(self, key, truth, secondsPerKey, firstKey, correct):
+        self.key = key
+        self.truth = truth
+        self.secondsPerKey = secondsPerKey
+        self.firstKey = firstKey
+        self.correct = correct
+
+# Read the rounds of one benchmark journal.
+def read_rounds(filename, block):
+    rounds = []
+    with JournalReader(filename) as reader:
+        for journalRound in reader.rounds():
+            secondsPerKey = float('nan')
+            firstKey = float('nan')
+            if len(journalRound.keys) > 0 and not journalRound.timedOut:
+                secondsPerKey = (journalRound.keys[-1][1] - journalRound.timeStart) / 1e9 / max(len(journalRound.truth), 1)
+                firstKey = (journalRound.keys[0][1] - journalRound.timeStart) / 1e9
+            rounds.append(BenchmarkRound((block, journalRound.roundNumber), journalRound.truth, secondsPerKey, firstKey, journalRound.correct))
+    return rounds
+
+
+# Play "rounds" rounds of one configuration in "practice_mappings.py", saving a journal. Returns the exit code.
+def run_configuration(configuration, seed, rounds, commonArgs, journalFilename):
+    command = [sys.executable, PRACTICE_SCRIPT] + commonArgs + configuration.args + [
+        "--random_seed", str(seed), "--rounds", str(rounds), "--journal", journalFilename, "--no_stats", "--no_watch"]
+    return subprocess.call(command)
+
+# Play all the configurations, in ABBA order when there's more than 1 block. Every configuration uses the same seed within a block.
+def run_benchmark(configurations, seed, rounds, blocks, commonArgs, journalFolder):
+    for block in range(blocks):
+        order = configurations if block % 2 == 0 else list(reversed(configurations))
+        blockRounds = rounds // blocks + (1 if block < rounds % blocks else 0)
+        for configuration in order:
+            print()
+            print("Block %d of %d: %s (%d rounds)" % (block + 1, blocks, configuration.label, blockRounds))
+            journalFilename = os.path.join(journalFolder, "%s-block%d.psj" % (safe_filename(configuration.label), block + 1))
+            if os.path.exists(journalFilename):
+                os.remove(journalFilename)
+            if run_configuration(configuration, seed + block, blockRounds, commonArgs, journalFilename) != 0:
+                raise RuntimeError("The benchmark of '%s' failed" % configuration.label)
+            configuration.rounds.extend(read_rounds(journalFilename, block))
+
+def safe_filename(label):
+    return "".join([char if char.isalnum() or char in "-_" else "_" for char in label]) or "config"
+#--------------------------------------
+
+
+def mean(values):
+    return sum(values) / len(values) if len(values) > 0 else float('nan')
+
+def median(values):
+    values = sorted(values)
+    if len(values) == 0:
+        return float('nan')
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+def finite(values):
+    return [value for value in values if not math.isnan(value)]
+
+# Percentile bootstrap confidence interval of a statistic of one or more samples, resampling each sample with replacement.
+# Returns (low, high).
+def bootstrap_interval(samples, statistic, rng, resamples=DEFAULT_RESAMPLES, confidence=0.95):
+    estimates = []
+    for i in range(resamples):
+        resampled = [[sample[rng.randrange(len(sample))] for j in range(len(sample))] for sample in samples]
+        estimate = statistic(*resampled)
+        if not math.isnan(estimate):
+            estimates.append(estimate)
+    if len(estimates) == 0:
+        return (float('nan'), float('nan'))
+    estimates.sort()
+    tail = (1.0 - confidence) / 2.0
+    low = estimates[int(math.floor(tail * (len(estimates) - 1)))]
+    high = estimates[int(math.ceil((1.0 - tail) * (len(estimates) - 1)))]
+    return (low, high)
+
+
+class Comparison:
+    '''
+    The differences of one configuration from the baseline: (estimate, low, high) of the mean seconds per key,
+    the median first-key delay and the accuracy (in percentage points). Negative times mean faster than the baseline.
+    paired: whether the rounds were compared in pairs, because both configurations showed the same characters.
+    '''
+    def __init__(self, baseline, other, rng, resamples, confidence):
+        self.label = other.label
+        baseRounds = dict([(benchmarkRound.key, benchmarkRound) for benchmarkRound in baseline.rounds])
+        pairs = [(baseRounds[benchmarkRound.key], benchmarkRound) for benchmarkRound in other.rounds if benchmarkRound.key in baseRounds]
+        self.paired = len(pairs) > 0 and all([a.truth == b.truth for (a, b) in pairs])
+        if self.paired:
+            # Each resample picks whole pairs of rounds, keeping the difference between the configurations on the same prompt.
+            speedPairs = [(b.secondsPerKey - a.secondsPerKey) for (a, b) in pairs if not (math.isnan(a.secondsPerKey) or math.isnan(b.secondsPerKey))]
+            firstPairs = [(b.firstKey - a.firstKey) for (a, b) in pairs if not (math.isnan(a.firstKey) or math.isnan(b.firstKey))]
+            accuracyPairs = [100.0 * (int(b.correct) - int(a.correct)) for (a, b) in pairs]
+            self.speed = self.estimate([speedPairs], mean, rng, resamples, confidence)
+            self.firstKey = self.estimate([firstPairs], median, rng, resamples, confidence)
+            self.accuracy = self.estimate([accuracyPairs], mean, rng, resamples, confidence)
+            self.rounds = len(pairs)
+        else:
+            # Different prompts, so the 2 sets of rounds are resampled independently.
+            def difference(function):
+                return lambda a, b: function(b) - function(a)
+            self.speed = self.estimate([finite([r.secondsPerKey for r in baseline.rounds]), finite([r.secondsPerKey for r in other.rounds])],
+                                       difference(mean), rng, resamples, confidence)
+            self.firstKey = self.estimate([finite([r.firstKey for r in baseline.rounds]), finite([r.firstKey for r in other.rounds])],
+                                          difference(median), rng, resamples, confidence)
+            self.accuracy = self.estimate([[100.0 * r.correct for r in baseline.rounds], [100.0 * r.correct for r in other.rounds]],
+                                          difference(mean), rng, resamples, confidence)
+            self.rounds = min(len(baseline.rounds), len(other.rounds))
+
+    def estimate(self, samples, statistic, rng, resamples, confidence):
+        if any([len(sample) == 0 for sample in samples]):
+            return (float('nan'), float('nan'), float('nan'))
+        (low, high) = bootstrap_interval(samples, statistic, rng, resamples, confidence)
+        return (statistic(*samples), low, high)
+
+
+# Describe a difference with its confidence interval, and whether the interval shows a real difference.
+def difference_text(name, estimate, unit, betterIfLower):
+    (value, low, high) = estimate
+    if math.isnan(value):
+        return "%s: not enough rounds" % name
+    if low > 0.0 or high < 0.0:
+        better = (high < 0.0) == betterIfLower
+        verdict = "better" if better else "worse"
+    else:
+        verdict = "no clear difference"
+    return "%s: %+.3f%s [%+.3f .. %+.3f] (%s)" % (name, value, unit, low, high, verdict)
+
+# Lines of text with the numbers of each configuration, then how each one differs from the first.
+def report_lines(configurations, comparisons, confidence):
+    lines = ["", "%-20s %7s %9s %14s %16s" % ("Configuration", "Rounds", "Accuracy", "Mean s/key", "Median 1st key")]
+    for configuration in configurations:
+        rounds = configuration.rounds
+        accuracy = 100.0 * sum([1 for r in rounds if r.correct]) / len(rounds) if rounds else float('nan')
+        lines.append("%-20s %7d %8.1f%% %12.3f s %14.3f s" % (configuration.label[:20], len(rounds), accuracy,
+                     mean(finite([r.secondsPerKey for r in rounds])), median(finite([r.firstKey for r in rounds]))))
+    for comparison in comparisons:
+        lines.append("")
+        lines.append("%s vs %s (%d %s rounds, %.0f%% confidence intervals):" % (comparison.label, configurations[0].label, comparison.rounds,
+                     "paired" if comparison.paired else "unpaired", confidence * 100.0))
+        lines.append("    " + difference_text("Mean seconds per key", comparison.speed, " s", True))
+        lines.append("    " + difference_text("Median first-key delay", comparison.firstKey, " s", True))
+        lines.append("    " + difference_text("Accuracy", comparison.accuracy, " points", False))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage='%(prog)s --config LABEL=ARGS --config LABEL=ARGS [options] [-- practice_mappings.py options]',
+                                     description='Play the same seeded rounds with 2 or more configurations of "practice_mappings.py", and compare their speed & accuracy.')
+    parser.add_argument('--config', type=parse_configuration, action='append', required=True, metavar='LABEL=ARGS',
+                        help='A configuration to compare: a label, then the "practice_mappings.py" options for it, eg: "dragonfly=--dragonfly". The first one is the baseline.')
+    parser.add_argument('-r', '--random_seed', type=int, default=1, help='Seed of the rounds, the same for every configuration. Default is 1.')
+    parser.add_argument('--rounds', type=int, default=30, help='How many rounds each configuration plays. Default is 30.')
+    parser.add_argument('--blocks', type=int, default=1, help='Split the rounds into this many blocks, played in ABBA order. Default is 1.')
+    parser.add_argument('--journals', metavar='FOLDER', help='Folder to keep the journal of each configuration & block in. Default is a temporary folder.')
+    parser.add_argument('--compare', action='store_true', help="Don't play, only compare the journals that are already in the \"--journals\" folder.")
+    parser.add_argument('--resamples', type=int, default=DEFAULT_RESAMPLES, help='Bootstrap resamples for the confidence intervals. Default is %d.' % DEFAULT_RESAMPLES)
+    parser.add_argument('--confidence', type=float, default=95.0, metavar='PERCENT', help='Confidence level of the intervals. Default is 95.')
+    parser.add_argument('practice_args', nargs=argparse.REMAINDER, help='Options given to "practice_mappings.py" for every configuration, after "--".')
+    args = parser.parse_args()
+
+    if len(args.config) < 2:
+        parser.error("At least 2 configurations are needed to compare")
+    if args.compare and not args.journals:
+        parser.error('"--compare" needs the "--journals" folder of an earlier benchmark')
+    commonArgs = args.practice_args[1:] if args.practice_args[:1] == ["--"] else args.practice_args
+    blocks = max(1, min(args.blocks, args.rounds))
+
+    temporaryFolder = None
+    journalFolder = args.journals
+    if journalFolder is None:
+        temporaryFolder = tempfile.TemporaryDirectory(prefix="ab_benchmark-")
+        journalFolder = temporaryFolder.name
+    elif not os.path.isdir(journalFolder):
+        os.makedirs(journalFolder)
+    try:
+        if args.compare:
+            for configuration in args.config:
+                for block in range(blocks):
+                    configuration.rounds.extend(read_rounds(os.path.join(journalFolder, "%s-block%d.psj" % (safe_filename(configuration.label), block + 1)), block))
+        else:
+            run_benchmark(args.config, args.random_seed, args.rounds, blocks, commonArgs, journalFolder)
+    except (RuntimeError, OSError, ValueError) as e:
+        print("Error:", e)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print()
+        sys.exit(1)
+    finally:
+        if temporaryFolder is not None:
+            temporaryFolder.cleanup()
+
+    # The bootstrap has its own seeded generator, so the same journals always give the same intervals.
+    rng = random.Random(args.random_seed)
+    confidence = args.confidence / 100.0
+    comparisons = [Comparison(args.config[0], configuration, rng, args.resamples, confidence) for configuration in args.config[1:]]
+    for line in report_lines(args.config, comparisons, confidence):
+        print(line)
@@ -0,0 +1,206 @@
+# coding: utf-8
+# An asyncio version of the practice game loop. The terminal is registered with the event loop instead of blocking on it,
+# so each round can have a time limit (a stuck recognizer counts as a miss instead of hanging the session),
+# and a live timer can be shown while waiting, on a separate coroutine that doesn't change when the keys get stamped.
+
+from __future__ import print_function
+
+import sys
+import time
+import asyncio
+
+import profiler
+
+# How often the live timer is redrawn, in seconds.
+LIVE_TIMER_INTERVAL = 0.1
+
+
+class TerminalKeySource:
+    '''
+    Feed a KeyFramer from a terminal file descriptor that's registered with the event loop.
+    Each read is stamped by the key reader straight after its read() call, inside the loop's readable callback.
+    '''
+    def __init__(self, loop, fd, keyreader, keyframer):
+        self.loop = loop
+        self.fd = fd
+        self.keyreader = keyreader
+        self.keyframer = keyframer
+        self.arrived = asyncio.Event()
+        self.ended = False
+        loop.add_reader(fd, self.on_readable)
+
+    def on_readable(self):
+        (text, arrival) = self.keyreader.read_stamped()
+        if text == "":
+            # End of the input, such as a closed pipe.
+            self.ended = True
+            self.loop.remove_reader(self.fd)
+        self.keyframer.feed(text, arrival)
+        self.arrived.set()
+
+    async def wait(self, timeout):
+        '''Wait until more keys have arrived, or the timeout (in seconds, or None). Returns False if it timed out.'''
+        if self.ended:
+            raise EOFError("The input has ended")
+        self.arrived.clear()
+        try:
+            with profiler.span("wait for input (event loop)", profiler.USER):
+                await asyncio.wait_for(self.arrived.wait(), self.keyframer.escape_timeout(timeout))
+        except asyncio.TimeoutError:
+            return self.keyframer.flush_escape()
+        return True
+
+    def start_round(self):
+        pass
+
+    def close(self):
+        if not self.ended:
+            self.loop.remove_reader(self.fd)
+
+
+class ThreadKeySource:
+    '''
+    Feed a KeyFramer from a key reader that blocks, such as a scripted keystroke stream, by reading it in a worker thread.
+    Each read is stamped in the worker thread as soon as it returns, and tagged with the round it was started in,
+    so that a read that was still on its way when a round ran out of time isn't counted in the next round.
+    '''
+    def __init__(self, loop, keyreader, keyframer):
+        self.loop = loop
+        self.keyreader = keyreader
+        self.keyframer = keyframer
+        self.pending = None
+        self.round = 0
+
+    def read(self, round):
+        text = self.keyreader.getch()
+        return (round, text, time.monotonic_ns())
+
+    async def wait(self, timeout):
+        '''Wait until more keys have arrived, or the timeout (in seconds, or None). Returns False if it timed out.'''
+        if self.pending is None:
+            self.pending = self.loop.run_in_executor(None, self.read, self.round)
+        try:
+            # Shield the read, so that a timeout doesn't lose keys that are still on their way.
+            (round, text, arrival) = await asyncio.wait_for(asyncio.shield(self.pending), self.keyframer.escape_timeout(timeout))
+        except asyncio.TimeoutError:
+            return self.keyframer.flush_escape()
+        finally:
+            if self.pending.done():
+                self.pending = None
+        if round == self.round:
+            self.keyframer.feed(text, arrival)
+        return True     # Keys of an earlier round are dropped, and the caller waits again for this round's keys
+
+    def start_round(self):
+        '''A new prompt is being shown: keys of reads that were started before now belong to an earlier round.'''
+        self.round += 1
+
+    def close(self):
+        pass
+
+
+# Return a key source that feeds the KeyFramer from the event loop: the terminal's file descriptor if there is one, or else a worker thread.
+def open_key_source(loop, keyreader, keyframer):
+    fd = getattr(keyreader, "fd", None)
+    if fd is not None:
+        return TerminalKeySource(loop, fd, keyreader, keyframer)
+    return ThreadKeySource(loop, keyreader, keyframer)
+
+
+# Keep redrawing the elapsed time at the end of the prompt line, until cancelled.
+# The cursor is saved & restored around each redraw, so the keys being echoed below aren't disturbed.
+async def live_timer(column, timeStart, timeLimit):
+    while True:
+        await asyncio.sleep(LIVE_TIMER_INTERVAL)
+        elapsed = (time.monotonic_ns() - timeStart) / 1e9
+        if timeLimit > 0:
+            text = "%.1f / %.1f s " % (elapsed, timeLimit)
+        else:
+            text = "%.1f s " % elapsed
+        sys.stdout.write("\x1b7\x1b[1A\x1b[%dG%s\x1b8" % (column, text))
+        sys.stdout.flush()
+
+
+# Play rounds until the input ends or "rounds" rounds have been played (if rounds > 0).
+# source: where the keys come from, such as a network connection. Default is to read them from the keyreader.
+async def practice_loop(session, keyreader, keyframer, renderer, timeLimit, before_round, show_prompt, rounds, source=None):
+    if source is None:
+        source = open_key_source(asyncio.get_running_loop(), keyreader, keyframer)
+    showTimer = renderer.inPlace    # Only when the rounds are drawn on our own terminal
+    timedOut = False
+    (lines, statusLines) = ([], [])
+    echoed = ""
+
+    try:
+        while True:
+            roundStart = time.monotonic_ns()
+            if before_round is not None:
+                with profiler.span("mapping updates"):
+                    lines.extend(before_round())
+            if timedOut:
+                keyframer.take_queued()     # Drop late keys from the round that ran out of time
+
+            try:
+                with profiler.span("next prompt"):
+                    prompt = session.next_prompt()
+            except EOFError:
+                renderer.frame(lines, statusLines, None, echoed)    # The drill file has ended
+                raise
+            source.start_round()
+            if show_prompt is not None:
+                show_prompt(prompt.truth)
+            line = prompt.line()
+            # Show the results of the previous round and the new prompt in a single write.
+            with profiler.span("draw frame"):
+                renderer.frame(lines, statusLines, line, echoed)
+
+            timeStart = time.monotonic_ns()
+            deadline = timeStart + int(timeLimit * 1e9)
+            timer = None
+            if showTimer:
+                timer = asyncio.ensure_future(live_timer(len(line) + 2, timeStart, timeLimit))
+
+            # Wait for "combo" keys, or until the time limit. Extra keys that arrived in the same burst are part of this answer too.
+            typedKeys = []
+            keyTimes = []
+            timedOut = False
+            try:
+                while True:
+                    for (key, arrival) in keyframer.take_queued():
+                        typedKeys.append(key)
+                        keyTimes.append(arrival)
+                    if len(keyTimes) >= len(prompt.expected):
+                        break
+                    timeout = None
+                    if timeLimit > 0:
+                        timeout = (deadline - time.monotonic_ns()) / 1e9
+                        if timeout <= 0 or not await source.wait(timeout):
+                            timedOut = True
+                            break
+                    else:
+                        await source.wait(None)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+            with profiler.span("score round"):
+                (lines, statusLines) = session.score_round(prompt, typedKeys, timeStart, keyTimes, timedOut)
+            echoed = "".join(typedKeys)
+            with profiler.span("prefetch prompts"):
+                session.prefetch_prompts()
+            profiler.add_span("round", profiler.ROUND, roundStart, time.monotonic_ns())
+            if rounds > 0 and session.rounds_played() >= rounds:
+                renderer.frame(lines, statusLines, None, echoed)
+                return
+    finally:
+        source.close()
+
+
+# Run the practice game on an asyncio event loop, until the input ends or "rounds" rounds have been played (if rounds > 0).
+# timeLimit: seconds allowed for each round, or 0 for no limit.
+# renderer: the TerminalRenderer that draws each round.
+# before_round: function called before each round, such as to swap in reloaded mappings. Returns a list of lines to show.
+# show_prompt: function called with the expected text of each round, such as for a synthetic typist.
+# Raises EOFError when a keystroke stream or the input ends.
+def run_async_session(session, keyreader, keyframer, renderer, timeLimit=0.0, before_round=None, show_prompt=None, rounds=0):
+    asyncio.run(practice_loop(session, keyreader, keyframer, renderer, timeLimit, before_round, show_prompt, rounds))
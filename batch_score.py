@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# Offline scoring of a speech recognizer's transcript, without a person or a terminal.
+# Recorded audio of the prompts of a seeded session is fed to the recognizer offline, and the text it types is saved as a transcript
+# with one line per round. This rebuilds exactly the same rounds that "practice_mappings.py" would show with the same random seed,
+# combo length & mapping options, then scores the whole transcript in a single streaming pass instead of going through KeyReader.
+# Only the rounds generated ahead and the counts of each mapping are kept in memory, so millions of rounds can be scored with the
+# same memory as a few: a round that was typed exactly right is just counted, and only the wrong ones get aligned.
+#
+# eg:
+#   python practice_mappings.py 3 --symbols --random_seed 12345 --rounds 1000 --export_drill prompts.jsonl   # To record the audio
+#   python batch_score.py transcript.txt 3 --symbols --random_seed 12345
+
+# Python 2/3 compatibility
+from __future__ import print_function
+
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import collections
+
+from practice_session import PracticeSession, add_prompt_options, parse_custom_weights, check_total_weight, mapping_sources, build_letter_list, build_vocabulary_weights, load_drill
+from vocabulary import load_vocabulary
+from mappings import load_mappings, cache_filename_for
+from confusability import CONFUSABILITY_CACHE_BASENAME
+from scoring import align, ConfusionMatrix
+
+# Size of the read buffer of the transcript file.
+READ_BUFFER_SIZE = 1 << 20
+
+# How many different wrong answers are kept for each mapping. Any others are counted together, so memory doesn't grow with the
+# number of rounds even when every wrong answer of a word drill is different.
+MAXIMUM_CONFUSIONS = 50
+
+
+class TranscriptScorer:
+    '''
+    Running totals of a transcript scored against its rounds: how many rounds & characters were wrong,
+    how often each mapping was shown & typed wrongly, and what was typed instead.
+    Memory only grows with the number of distinct mappings (up to MAXIMUM_CONFUSIONS wrong answers each), not with the number of rounds.
+    '''
+    def __init__(self):
+        self.rounds = 0
+        self.correctRounds = 0
+        self.charCount = 0
+        self.substitutions = 0
+        self.insertions = 0
+        self.deletions = 0
+        self.shown = collections.Counter()      # {(phrase, char): how many times it was shown}
+        self.wrong = collections.Counter()      # {(phrase, char): how many times it was typed wrongly}
+        self.confusions = ConfusionMatrix(MAXIMUM_CONFUSIONS)
+
+    def score(self, prompt, typed):
+        '''Score the typed text of one round. Returns True if it was exactly right.'''
+        self.rounds += 1
+        self.charCount += len(prompt.expected)
+        self.shown.update(prompt.keys)
+        if typed == prompt.truth:
+            self.correctRounds += 1
+            return True
+
+        # Align the answer against the prompt, to find which of its mappings were wrong, the same way as a live session.
+        alignment = align(prompt.expected, typed)
+        self.substitutions += alignment.substitutions
+        self.insertions += alignment.insertions
+        self.deletions += alignment.deletions
+        typedForExpected = alignment.typed_for_expected()
+        for (i, (start, end)) in enumerate(prompt.spans):
+            typedKey = "".join([char for char in typedForExpected[start:end] if char is not None])
+            if typedKey != prompt.chars[i]:
+                self.wrong[prompt.keys[i]] += 1
+                self.confusions.add(prompt.keys[i], typedKey if typedKey else None)
+        return False
+
+    def char_errors(self):
+        return self.substitutions + self.insertions + self.deletions
+
+    def summary_lines(self, count=10):
+        '''Lines of text with the accuracy, the "count" most often wrong mappings and the most common confusions.'''
+        if self.rounds == 0:
+            return ["No rounds were scored."]
+        lines = ["Scored %d rounds: %d correct, %d wrong = %.2f%% combo errors." % (
+            self.rounds, self.correctRounds, self.rounds - self.correctRounds, 100.0 * (self.rounds - self.correctRounds) / self.rounds)]
+        lines.append("Character error rate: %.2f%% (%d substituted, %d inserted, %d deleted, out of %d characters)." % (
+            100.0 * self.char_errors() / max(self.charCount, 1), self.substitutions, self.insertions, self.deletions, self.charCount))
+        if len(self.wrong) > 0:
+            lines.append("Most often wrong mappings:")
+            for ((word, char), wrong) in self.wrong.most_common(count):
+                lines.append("    %-20s %-4s %d of %d wrong (%.1f%%)" % (word, char, wrong, self.shown[(word, char)], 100.0 * wrong / self.shown[(word, char)]))
+            lines.append("Most common confusions:")
+            for (confusions, (word, char), typedKey) in self.confusions.confusions()[:count]:
+                if typedKey == ConfusionMatrix.OTHER:
+                    typedText = "typed as something else"
+                else:
+                    typedText = "missed" if typedKey == ConfusionMatrix.MISSED else "typed as %r" % typedKey
+                lines.append("    %-20s %-4s %s, %d times" % (word, char, typedText, confusions))
+        return lines
+
+    def write_csv(self, filename):
+        '''Save the results of every mapping that was shown, with the most often wrong mappings first.'''
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["phrase", "char", "rounds", "errors", "accuracy %"])
+            for (key, shown) in sorted(self.shown.items(), key=lambda item: (-self.wrong[item[0]], item[0])):
+                writer.writerow([key[0], key[1], shown, self.wrong[key], "%.1f" % (100.0 * (shown - self.wrong[key]) / shown)])
+
+
+# Read the typed text of each round from a transcript: one line per round, without its line ending. "-" reads from stdin.
+def read_transcript(filename):
+    if filename == "-":
+        f = open(sys.stdin.fileno(), encoding='utf-8', errors='replace', buffering=READ_BUFFER_SIZE, closefd=False)
+    else:
+        f = open(os.path.expanduser(filename), encoding='utf-8', errors='replace', buffering=READ_BUFFER_SIZE)
+    with f:
+        for line in f:
+            yield line[:-1] if line.endswith("\n") else line
+
+# Score each line of the transcript against the session's rounds, until either runs out or "rounds" rounds were scored (if rounds > 0).
+# Returns how many lines of the transcript were left over after a drill file ended.
+def score_transcript(session, scorer, lines, rounds=0):
+    for typed in lines:
+        if rounds > 0 and scorer.rounds >= rounds:
+            return 0
+        try:
+            prompt = session.next_prompt()
+        except EOFError:
+            return 1 + sum(1 for line in lines)     # The drill file has ended
+        scorer.score(prompt, typed)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage='%(prog)s [options] transcript [combo_length]',
+                                     description='Score the text typed by a speech recognizer (one line per round) against the rounds that "practice_mappings.py" shows with the same options.')
+    parser.add_argument('transcript', help='Text file with the typed text of each round on its own line, or "-" to read stdin.')
+    parser.add_argument('combo_length', type=int, nargs='?', default=3, help='How many characters were said in each round. Default is 3.')
+    add_prompt_options(parser)
+    parser.add_argument('--drill', metavar='DRILL_FILE', help='Score against the rounds of a drill file (from "--export_drill") instead of rebuilding them from the seed.')
+    parser.add_argument('--rounds', type=int, default=0, help='Only score this many rounds. Default is 0, to score the whole transcript.')
+    parser.add_argument('--count', type=int, default=10, help='How many of the most often wrong mappings & confusions to show. Default is 10.')
+    parser.add_argument('--csv', metavar='CSV_FILE', help='Save the results of every mapping to a CSV file.')
+    args = parser.parse_args()
+
+    if args.random_seed is None and not (args.drill or args.alphabetical):
+        parser.error("The rounds can only be rebuilt from the same '--random_seed' (or '--drill' file) as the recorded session")
+    if args.adaptive:
+        # The rounds of adaptive sessions depend on the person's latencies, that aren't in a transcript.
+        parser.error("The rounds of '--adaptive' sessions can't be rebuilt without the latencies of the session")
+    customWeights = parse_custom_weights(parser, args)
+
+    # Build the same letterMap as "practice_mappings.py", since the rounds are picked by their position in it.
+    mappingSources = mapping_sources(args.dragonfly)
+    separator = ""
+    if args.vocabulary:
+        vocabulary = load_vocabulary(args.vocabulary, use_cache=not args.no_cache)
+        letterMap = vocabulary.with_prefix(args.vocabulary_prefix) if args.vocabulary_prefix else vocabulary
+        letterWeights = build_vocabulary_weights(letterMap, customWeights)
+        separator = " "
+    else:
+        loadedMaps = load_mappings(mappingSources, use_cache=not args.no_cache)
+        (letterMap, letterWeights) = build_letter_list(loadedMaps, args, customWeights)
+    if len(letterMap) == 0:
+        print("Error: No keys to score")
+        sys.exit(1)
+    check_total_weight(parser, letterWeights)
+    confusabilityCache = None
+    if args.confusable and not args.no_cache:
+        cacheFolder = os.path.dirname(os.path.abspath(os.path.expanduser(args.vocabulary[0]))) if args.vocabulary else os.path.dirname(cache_filename_for(mappingSources))
+        confusabilityCache = os.path.join(cacheFolder, CONFUSABILITY_CACHE_BASENAME)
+    # A generator with the same seed gives the same sequence as the seeded global generator of "practice_mappings.py".
+    session = PracticeSession(letterMap, letterWeights, args, args.combo_length, rng=random.Random(args.random_seed), separator=separator, confusabilityCache=confusabilityCache)
+    if args.drill:
+        session.use_drill(load_drill(args.drill))
+
+    scorer = TranscriptScorer()
+    timeStart = time.monotonic_ns()
+    try:
+        leftover = score_transcript(session, scorer, read_transcript(args.transcript), args.rounds)
+    except KeyboardInterrupt:
+        print()
+        leftover = 0
+    seconds = (time.monotonic_ns() - timeStart) / 1e9
+
+    for line in scorer.summary_lines(args.count):
+        print(line)
+    if leftover > 0:
+        print("Warning: The drill file ended before the transcript, %d lines weren't scored." % leftover)
+    print("Throughput: %d rounds (%d characters) in %.3f s = %.0f rounds/s, %.0f characters/s." % (
+        scorer.rounds, scorer.charCount, seconds, scorer.rounds / max(seconds, 1e-9), scorer.charCount / max(seconds, 1e-9)))
+    if args.csv:
+        scorer.write_csv(args.csv)
+        print("Saved the results of each mapping to", args.csv)
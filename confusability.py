@@ -0,0 +1,236 @@
+# coding: utf-8
+# Phonetic confusability of the spoken forms, to find pairs of words that a speech recognizer is likely to mix up
+# (such as "itchy" & "teach", or "queen" & "clean") before they show up in real use, and to drill them together.
+#
+# Each phrase gets a rough phonetic spelling, then the similarity of 2 phrases is based on the edit distance of their
+# phonetic spellings and of their normal spellings. Comparing every pair exactly would be too slow for thousands of words,
+# so likely candidates are found first, from the cosine similarity of the phonetic bigram profiles (one matrix product with NumPy,
+# or an inverted index of bigrams without it), then only those candidates get the exact score. The nearest neighbours of every
+# phrase are kept, and cached on disk. When phrases are added or removed, only the affected phrases are computed again.
+#
+# eg: to list the most confusable pairs of a vocabulary file:
+#   python confusability.py ~/.talon/user/vocabulary.talon-list
+
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+import collections
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from mappings import read_cache, write_cache
+
+# Name of the cache file of the neighbours, stored in the same folder as the mapping or vocabulary snapshot.
+CONFUSABILITY_CACHE_BASENAME = ".practice_confusability.cache"
+# Bump this whenever the scoring below changes, so old caches get rebuilt.
+CONFUSABILITY_VERSION = 1
+
+NEIGHBOURS = 8              # How many of the most confusable phrases are kept for each phrase
+CANDIDATES = 16             # How many candidates (by bigram similarity) get the exact score, for each phrase
+MINIMUM_SIMILARITY = 0.25   # Less similar phrases aren't considered confusable at all
+PHONETIC_WEIGHT = 0.7       # How much the phonetic spelling counts, compared to the normal spelling
+BLOCK_ROWS = 512            # Rows of the similarity matrix computed at once with NumPy, to bound the memory
+
+# Spellings that sound the same, applied in order. Uppercase letters stand for sounds that are written with 2 letters.
+SOUND_PATTERNS = [
+    ("tch", "C"), ("ch", "C"), ("sh", "S"), ("th", "T"), ("ph", "f"), ("ck", "k"), ("qu", "kw"), ("wh", "w"),
+    ("wr", "r"), ("kn", "n"), ("gh", ""), ("dg", "j"), ("x", "ks"),
+    ("ee", "i"), ("ea", "i"), ("ie", "i"), ("ey", "i"), ("oo", "u"), ("ou", "au"), ("ow", "au"), ("ai", "ei"), ("ay", "ei"),
+    ("ce", "se"), ("ci", "si"), ("cy", "si"), ("c", "k"), ("q", "k"), ("z", "s"), ("y", "i"),
+]
+VOWELS = "aeiou"
+
+
+# Return a rough phonetic spelling of a phrase, eg: "queen" -> "kwin", "clean" -> "klin", "itchy" -> "iCi", "teach" -> "tiC".
+def phonetic_code(phrase):
+    words = []
+    for word in phrase.lower().split():
+        word = "".join([char for char in word if char.isalpha()])
+        if len(word) > 3 and word.endswith("e") and word[-2] not in VOWELS:
+            word = word[:-1]    # Silent final "e"
+        for (spelling, sound) in SOUND_PATTERNS:
+            word = word.replace(spelling, sound)
+        words.append(word)
+    code = "".join(words)
+    # Double letters sound the same as single ones.
+    return "".join([char for (i, char) in enumerate(code) if i == 0 or char != code[i-1]])
+
+# Levenshtein edit distance between 2 strings, keeping only 2 rows of the table.
+def edit_distance(a, b):
+    if len(a) < len(b):
+        (a, b) = (b, a)
+    if a == b:
+        return 0
+    previous = list(range(len(b) + 1))
+    for (i, charA) in enumerate(a):
+        current = [i + 1]
+        for (j, charB) in enumerate(b):
+            # Same as min() of the 3 edits, but this is the inner loop of the whole index, and comparisons are faster than a call.
+            substitute = previous[j] + (charA != charB)
+            insert = current[j] + 1
+            delete = previous[j+1] + 1
+            if insert < substitute:
+                substitute = insert
+            current.append(delete if delete < substitute else substitute)
+        previous = current
+    return previous[-1]
+
+# Similarity between 0 (nothing alike) and 1 (sounds & looks the same), from the phrases and their phonetic codes.
+def similarity(phraseA, phraseB, codeA, codeB):
+    phonetic = 1.0 - edit_distance(codeA, codeB) / float(max(len(codeA), len(codeB), 1))
+    spelling = 1.0 - edit_distance(phraseA, phraseB) / float(max(len(phraseA), len(phraseB), 1))
+    return PHONETIC_WEIGHT * phonetic + (1.0 - PHONETIC_WEIGHT) * spelling
+
+# The bigrams of a phonetic code, including its start & end, eg: "kwin" -> ["^k", "kw", "wi", "in", "n$"].
+def bigrams(code):
+    padded = "^" + code + "$"
+    return [padded[i:i+2] for i in range(len(padded) - 1)]
+
+
+# Return {row: list of candidate rows} for the given rows: the phrases with the most similar bigram profiles.
+def find_candidates(codes, rows, count=CANDIDATES):
+    profiles = [collections.Counter(bigrams(code)) for code in codes]
+    candidates = {}
+    if numpy is not None and len(codes) > 0:
+        # Cosine similarity of the bigram count vectors, a block of rows at a time.
+        bigramIds = {}
+        for profile in profiles:
+            for bigram in profile:
+                bigramIds.setdefault(bigram, len(bigramIds))
+        matrix = numpy.zeros((len(codes), len(bigramIds)), dtype=numpy.float32)
+        for (i, profile) in enumerate(profiles):
+            for (bigram, n) in profile.items():
+                matrix[i, bigramIds[bigram]] = n
+        matrix /= numpy.maximum(numpy.linalg.norm(matrix, axis=1), 1e-9)[:, None]
+        keep = min(count, len(codes) - 1)
+        if keep <= 0:
+            return dict([(row, []) for row in rows])
+        rows = list(rows)
+        for start in range(0, len(rows), BLOCK_ROWS):
+            blockRows = numpy.asarray(rows[start:start + BLOCK_ROWS])
+            scores = matrix[blockRows] @ matrix.T
+            scores[numpy.arange(len(blockRows)), blockRows] = -1.0     # Not a candidate of itself
+            best = numpy.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+            for (row, candidateRows) in zip(blockRows.tolist(), best.tolist()):
+                candidates[row] = candidateRows
+        return candidates
+
+    # Without NumPy: count the shared bigrams through an inverted index, then rank the phrases sharing the most bigrams by their Dice coefficient.
+    bigramSets = [set(profile) for profile in profiles]
+    postings = collections.defaultdict(list)
+    for (i, bigramSet) in enumerate(bigramSets):
+        for bigram in bigramSet:
+            postings[bigram].append(i)
+    for row in rows:
+        shared = collections.Counter()
+        for bigram in bigramSets[row]:
+            shared.update(postings[bigram])
+        del shared[row]
+        scored = [(2.0 * n / (len(bigramSets[row]) + len(bigramSets[other])), other) for (other, n) in shared.most_common(4 * count)]
+        scored.sort(reverse=True)
+        candidates[row] = [other for (score, other) in scored[:count]]
+    return candidates
+
+
+class ConfusabilityIndex:
+    '''
+    The most confusable phrases of each phrase.
+    neighbours: dictionary of {phrase: list of (other phrase, similarity)}, most similar first.
+    '''
+    def __init__(self, neighbours):
+        self.neighbours = neighbours
+
+    def neighbours_of(self, phrase):
+        return self.neighbours.get(phrase, [])
+
+    def most_confusable(self, count=20):
+        '''Return a list of (similarity, phrase, other phrase) of the most confusable pairs, each pair only once.'''
+        pairs = set()
+        for (phrase, neighbours) in self.neighbours.items():
+            for (other, score) in neighbours:
+                pairs.add((score, min(phrase, other), max(phrase, other)))
+        return sorted(pairs, reverse=True)[:count]
+
+
+# Compute the neighbours of the given rows of phrases. Returns {phrase: list of (other phrase, similarity)}.
+def compute_neighbours(phrases, codes, rows):
+    neighbours = {}
+    for (row, candidateRows) in find_candidates(codes, rows).items():
+        scored = []
+        for other in candidateRows:
+            score = similarity(phrases[row], phrases[other], codes[row], codes[other])
+            if score >= MINIMUM_SIMILARITY:
+                scored.append((phrases[other], round(score, 4)))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        neighbours[phrases[row]] = scored[:NEIGHBOURS]
+    return neighbours
+
+# Add a neighbour to a list of neighbours, keeping the most similar ones.
+def merge_neighbour(neighbours, phrase, score):
+    if any([other == phrase for (other, s) in neighbours]):
+        return
+    neighbours.append((phrase, score))
+    neighbours.sort(key=lambda item: item[1], reverse=True)
+    del neighbours[NEIGHBOURS:]
+
+
+# Build the ConfusabilityIndex of the given phrases. If cache_filename is given, the neighbours from last time are reused,
+# and only the phrases that are new, or that lost a neighbour because it was removed, are computed again.
+def build_confusability_index(phrases, cache_filename=None):
+    phrases = sorted(set([phrase.lower() for phrase in phrases]))
+    phraseSet = set(phrases)
+    neighbours = {}
+    dirty = phrases
+    if cache_filename is not None:
+        cached = read_cache(cache_filename).get("confusability")
+        if cached is not None and cached[0] == CONFUSABILITY_VERSION:
+            cachedNeighbours = cached[1]
+            dirty = []
+            for phrase in phrases:
+                if phrase not in cachedNeighbours:
+                    dirty.append(phrase)
+                    continue
+                kept = [(other, score) for (other, score) in cachedNeighbours[phrase] if other in phraseSet]
+                if len(kept) < len(cachedNeighbours[phrase]):
+                    dirty.append(phrase)
+                else:
+                    neighbours[phrase] = kept
+            if len(dirty) == 0 and len(cachedNeighbours) == len(phrases):
+                return ConfusabilityIndex(neighbours)
+
+    if len(dirty) > 0:
+        codes = [phonetic_code(phrase) for phrase in phrases]
+        rowOf = dict([(phrase, i) for (i, phrase) in enumerate(phrases)])
+        computed = compute_neighbours(phrases, codes, [rowOf[phrase] for phrase in dirty])
+        neighbours.update(computed)
+        # Similarity is symmetric, so new phrases can also become neighbours of the phrases that weren't computed again.
+        for (phrase, phraseNeighbours) in computed.items():
+            for (other, score) in phraseNeighbours:
+                if other not in computed:
+                    merge_neighbour(neighbours[other], phrase, score)
+    if cache_filename is not None:
+        write_cache(cache_filename, {"confusability": (CONFUSABILITY_VERSION, neighbours)})
+    return ConfusabilityIndex(neighbours)
+
+
+if __name__ == "__main__":
+    from vocabulary import load_vocabulary_file
+
+    parser = argparse.ArgumentParser(usage='%(prog)s [options] vocabulary_file ...', description='List the spoken forms that a speech recognizer is most likely to confuse.')
+    parser.add_argument('files', nargs='+', help='Vocabulary files (".talon-list", Talon ".csv", Dragonfly ".py", or one word per line).')
+    parser.add_argument('-n', '--count', type=int, default=30, help='How many pairs to show. Default is 30.')
+    args = parser.parse_args()
+
+    phrases = []
+    for filename in args.files:
+        phrases.extend([spoken for (spoken, written) in load_vocabulary_file(os.path.expanduser(filename))])
+    index = build_confusability_index(phrases)
+    for (score, phrase, other) in index.most_confusable(args.count):
+        print("%.2f  %-24s %s" % (score, phrase, other))
+    if numpy is None:
+        print("(NumPy isn't installed, so finding the candidates was done in plain Python.)", file=sys.stderr)
@@ -0,0 +1,119 @@
+# coding: utf-8
+# Adaptive drill scheduler: keeps a running error rate & latency for each (phrase, character) pair,
+# and picks the next keys with a probability biased towards the slowest and most error-prone mappings,
+# so that practice time isn't wasted on keys that are already mastered.
+
+import random
+
+
+class SumTree:
+    '''
+    A binary tree of partial sums over n non-negative values, stored in a flat list.
+    Changing a value and picking a random index proportional to its value both take O(log n) time.
+    '''
+    def __init__(self, values=()):
+        values = list(values)
+        self.size = 1
+        while self.size < max(1, len(values)):
+            self.size *= 2
+        self.tree = [0.0] * (2 * self.size)
+        self.count = len(values)
+        for (i, value) in enumerate(values):
+            self.tree[self.size + i] = float(value)
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+
+    def __len__(self):
+        return self.count
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, index):
+        return self.tree[self.size + index]
+
+    def set(self, index, value):
+        '''Change the value at index, and recompute the sums above it.'''
+        node = self.size + index
+        self.tree[node] = float(value)
+        node //= 2
+        while node >= 1:
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+            node //= 2
+
+    def find(self, target):
+        '''Return the index whose range of cumulative sums contains target, for 0 <= target < total().'''
+        node = 1
+        while node < self.size:
+            left = 2 * node
+            if target < self.tree[left] or self.tree[left + 1] <= 0.0:
+                node = left
+            else:
+                target -= self.tree[left]
+                node = left + 1
+        return min(node - self.size, self.count - 1)
+
+
+class KeyStats:
+    '''Running (exponentially weighted) error rate & latency of one mapping.'''
+    def __init__(self, errorRate, latency):
+        self.errorRate = errorRate
+        self.latency = latency
+        self.rounds = 0
+
+
+class AdaptiveScheduler:
+    '''
+    Pick indices into the letterMap list, with a probability of:
+        baseWeight * (minimumError + errorRate) * latency
+    so that keys that are often wrong or slow get shown more often, while mastered keys still show up occasionally.
+    keys: list of (phrase, character) pairs. Statistics are stored per pair, so they survive the list being reloaded.
+    baseWeights: the normal weight of each key, such as from "--weight".
+    alpha: how much each new round changes the running averages. The closer this is to 1.0, the faster it adapts.
+    '''
+    def __init__(self, keys, baseWeights, rng=random, alpha=0.3, initialErrorRate=0.5, initialLatency=1.0, minimumError=0.05):
+        self.rng = rng
+        self.alpha = alpha
+        self.initialErrorRate = initialErrorRate
+        self.initialLatency = initialLatency
+        self.minimumError = minimumError
+        self.stats = {}     # Dictionary of {(phrase, character): KeyStats}
+        self.set_keys(keys, baseWeights)
+
+    def set_keys(self, keys, baseWeights):
+        '''Use a new list of keys, such as after the mapping files were changed. Existing statistics are kept.'''
+        self.keys = list(keys)
+        self.baseWeights = [float(weight) for weight in baseWeights]
+        if any([weight < 0.0 for weight in self.baseWeights]):
+            raise ValueError("Weights can't be negative")
+        for key in self.keys:
+            if key not in self.stats:
+                self.stats[key] = KeyStats(self.initialErrorRate, self.initialLatency)
+        self.tree = SumTree([self.priority(i) for i in range(len(self.keys))])
+
+    def priority(self, index):
+        stats = self.stats[self.keys[index]]
+        return self.baseWeights[index] * (self.minimumError + stats.errorRate) * stats.latency
+
+    def draw(self):
+        '''Return a random index, biased towards the hardest keys, in O(log n) time.'''
+        total = self.tree.total()
+        if total <= 0.0:
+            raise ValueError("Need at least 1 key with a positive weight")
+        return self.tree.find(self.rng.random() * total)
+
+    def update(self, index, correct, seconds):
+        '''Record the result of one key being practiced, in O(log n) time.'''
+        stats = self.stats[self.keys[index]]
+        error = 0.0 if correct else 1.0
+        stats.errorRate = ((1.0 - self.alpha) * stats.errorRate) + (self.alpha * error)
+        if seconds is not None:
+            stats.latency = ((1.0 - self.alpha) * stats.latency) + (self.alpha * seconds)
+        stats.rounds += 1
+        self.tree.set(index, self.priority(index))
+
+    def hardest(self, count=5):
+        '''Return the (key, KeyStats) of the hardest keys that have been practiced so far.'''
+        practiced = [(key, stats) for (key, stats) in self.stats.items() if stats.rounds > 0]
+        practiced.sort(key=lambda item: (self.minimumError + item[1].errorRate) * item[1].latency, reverse=True)
+        return practiced[:count]
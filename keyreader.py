@@ -0,0 +1,511 @@
+# coding: utf-8
+# Pluggable keystroke sources, so the practice game and the typing rate tool can run without a real terminal.
+# Recorded or synthetic keystroke streams can be replayed with exact timing, either directly inside the
+# game loop (headless mode), or through a pseudo-terminal into an unmodified program.
+#
+# A keystroke stream file has one JSON list per line: [seconds, text]
+# where seconds is how long after the program started waiting for a key that the text arrived.
+#
+# KeyReader is the real terminal input, shared by both programs: it reads raw bytes from the terminal's file descriptor
+# as soon as epoll says they're there, stamps each read straight after the read() syscall returns, then decodes the UTF-8.
+#
+# eg: to replay a recorded stream into the practice game through a pseudo-terminal:
+#   python keyreader.py keys.jsonl -- python practice_mappings.py --random_seed 12345
+# or to measure the input path's own latency, from a byte being written into a pseudo-terminal until it's stamped:
+#   python keyreader.py --benchmark 2000
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import random
+import fcntl
+import atexit
+import codecs
+import select
+import signal
+import termios
+import argparse
+import threading
+import collections
+
+import profiler
+
+ESC = "\x1b"
+
+# How long to wait after a lone ESC for the rest of an escape sequence, before taking it as the Escape key itself, in seconds.
+# A terminal sends each escape sequence in one write, so its bytes only get split across reads when they arrive very close together.
+ESCAPE_TIMEOUT = 0.05
+
+# When waiting for a scripted keystroke, sleep until this close to the deadline, then spin, to get sub-millisecond accuracy.
+SPIN_NS = 1000000
+
+
+# Load a keystroke stream file, returning a list of (seconds, text).
+def load_key_stream(filename):
+    stream = []
+    with open(os.path.expanduser(filename), 'r') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            (seconds, text) = json.loads(line)
+            stream.append((float(seconds), text))
+    return stream
+
+# Save a list of (seconds, text) keystrokes as a stream file.
+def save_key_stream(filename, stream):
+    with open(os.path.expanduser(filename), 'w') as f:
+        for (seconds, text) in stream:
+            f.write(json.dumps([round(seconds, 9), text]) + "\n")
+
+# Wait until the monotonic clock reaches the deadline (in nanoseconds), as accurately as possible.
+def wait_until_ns(deadline):
+    remaining = deadline - time.monotonic_ns()
+    if remaining > SPIN_NS:
+        time.sleep((remaining - SPIN_NS) / 1e9)
+    while time.monotonic_ns() < deadline:
+        pass
+
+# Describe a list of timing errors in nanoseconds, such as "mean 0.012 ms, max 0.080 ms".
+def timing_error_summary(errors_ns):
+    if len(errors_ns) == 0:
+        return "no keystrokes"
+    mean = sum(errors_ns) / float(len(errors_ns))
+    return "mean %.3f ms, max %.3f ms over %d keystrokes" % (mean / 1e6, max(errors_ns) / 1e6, len(errors_ns))
+
+
+# Split the text of one read into separate keys. Most keys are a single character, but escape sequences
+# such as arrow keys ("\x1b[A"), function keys ("\x1bOP", "\x1b[15~") and Alt+key ("\x1bx") are kept together as one key.
+# Returns (list of keys, leftover start of an escape sequence that was cut off at the end of the text).
+# A lone ESC at the end is also left over, since it can't be told apart from the start of a sequence until more bytes come or don't.
+def split_keys(text):
+    keys = []
+    i = 0
+    n = len(text)
+    while i < n:
+        if text[i] != ESC:
+            keys.append(text[i])
+            i += 1
+        elif i + 1 >= n:
+            return (keys, text[i:])     # Either the Escape key itself, or the start of a sequence whose next read is on its way
+        elif text[i+1] == "[":
+            # Control Sequence: ESC [ then parameter bytes, ending with a byte in the range "@" to "~".
+            j = i + 2
+            while j < n and not ("@" <= text[j] <= "~"):
+                j += 1
+            if j >= n:
+                return (keys, text[i:])
+            keys.append(text[i:j+1])
+            i = j + 1
+        elif text[i+1] == "O":
+            # Single Shift 3: ESC O then one more character, used for F1-F4 and some arrow keys.
+            if i + 2 >= n:
+                return (keys, text[i:])
+            keys.append(text[i:i+3])
+            i += 3
+        else:
+            keys.append(text[i:i+2])    # Alt+key
+            i += 2
+    return (keys, "")
+
+
+class KeyReader:
+    '''
+    Read keypresses from the terminal one read at a time, without waiting for a newline.
+    Originally based on "https://github.com/akkana/scripts/blob/master/keyreader.py", but reads the raw bytes of the file descriptor
+    instead of going through Python's buffered text stdin, so a key can't get stuck in a buffer that select() doesn't know about.
+    echo: should characters be echoed?
+    block: should we block for each read, or return immediately? (If not blocking, None is returned if nothing is available.)
+    fd: the terminal's file descriptor. Default is stdin.
+    backend: "epoll" (Linux), or "select". Default is epoll when available.
+    The terminal settings are restored by close(), which is also called at exit and on SIGTERM, so a crash can't leave the terminal broken.
+    '''
+    def __init__(self, echo=False, block=True, fd=None, backend=None):
+        self.fd = sys.stdin.fileno() if fd is None else fd
+        self.block = block
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        if backend is None:
+            backend = "epoll" if hasattr(select, "epoll") else "select"
+        self.backend = backend
+        self.poller = None
+        if backend == "epoll":
+            self.poller = select.epoll(1)
+            self.poller.register(self.fd, select.EPOLLIN)
+
+        self.oldterm = termios.tcgetattr(self.fd)
+        self.oldflags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        self.closed = False
+
+        newattr = termios.tcgetattr(self.fd)
+        # tcgetattr returns: [iflag, oflag, cflag, lflag, ispeed, ospeed, cc]
+        newattr[3] = newattr[3] & ~termios.ICANON
+        if not echo:
+            newattr[3] = newattr[3] & ~termios.ECHO
+        # Return each read as soon as there's at least 1 byte, without any inter-byte timer.
+        newattr[6] = newattr[6][:]
+        newattr[6][termios.VMIN] = 1
+        newattr[6][termios.VTIME] = 0
+        # The fd is non-blocking, and waiting is done by epoll or select, so a read never waits for more bytes.
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, self.oldflags | os.O_NONBLOCK)
+        termios.tcsetattr(self.fd, termios.TCSANOW, newattr)
+
+        atexit.register(self.close)
+        if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+            # Turn SIGTERM into a normal exit, so the atexit handler restores the terminal.
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+    def close(self):
+        '''Reset the terminal to how it was before. Safe to call more than once.'''
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            termios.tcsetattr(self.fd, termios.TCSAFLUSH, self.oldterm)
+            fcntl.fcntl(self.fd, fcntl.F_SETFL, self.oldflags)
+        except (OSError, termios.error):
+            pass    # The terminal has already gone away
+        if self.poller is not None:
+            self.poller.close()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def wait_readable(self, timeout=None):
+        '''Wait until the terminal has bytes to read, or the timeout (in seconds, or None to wait forever). Returns False if it timed out.'''
+        if self.poller is not None:
+            return len(self.poller.poll(-1 if timeout is None else timeout)) > 0
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return len(readable) > 0
+
+    def read_stamped(self):
+        '''
+        Do one read, returning (text, monotonic time in nanoseconds straight after the read returned).
+        The text is "" at the end of the input, or None if nothing was available when not blocking.
+        A UTF-8 character that was split across 2 reads is returned with the second read.
+        '''
+        waitStart = time.monotonic_ns() if profiler.active is not None else 0
+        if self.block:
+            self.wait_readable()
+        wakeup = time.monotonic_ns() if profiler.active is not None else 0
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return (None, time.monotonic_ns())
+        except OSError:
+            data = b""      # The terminal was closed
+        arrival = time.monotonic_ns()
+        if profiler.active is not None:
+            # Waiting is the person's time, but from the wakeup to the timestamp is ours, and it's inside the measured latency.
+            if self.block:
+                profiler.add_span("wait for input (%s)" % self.backend, profiler.USER, waitStart, wakeup)
+            profiler.add_span("read", profiler.IO, wakeup, arrival)
+        if not data:
+            return ("", arrival)
+        return (self.decoder.decode(data), arrival)
+
+    def getch(self):
+        '''Read keyboard input, returning a string.
+           Note that one key may result in a string of more than one character,
+           e.g. arrow keys that send escape sequences.
+           There may also be multiple keystrokes queued up since the last read.
+        '''
+        return self.read_stamped()[0]
+
+
+class KeyFramer:
+    '''
+    Wrap a key reader, to return one key at a time even when a speech engine types a whole phrase in one burst.
+    Each key comes with the monotonic time (in nanoseconds) that its read arrived, so keys of the same burst share the same time.
+    An escape sequence that gets split across 2 reads is kept together, with the time of its first part.
+    A lone ESC at the end of a read is only taken as the Escape key if no more bytes arrive within ESCAPE_TIMEOUT.
+    '''
+    def __init__(self, reader):
+        self.reader = reader
+        self.keys = collections.deque()     # Queue of (key, arrival time in nanoseconds)
+        self.partial = ""
+        self.partialTime = 0
+
+    def read_more(self):
+        '''Do one read, adding its keys to the queue. Raises EOFError at the end of the input.'''
+        canWait = hasattr(self.reader, "wait_readable")
+        if self.partial == ESC and canWait and not self.reader.wait_readable(ESCAPE_TIMEOUT):
+            self.flush_escape()
+            return
+        if hasattr(self.reader, "read_stamped"):
+            (text, arrival) = self.reader.read_stamped()      # Stamped by the reader, right at the read() syscall
+        else:
+            text = self.reader.getch()
+            arrival = time.monotonic_ns()
+        if text == "":
+            raise EOFError("The input has ended")
+        self.feed(text, arrival)
+        if not canWait:
+            self.flush_escape()     # Each read of a reader that can't wait for more is taken as whole keys
+
+    def feed(self, text, arrival):
+        '''Add the text of a read that arrived at the given monotonic time (in nanoseconds) to the queue.'''
+        if not text:
+            return      # Nothing was available (non-blocking readers)
+        if self.partial:
+            text = self.partial + text
+            arrival = self.partialTime
+        (keys, self.partial) = split_keys(text)
+        self.partialTime = arrival
+        for key in keys:
+            self.keys.append((key, arrival))
+
+    def escape_timeout(self, timeout):
+        '''
+        Return how long a key source should wait for more keys, given the timeout (in seconds, or None) it would wait otherwise:
+        no longer than ESCAPE_TIMEOUT while a lone ESC is waiting to see if the rest of an escape sequence follows it.
+        '''
+        if self.partial == ESC and (timeout is None or timeout > ESCAPE_TIMEOUT):
+            return ESCAPE_TIMEOUT
+        return timeout
+
+    def flush_escape(self):
+        '''Queue a lone ESC that's waiting as the Escape key itself, since nothing followed it in time. Returns True if there was one.'''
+        if self.partial != ESC:
+            return False
+        self.keys.append((ESC, self.partialTime))
+        self.partial = ""
+        return True
+
+    def next_key(self):
+        '''Return (key, arrival time in nanoseconds) of the next key, waiting for a read if none are queued.'''
+        while len(self.keys) == 0:
+            self.read_more()
+        return self.keys.popleft()
+
+    def take_queued(self):
+        '''Return the list of (key, arrival time) that have already arrived but haven't been taken yet, without waiting.'''
+        queued = list(self.keys)
+        self.keys.clear()
+        return queued
+
+
+class ScriptedKeyReader:
+    '''
+    A drop-in replacement for KeyReader that returns keystrokes from a stream instead of the terminal.
+    Each keystroke is returned the given number of seconds after getch() was called, so the tool's own overhead
+    doesn't change the replayed latencies. The difference between when each key was due and when it was returned
+    is kept in timing_errors_ns, which is the error that the harness adds to the measured timings.
+    echo: should the keystrokes be printed, as the terminal would?
+    Raises EOFError once the stream has run out.
+    '''
+    def __init__(self, stream=(), echo=False):
+        self.stream = list(stream)
+        self.position = 0
+        self.echo = echo
+        self.timing_errors_ns = []
+        self.lock = threading.Lock()    # getch() can run in a worker thread while the next prompt is shown
+
+    def getch(self):
+        with self.lock:
+            if self.position >= len(self.stream):
+                raise EOFError("The keystroke stream has ended")
+            (seconds, text) = self.stream[self.position]
+            self.position += 1
+        timeStart = time.monotonic_ns()
+        due = timeStart + int(seconds * 1e9)
+        wait_until_ns(due)
+        self.timing_errors_ns.append(time.monotonic_ns() - due)
+        profiler.add_span("wait for input (scripted)", profiler.USER, timeStart, time.monotonic_ns())
+        if self.echo:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        return text
+
+
+class SyntheticTypist(ScriptedKeyReader):
+    '''
+    A scripted reader that types whatever prompt it is shown, one character at a time.
+    seconds: delay before each character.
+    error_percent: how often a character gets replaced by a wrong one, to simulate recognition mistakes.
+    seed: the typist has its own random generator, so it doesn't change the sequence of prompts.
+    burst: type each whole prompt at once, as speech engines do.
+    '''
+    def __init__(self, seconds=0.0, error_percent=0.0, seed=None, echo=False, burst=False):
+        ScriptedKeyReader.__init__(self, echo=echo)
+        self.seconds = seconds
+        self.error_percent = error_percent
+        self.burst = burst
+        self.rng = random.Random(seed)
+
+    def show_prompt(self, truth):
+        '''
+        Queue up the keystrokes for the given prompt text. In burst mode, the whole prompt arrives in a single read, like a speech engine.
+        Whatever hasn't been typed yet of the previous prompt (such as after a round ran out of time) is given up.
+        '''
+        typed = ""
+        for char in truth:
+            if self.rng.random() * 100.0 < self.error_percent:
+                char = "~" if char != "~" else "`"
+            typed += char
+        with self.lock:
+            del self.stream[self.position:]
+            if self.burst:
+                self.stream.append((self.seconds * len(typed), typed))
+            else:
+                for char in typed:
+                    self.stream.append((self.seconds, char))
+
+
+class RecordingKeyReader:
+    '''
+    Wrap another key reader, recording each keystroke and how long after getch() was called that it arrived.
+    Call save() at the end to write the stream file, that can later be replayed by ScriptedKeyReader or PtyKeyDriver.
+    The file descriptor of a terminal reader is passed on, so the event loop can still wait on the terminal itself.
+    Reads from there are only done once bytes are waiting, so read_stamped() records the time since the previous read instead.
+    '''
+    def __init__(self, reader, filename):
+        self.reader = reader
+        self.filename = filename
+        self.stream = []
+        self.fd = getattr(reader, "fd", None)
+        if hasattr(reader, "wait_readable"):
+            self.wait_readable = reader.wait_readable
+        self.lastRead = time.monotonic_ns()
+
+    def getch(self):
+        timeStart = time.monotonic_ns()
+        text = self.reader.getch()
+        self.lastRead = time.monotonic_ns()
+        if text:
+            self.stream.append(((self.lastRead - timeStart) / 1e9, text))
+        return text
+
+    def read_stamped(self):
+        if not hasattr(self.reader, "read_stamped"):
+            text = self.getch()
+            return (text, self.lastRead)
+        (text, arrival) = self.reader.read_stamped()
+        if text:
+            self.stream.append(((arrival - self.lastRead) / 1e9, text))
+            self.lastRead = arrival
+        return (text, arrival)
+
+    def save(self):
+        save_key_stream(self.filename, self.stream)
+
+
+class PtyKeyDriver:
+    '''
+    Run a program in a pseudo-terminal, and type a keystroke stream into it with exact timing,
+    so the real terminal input code of the program gets exercised. The program's output is copied to our stdout.
+    Since we can't tell when the program starts waiting for a key, each delay is measured from the previous keystroke.
+    '''
+    def __init__(self, command):
+        self.command = command
+        self.timing_errors_ns = []
+
+    def copy_output(self, fd, until_ns):
+        '''Copy the program's output to stdout until the deadline. Returns False once the program has exited.'''
+        while True:
+            remaining = until_ns - time.monotonic_ns()
+            if remaining <= SPIN_NS:
+                return True
+            readable, _, _ = select.select([fd], [], [], (remaining - SPIN_NS) / 1e9)
+            if readable:
+                try:
+                    data = os.read(fd, 65536)
+                except OSError:
+                    return False
+                if not data:
+                    return False
+                sys.stdout.write(data.decode('utf-8', 'replace'))
+                sys.stdout.flush()
+
+    def play(self, stream, startup=1.0, linger=0.5):
+        '''Run the program, wait "startup" seconds for it to get ready, type the stream into it, then wait "linger" seconds and stop the program.'''
+        import pty
+        pid, fd = pty.fork()
+        if pid == 0:
+            os.execvp(self.command[0], self.command)
+        due = time.monotonic_ns() + int(startup * 1e9)
+        for (seconds, text) in stream:
+            due += int(seconds * 1e9)
+            if not self.copy_output(fd, due):
+                break
+            wait_until_ns(due)
+            os.write(fd, text.encode('utf-8'))
+            self.timing_errors_ns.append(time.monotonic_ns() - due)
+        self.copy_output(fd, time.monotonic_ns() + int(linger * 1e9))
+        try:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+        os.close(fd)
+
+
+# Measure the latency of KeyReader's input path: a thread writes one byte at a time into a pseudo-terminal, noting the time
+# just before each write, and KeyReader stamps it on the other side. Returns the list of latencies in nanoseconds.
+def benchmark_input_latency(count=1000, backend=None, interval=0.001):
+    master, slave = os.openpty()
+    reader = KeyReader(echo=False, block=True, fd=slave, backend=backend)
+    sentTimes = []
+
+    def type_keys():
+        for i in range(count):
+            time.sleep(interval)
+            sentTimes.append(time.monotonic_ns())
+            os.write(master, b"a")
+
+    writer = threading.Thread(target=type_keys, daemon=True)
+    writer.start()
+    latencies = []
+    try:
+        while len(latencies) < count:
+            (text, arrival) = reader.read_stamped()
+            for char in text or "":
+                latencies.append(arrival - sentTimes[len(latencies)])
+    finally:
+        writer.join()
+        reader.close()
+        os.close(master)
+        os.close(slave)
+    return latencies
+
+# Describe a list of latencies in nanoseconds, such as "p50 0.021 ms, p95 0.040 ms, p99 0.090 ms, max 0.300 ms".
+def latency_summary(latencies_ns):
+    values = sorted(latencies_ns)
+    def rank(p):
+        return values[min(max(int(p * len(values) + 0.999999) - 1, 0), len(values) - 1)]
+    return "p50 %.3f ms, p95 %.3f ms, p99 %.3f ms, max %.3f ms over %d keys" % (
+        rank(0.50) / 1e6, rank(0.95) / 1e6, rank(0.99) / 1e6, values[-1] / 1e6, len(values))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage='%(prog)s stream_file -- command [args...]',
+                                     description='Type a recorded keystroke stream into a program through a pseudo-terminal.')
+    parser.add_argument('stream_file', nargs='?', help='Keystroke stream file, with one [seconds, text] JSON list per line.')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='The program to run, such as "python practice_mappings.py".')
+    parser.add_argument('--startup', type=float, default=1.0, help='Seconds to let the program start before the first keystroke. Default is 1.0.')
+    parser.add_argument('--linger', type=float, default=0.5, help='Seconds to keep showing the output after the last keystroke. Default is 0.5.')
+    parser.add_argument('--benchmark', type=int, metavar='KEYS', help='Instead, measure how long the terminal input path takes to stamp this many keys, with each backend.')
+    args = parser.parse_args()
+    if args.benchmark:
+        backends = ["epoll", "select"] if hasattr(select, "epoll") else ["select"]
+        for backend in backends:
+            print("%-7s %s" % (backend + ":", latency_summary(benchmark_input_latency(args.benchmark, backend))))
+        sys.exit(0)
+    if not args.stream_file:
+        parser.error("Please give the keystroke stream file")
+    command = args.command
+    if len(command) > 0 and command[0] == "--":
+        command = command[1:]
+    if len(command) == 0:
+        parser.error("Please give the command to run after '--'")
+
+    driver = PtyKeyDriver(command)
+    driver.play(load_key_stream(args.stream_file), args.startup, args.linger)
+    print()
+    print("Pseudo-terminal timing error:", timing_error_summary(driver.timing_errors_ns), file=sys.stderr)
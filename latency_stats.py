@@ -0,0 +1,135 @@
+# coding: utf-8
+# Streaming latency percentiles (p50, p95, p99) with bounded memory, using the P-squared algorithm of Jain & Chlamtac (1985).
+# Each percentile only keeps 5 markers no matter how many samples it has seen, so sessions of any length use the same memory.
+
+from __future__ import print_function
+
+import math
+
+# The percentiles shown in the status line and the session summary.
+PERCENTILES = (0.50, 0.95, 0.99)
+
+
+class P2Quantile:
+    '''
+    Estimate one quantile (eg: 0.95) of a stream of numbers, in O(1) time & memory per sample.
+    Until 5 samples have been seen, the exact quantile of the samples is returned.
+    '''
+    def __init__(self, quantile):
+        self.p = quantile
+        self.heights = []           # Marker heights q[0..4]
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1.0, 1.0 + 2.0 * quantile, 1.0 + 4.0 * quantile, 3.0 + 2.0 * quantile, 5.0]
+        self.increments = [0.0, quantile / 2.0, quantile, (1.0 + quantile) / 2.0, 1.0]
+        self.count = 0
+
+    def add(self, x):
+        self.count += 1
+        if self.count <= 5:
+            self.heights.append(x)
+            self.heights.sort()
+            return
+
+        q = self.heights
+        n = self.positions
+        # Find the cell k that x falls in, stretching the extreme markers if needed.
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while k < 3 and x >= q[k+1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions, using a parabolic (or else linear) prediction of their height.
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1.0 and n[i+1] - n[i] > 1) or (d <= -1.0 and n[i-1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                height = q[i] + step / float(n[i+1] - n[i-1]) * (
+                    (n[i] - n[i-1] + step) * (q[i+1] - q[i]) / float(n[i+1] - n[i]) +
+                    (n[i+1] - n[i] - step) * (q[i] - q[i-1]) / float(n[i] - n[i-1]))
+                if not (q[i-1] < height < q[i+1]):
+                    height = q[i] + step * (q[i+step] - q[i]) / float(n[i+step] - n[i])
+                q[i] = height
+                n[i] += step
+
+    def value(self):
+        '''Return the current estimate, or NaN if there haven't been any samples yet.'''
+        if self.count == 0:
+            return float('nan')
+        if self.count <= 5:
+            # Exact quantile of the few samples so far, using the nearest rank.
+            index = int(math.ceil(self.p * len(self.heights))) - 1
+            return self.heights[min(max(index, 0), len(self.heights) - 1)]
+        return self.heights[2]
+
+
+class LatencySketch:
+    '''The streaming p50, p95 & p99 of a series of latencies, plus the count, mean and maximum.'''
+    def __init__(self, percentiles=PERCENTILES):
+        self.estimators = [P2Quantile(p) for p in percentiles]
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        for estimator in self.estimators:
+            estimator.add(seconds)
+
+    def percentiles(self):
+        '''Return the list of percentile estimates, in the same order as PERCENTILES.'''
+        return [estimator.value() for estimator in self.estimators]
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else float('nan')
+
+    def text(self):
+        '''Short description, such as "p50 0.31 s, p95 0.52 s, p99 0.90 s".'''
+        return ", ".join(["p%d %.2f s" % (round(estimator.p * 100), estimator.value()) for estimator in self.estimators])
+
+
+class LatencyStats:
+    '''Latency sketches for each (phrase, character) key, and for all keys together.'''
+    def __init__(self):
+        self.overall = LatencySketch()
+        self.perKey = {}
+
+    def add(self, key, seconds):
+        self.overall.add(seconds)
+        if key not in self.perKey:
+            self.perKey[key] = LatencySketch()
+        self.perKey[key].add(seconds)
+
+    def slowest_tails(self, count=10, minimumSamples=5):
+        '''
+        Return a list of (key, sketch) for the keys whose p99 is the highest compared to the overall median,
+        ignoring keys that don't have enough samples to tell yet.
+        '''
+        keys = [(key, sketch) for (key, sketch) in self.perKey.items() if sketch.count >= minimumSamples]
+        keys.sort(key=lambda item: item[1].percentiles()[-1], reverse=True)
+        return keys[:count]
+
+    def summary_lines(self):
+        '''Lines of text for the end-of-session summary.'''
+        if self.overall.count == 0:
+            return []
+        lines = ["Latency of all %d keys: %s." % (self.overall.count, self.overall.text())]
+        median = self.overall.percentiles()[0]
+        tails = self.slowest_tails()
+        if len(tails) > 0:
+            lines.append("Keys with the slowest tail latency (p99 compared to the overall median of %.2f s):" % median)
+            for ((word, char), sketch) in tails:
+                ratio = sketch.percentiles()[-1] / median if median > 0 else float('inf')
+                lines.append("    %-20s %-4s %s  (%.1fx median, %d samples)" % (word, char, sketch.text(), ratio, sketch.count))
+        return lines
@@ -0,0 +1,328 @@
+# coding: utf-8
+# Loading of the key mappings (phrase -> character) from Talon or Dragonfly files,
+# with a compiled binary snapshot of the parsed files, so that startup is near-instant even for large customized key files.
+
+import os
+import sys
+import csv
+import runpy
+import time
+import select
+import marshal
+import threading
+import importlib.util
+
+# Name of the compiled snapshot file, stored beside the mapping source files.
+CACHE_BASENAME = ".practice_mappings.cache"
+# Bump this whenever the parsers below change what they return, so old snapshots get rebuilt.
+CACHE_VERSION = 1
+
+
+# Try to load a given Talon alphabet CSV file, potentially ignoring the header (first row)
+def load_talon_lettermap(CSV_filename):
+    CSV_filename = os.path.expanduser(CSV_filename)   # Allow to hard-code "~" in this source file as the user's home folder
+
+    new_lettermap = {}  # Create an empty Dictionary
+    with open(CSV_filename, newline='') as csvfile:
+        filereader = csv.reader(csvfile, delimiter=',', quotechar='|')
+        for row in filereader:
+            if ("Spoken Form" not in row) and (len(row) >= 2):
+                #print(row[0], "=== ", row[1])
+                # Note that in Shervin's Dragonfly lettermap file, the phrase is the 1st word and the character is the 2nd word,
+                # but in Talon's alphabet csv file, the character is the 1st word and the phrase is the 2nd word.
+                # So we swap them here.
+                new_lettermap[row[1]] = row[0]
+    return new_lettermap
+
+# Pull the dictionary mappings from the following lines in the file until a "}" line is found.
+# Stores the mappings directly into the dict in-place.
+# Assumes pyfile has already been opened and the file pointer is now at a new line containing the dictionary mappings (ie: after a "{").
+def extract_dictionary_from_part_of_python_file(pyfile, d={}):
+    # Scan the line to find the phrase, and the symbol it maps to.
+    # The line is typically something like the string: '  "question mark": "?",   # A random comment.\n'
+    for line in pyfile:
+        # Remove whitespace at the start of the string, then see if it starts with a '"' or "'" single-quote or double-quote character.
+        line = line.lstrip()
+        #print("line: ", line)
+        if len(line) >= 6 and (line[0] == '"' or line[0] == "'"):
+            # Make sure this phrase starts with an actual alphabetical letter, not a symbol such as ','.
+            if line[1].isalpha():
+                # Remove the potential whitespace & potential random stuff & line-ending at the end of the string after the comma.
+                # This should generate something like: '"question mark": "?"'
+                words = line.split(',')[0]
+                if len(words) >= 1:
+                    # Split up the string by ':'
+                    words = words.split(':')     # eg: ['"question mark"', '"?"']
+                    if len(words) >= 2 and len(words[0]) >= 1 and len(words[1]) >= 1:
+                        phrase = words[0].lstrip('"').rstrip('"')          # eg: 'question mark'
+                        symbol = words[1].lstrip(' "').rstrip('"')         # eg: '?'
+                        if len(phrase) >= 1 and len(symbol) >= 1:
+                            # If the symbol starts with a '\' character, remove it, but leave whatever is after it.
+                            if symbol[0] == '\\':
+                                symbol = symbol[1]
+                            # If the symbol starts & ends with a "'" character, remove it, but leave whatever is after it.
+                            if symbol[0] == "'" and len(symbol) > 1 and symbol[-1] == "'":
+                                symbol = symbol[1]
+                            #print("phrase=<" + phrase + ">, \t symbol=<" + symbol + ">.")
+                            # Add the mapping to our dictionary.
+                            d[phrase] = symbol
+        elif line.lstrip()[0] == "}":  # Check for a close brace, but skip close braces that are inside strings, since the user probably has a close brace in their alphabet!
+            break
+
+# Try to load the symbolmap from a given Talon keys.py file
+def load_talon_symbolmap(filename):
+    filename = os.path.expanduser(filename)     # Allow to hard-code "~" in this source file as the user's home folder
+
+    new_symbolmap = {}  # Create an empty Dictionary
+    with open(filename, 'r') as pyfile:
+        # Skip all lines in the Python file until we find the "punctuation_words" declaration line.
+        for line in pyfile:
+            if "punctuation_words = {" in line:
+                break
+        extract_dictionary_from_part_of_python_file(pyfile, new_symbolmap)
+        # Skip all lines in the Python file until we find the "symbol_key_words" declaration line.
+        for line in pyfile:
+            if "symbol_key_words = {" in line:
+                break
+        extract_dictionary_from_part_of_python_file(pyfile, new_symbolmap)
+    #print(new_symbolmap)
+    return new_symbolmap
+
+# Run a Dragonfly mapping file such as "lettermap.py", and return a copy of the given dictionary from it.
+# The file is run directly rather than imported, so that running it again will see any changes to the file.
+def load_dragonfly_dictionary(filename, name):
+    return dict(runpy.run_path(filename)[name])
+
+def load_dragonfly_lettermap(filename):
+    return load_dragonfly_dictionary(filename, "letterMap")
+
+def load_dragonfly_punctuationmap(filename):
+    return load_dragonfly_dictionary(filename, "longPunctuationMap")
+
+# Find the file that "import <module_name>" would load, searching the extra folders after the normal Python path.
+# Returns None if it can't be found.
+def find_module_file(module_name, extra_paths=()):
+    for path in extra_paths:
+        if path not in sys.path:
+            sys.path.append(path)
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+        return None
+    return spec.origin
+#--------------------------------------
+
+
+# A mapping source is one file that is parsed into one dictionary of {phrase: character}:
+#   (name of the dictionary, filename, parser function, whether the file is required).
+# Returns the list of sources for Talon mode.
+def talon_sources(CSV_filename, keys_filename):
+    return [
+        ("letterMap", os.path.expanduser(CSV_filename), load_talon_lettermap, True),
+        ("longPunctuationMap", os.path.expanduser(keys_filename), load_talon_symbolmap, True),
+    ]
+
+# Returns the list of sources for Dragonfly mode, looking for "lettermap.py" and "punctuationmap.py" the same way as importing them would.
+def dragonfly_sources(extra_paths=()):
+    sources = []
+    lettermap_filename = find_module_file("lettermap", extra_paths)
+    if lettermap_filename is None:
+        raise ImportError("Couldn't find the Dragonfly 'lettermap.py' file")
+    sources.append(("letterMap", lettermap_filename, load_dragonfly_lettermap, True))
+    # Also potentially include symbols, not just alphabet letters
+    punctuationmap_filename = find_module_file("punctuationmap", extra_paths)
+    if punctuationmap_filename is not None:
+        sources.append(("longPunctuationMap", punctuationmap_filename, load_dragonfly_punctuationmap, False))
+    return sources
+
+# Return the (modification time in nanoseconds, size) of a file, to tell if it has changed, or None if it can't be accessed.
+def file_signature(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+# The snapshot is stored beside the first (main) source file.
+def cache_filename_for(sources):
+    return os.path.join(os.path.dirname(os.path.abspath(sources[0][1])), CACHE_BASENAME)
+
+# Read a compiled snapshot file, returning a dictionary of {filename: (signature, mapping)}, or an empty dictionary if it is missing or outdated.
+def read_cache(cache_filename):
+    try:
+        with open(cache_filename, 'rb') as f:
+            (version, entries) = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+    if version != CACHE_VERSION or not isinstance(entries, dict):
+        return {}
+    return entries
+
+# Write a compiled snapshot file. Writes to a temporary file first then renames it, so a crash never leaves a half-written snapshot.
+# Failing to write (eg: a read-only folder) isn't an error, it just means the next startup will be slower.
+def write_cache(cache_filename, entries):
+    temp_filename = cache_filename + ".tmp%d" % os.getpid()
+    try:
+        with open(temp_filename, 'wb') as f:
+            marshal.dump((CACHE_VERSION, entries), f)
+        os.replace(temp_filename, cache_filename)
+    except (OSError, ValueError):
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass
+
+# Load all the given mapping sources, returning a dictionary of {dictionary name: {phrase: character}}.
+# Files whose modification time & size match the compiled snapshot are taken from the snapshot instead of being parsed again.
+# If use_cache is False, the snapshot is neither read nor written.
+# If maps_by_file is a dictionary, it is filled with {filename: {phrase: character}} of each source, such as for MappingWatcher.
+def load_mappings(sources, use_cache=True, maps_by_file=None):
+    cache_filename = cache_filename_for(sources)
+    entries = read_cache(cache_filename) if use_cache else {}
+    changed = False
+
+    maps = {}
+    for (name, filename, parser, required) in sources:
+        signature = file_signature(filename)
+        cached = entries.get(filename)
+        if signature is not None and cached is not None and tuple(cached[0]) == signature:
+            mapping = cached[1]
+        else:
+            try:
+                mapping = parser(filename)
+            except Exception:
+                if required:
+                    raise
+                continue
+            if signature is not None:
+                entries[filename] = (signature, mapping)
+                changed = True
+        # Several sources can add to the same dictionary.
+        maps.setdefault(name, {}).update(mapping)
+        if maps_by_file is not None:
+            maps_by_file[filename] = mapping
+
+    if use_cache and changed:
+        write_cache(cache_filename, entries)
+    return maps
+#--------------------------------------
+
+
+# Use Linux's inotify through ctypes if it's available, so the watcher can sleep until a folder changes instead of polling.
+# Returns None on other systems, in which case the watcher just polls the file stats.
+def open_inotify(folders):
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        IN_NONBLOCK = os.O_NONBLOCK
+        IN_CLOEXEC = 0o2000000
+        # Editors often save by writing a new file then renaming it over the old one, so watch the folders rather than the files.
+        IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x2, 0x8, 0x80, 0x100
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        for folder in folders:
+            if libc.inotify_add_watch(fd, os.fsencode(folder), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+                os.close(fd)
+                return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+class MappingWatcher:
+    '''
+    Watch the mapping source files in a background thread, and re-parse just the file that changed.
+    The main loop calls take_update() between rounds, to swap in the new mappings without ever waiting for the parsing.
+    interval: how many seconds between checks when inotify isn't available.
+    '''
+    def __init__(self, sources, maps_by_file=None, interval=1.0):
+        self.sources = list(sources)
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = None         # New dictionary of {dictionary name: {phrase: character}} waiting to be taken
+        self.messages = []          # Text of reloads or errors, to be shown by the main loop
+        self.signatures = {}
+        self.parsed = {}
+        for (name, filename, parser, required) in self.sources:
+            self.signatures[filename] = file_signature(filename)
+            if maps_by_file is not None and filename in maps_by_file:
+                self.parsed[filename] = maps_by_file[filename]
+            else:
+                try:
+                    self.parsed[filename] = parser(filename)
+                except Exception:
+                    self.parsed[filename] = {}
+        folders = sorted(set([os.path.dirname(os.path.abspath(filename)) for (name, filename, parser, required) in self.sources]))
+        self.inotify_fd = open_inotify(folders)
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name="MappingWatcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping = True
+        self.thread.join()
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+    def wait_for_change(self):
+        '''Sleep until a watched folder changes (with inotify) or for the polling interval.'''
+        if self.inotify_fd is None:
+            time.sleep(self.interval)
+            return
+        readable, _, _ = select.select([self.inotify_fd], [], [], self.interval)
+        if readable:
+            # We only need to know that something changed, the file stats below tell us which file it was.
+            try:
+                while os.read(self.inotify_fd, 4096):
+                    pass
+            except (BlockingIOError, OSError):
+                pass
+
+    def run(self):
+        while not self.stopping:
+            self.wait_for_change()
+            self.check()
+
+    def check(self):
+        '''Re-parse any source file whose modification time or size has changed. Returns True if the mappings changed.'''
+        changed = []
+        for (name, filename, parser, required) in self.sources:
+            signature = file_signature(filename)
+            if signature == self.signatures[filename] or signature is None:
+                continue    # Unchanged, or in the middle of being replaced by an editor
+            try:
+                mapping = parser(filename)
+            except Exception as e:
+                # Probably a half-saved file, so keep the old mapping and try again when it changes next.
+                self.signatures[filename] = signature
+                with self.lock:
+                    self.messages.append("Warning: Couldn't reload '%s': %s" % (filename, e))
+                continue
+            self.signatures[filename] = signature
+            self.parsed[filename] = mapping
+            changed.append(filename)
+
+        if not changed:
+            return False
+        maps = {}
+        for (name, filename, parser, required) in self.sources:
+            maps.setdefault(name, {}).update(self.parsed[filename])
+        with self.lock:
+            self.pending = maps
+            for filename in changed:
+                self.messages.append("Reloaded the mappings from '%s'" % filename)
+        return True
+
+    def take_update(self):
+        '''Return (new mappings or None if unchanged, list of messages to show). Never blocks for long.'''
+        with self.lock:
+            maps = self.pending
+            messages = self.messages
+            self.pending = None
+            self.messages = []
+        return (maps, messages)
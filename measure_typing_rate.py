@@ -10,136 +10,87 @@ from __future__ import print_function
 import sys
 import random
 import time
-import operator
-
-
-#---------------------------------------
-# Keyboard input code, taken from "https://github.com/akkana/scripts/blob/master/keyreader.py" on Jan 1st 2019.
-import sys
-import os
-import termios, fcntl
-import select
-
-class KeyReader :
-    '''
-    Read keypresses one at a time, without waiting for a newline.
-    echo: should characters be echoed?
-    block: should we block for each character, or return immediately?
-           (If !block, we'll return None if nothing is available to read.)
-    '''
-    def __init__(self, echo=False, block=True):
-        '''Put the terminal into cbreak and noecho mode.'''
-        self.fd = sys.stdin.fileno()
-
-        self.block = block
-
-        self.oldterm = termios.tcgetattr(self.fd)
-        self.oldflags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
-
-        # Sad hack: when the destructor __del__ is called,
-        # the fcntl module may already be unloaded, so we can no longer
-        # call fcntl.fcntl() to set the terminal back to normal.
-        # So just in case, store a reference to the fcntl module,
-        # and also to termios (though I haven't yet seen a case
-        # where termios was gone -- for some reason it's just fnctl).
-        # The idea of keeping references to the modules comes from
-        # http://bugs.python.org/issue5099
-        # though I don't know if it'll solve the problem completely.
-        self.fcntl = fcntl
-        self.termios = termios
-
-        newattr = termios.tcgetattr(self.fd)
-        # tcgetattr returns: [iflag, oflag, cflag, lflag, ispeed, ospeed, cc]
-        # where cc is a list of the tty special characters (length-1 strings)
-        # except for cc[termios.VMIN] and cc[termios.VTIME] which are ints.
-        self.cc_save = newattr[6]
-        newattr[3] = newattr[3] & ~termios.ICANON
-        if not echo:
-            newattr[3] = newattr[3] & ~termios.ECHO
-
-        if block and False:
-            # VMIN and VTIME are supposed to let us do blocking reads:
-            # VMIN is the minimum number of characters before it will return,
-            # VTIME is how long it will wait if for characters < VMIN.
-            # This is documented in man termios.
-            # However, it doesn't work in python!
-            # In Python, read() never returns in non-canonical mode;
-            # even typing a newline doesn't help.
-            cc = self.cc_save[:]   # Make a copy so we can restore VMIN, VTIME
-            cc[termios.VMIN] = 1
-            cc[termios.VTIME] = 0
-            newattr[6] = cc
-        else:
-            # Put stdin into non-blocking mode.
-            # We need to do this even if we're blocking, see above.
-            fcntl.fcntl(self.fd, fcntl.F_SETFL, self.oldflags | os.O_NONBLOCK)
-
-        termios.tcsetattr(self.fd, termios.TCSANOW, newattr)
-
-    def __del__(self):
-        '''Reset the terminal before exiting the program.'''
-        self.termios.tcsetattr(self.fd, self.termios.TCSAFLUSH, self.oldterm)
-        self.fcntl.fcntl(self.fd, self.fcntl.F_SETFL, self.oldflags)
-
-    def getch(self):
-        '''Read keyboard input, returning a string.
-           Note that one key may result in a string of more than one character,
-           e.g. arrow keys that send escape sequences.
-           There may also be multiple keystrokes queued up since the last read.
-           This function, sadly, cannot read special characters like VolumeUp.
-           They don't show up in ordinary CLI reads -- you have to be in
-           a window system like X to get those special keycodes.
-        '''
-        # Since we can't use the normal cbreak read from python,
-        # use select to see if there's anything there:
-        if self.block:
-            inp, outp, err = select.select([sys.stdin], [], [])
-        try:
-            return sys.stdin.read()
-        except (IOError, TypeError) as e:
-            return None
-#--------------------------------------
+import argparse
 
+from keyreader import KeyReader, KeyFramer, ScriptedKeyReader, SyntheticTypist, RecordingKeyReader, load_key_stream, timing_error_summary
+from terminal_renderer import TerminalRenderer
+from throughput import ThroughputMeter, DEFAULT_WINDOWS
 
+parser = argparse.ArgumentParser(usage='%(prog)s [options]')
+parser.add_argument('--record', metavar='STREAM_FILE', help='Save your keystrokes and their timing to a stream file, that can be replayed later.')
+parser.add_argument('--replay', metavar='STREAM_FILE', help='Run headless, reading the keys from a recorded stream file instead of the terminal.')
+parser.add_argument('--synthetic', type=float, metavar='SECONDS', help='Run headless, with a synthetic typist that types random words with this many seconds per key.')
+parser.add_argument('--synthetic_keys', type=int, default=1000, help='How many keys the synthetic typist types. Default is 1000.')
+parser.add_argument('-w', '--window', type=float, action='append', metavar='SECONDS', help='Length of a rolling window to show the speed over, besides the whole session. Can be given multiple times. Default is %s.' % " and ".join(["%g" % seconds for seconds in DEFAULT_WINDOWS]))
+parser.add_argument('-r', '--random_seed', type=int, help='Allows following a determinstic sequence of random words for the synthetic typist. Default is the system timer.')
+args = parser.parse_args()
 
 
 print("Type lots of characters and/or words:")
 
-keyreader = KeyReader(echo=True, block=True)
-averagedSecondsChar = -1    # Initialize with the first measurement
-wordsPerMinute = -1
-
-# Dont start measuring until they've pressed the first keypress
-key = keyreader.getch()
-timeStartWord = time.time()
-print()
-
-while (True):
-
-    timeStartChar = time.time()
-
-    if key == " ":
-        timeStartWord = timeStartChar
-
-    # Wait for a new character keypress
-    key = keyreader.getch()
-
-    timeEndChar = time.time()
-    rawSecondsChar = (timeEndChar - timeStartChar)
-
-    # Perform a running average alpha filter to smoothen the result but give more priority to recent results
-    if averagedSecondsChar < 0:
-        averagedSecondsChar = rawSecondsChar    # Initialize first use
-
-    alpha = 0.1    # The closer this is to 1.0, the stronger the filtering that will be applied.
-    averagedSecondsChar = ((1.0 - alpha) * rawSecondsChar) + (alpha * averagedSecondsChar)
-
-    if key == " ":
-        # Convert from seconds per character -> words per minute (WPM)
-        rawSecondsWord = (timeEndChar - timeStartWord)
-        rawMinutesWord = rawSecondsWord / 60.0
-        wordsPerMinute = 1.0 / rawMinutesWord
-        print("                Speed: %.3f seconds/character, %.0f WPM" % (averagedSecondsChar, wordsPerMinute))
-    else:
-        print("                Speed: %.3f seconds/character." % (averagedSecondsChar))
-
+# Read the keys from the terminal, or from a keystroke stream when running headless.
+scriptedReader = None
+if args.replay:
+    scriptedReader = ScriptedKeyReader(load_key_stream(args.replay), echo=True)
+elif args.synthetic is not None:
+    scriptedReader = SyntheticTypist(args.synthetic, 0.0, args.random_seed, echo=True)
+    rng = random.Random(args.random_seed)
+    text = ""
+    while len(text) < args.synthetic_keys:
+        text += "".join([rng.choice("abcdefghijklmnopqrstuvwxyz") for i in range(rng.randint(2, 8))]) + " "
+    scriptedReader.show_prompt(text[:args.synthetic_keys])
+# On a terminal, the speed is redrawn in place above the typed text, instead of scrolling a new line for every keypress.
+renderer = TerminalRenderer(sys.stdout)
+terminalReader = None
+if scriptedReader is not None:
+    keyreader = scriptedReader
+else:
+    terminalReader = KeyReader(echo=not renderer.inPlace, block=True)
+    keyreader = terminalReader
+if args.record:
+    keyreader = RecordingKeyReader(keyreader, args.record)
+keyframer = KeyFramer(keyreader)
+
+# Characters per second & WPM over rolling windows and the whole session, updated with a bounded amount of work per keystroke.
+meter = ThroughputMeter(args.window if args.window else DEFAULT_WINDOWS)
+
+keysTyped = 0
+timeSessionStart = time.monotonic_ns()
+try:
+    # Dont start measuring until they've pressed the first keypress
+    (key, arrival) = keyframer.next_key()
+    meter.add(arrival)
+    typedText = key if key.isprintable() else " "
+    if not renderer.inPlace:
+        print()
+
+    while (True):
+        # Wait for a new character keypress. Keys that arrive together in one burst (eg: from a speech engine) are still counted separately.
+        (key, arrival) = keyframer.next_key()
+        meter.add(arrival)
+
+        status = "                Speed: " + meter.status_text()
+        if renderer.inPlace:
+            # Show the speed and the end of the typed text, replacing the previous frame.
+            typedText = (typedText + (key if key.isprintable() else " "))[-(renderer.width() - 1):]
+            renderer.frame([], [status], typedText)
+        else:
+            renderer.frame([], [status])
+        keysTyped += 1
+except (EOFError, KeyboardInterrupt):
+    # The keystroke stream ran out, or Ctrl+C was pressed.
+    print()
+renderer.finish()
+if terminalReader is not None:
+    terminalReader.close()      # Put the terminal back to normal before showing the summary
+for line in meter.summary_lines():
+    print(line)
+
+if args.record:
+    keyreader.save()
+    print("Saved the keystrokes to", args.record)
+if scriptedReader is not None:
+    # Report how fast the loop runs without a person, and how accurately the keystrokes were replayed.
+    sessionSeconds = (time.monotonic_ns() - timeSessionStart) / 1e9
+    print("Headless: %d keys in %.3f s = %.1f keys/s." % (keysTyped, sessionSeconds, keysTyped / max(sessionSeconds, 1e-9)))
+    print("Harness timing error:", timing_error_summary(scriptedReader.timing_errors_ns))
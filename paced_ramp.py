@@ -0,0 +1,159 @@
+# coding: utf-8
+# Paced stress test of the whole person + speech recognizer pipeline. Instead of waiting for each answer, the prompts are issued on a
+# fixed schedule at a target rate of keys per second, and whatever hasn't been typed by the time the next prompt is due counts as a miss.
+# The rate is raised a step at a time until the accuracy of a step drops below the threshold, like a saturation test of a server.
+# The highest rate that kept the accuracy is the figure to track for each recognizer setup.
+
+from __future__ import print_function
+
+import time
+import asyncio
+
+import profiler
+from async_practice import open_key_source
+
+# The ramp stops here even if the accuracy holds, such as with a synthetic typist that never makes mistakes.
+MAXIMUM_RATE = 50.0
+
+
+class PacedRamp:
+    '''
+    The target rate of each step of a stress test, and the accuracy at each rate.
+    startRate & step: keys per second of the first step, and how much faster each following step is.
+    roundsPerStep: how many rounds are played at each rate.
+    accuracy: the fraction of rounds (0 to 1) that must be correct for a step to pass.
+    '''
+    def __init__(self, startRate, step, roundsPerStep, accuracy):
+        if startRate <= 0.0 or step <= 0.0 or roundsPerStep <= 0:
+            raise ValueError("The stress test needs a positive start rate, step & rounds per step")
+        self.rate = startRate
+        self.step = step
+        self.roundsPerStep = roundsPerStep
+        self.accuracy = accuracy
+        self.correct = 0
+        self.rounds = 0
+        self.steps = []         # List of (rate, correct rounds, rounds) of each finished step
+        self.bestRate = None    # Highest rate that passed, or None if even the first step failed
+        self.finished = False
+
+    def interval(self, keys):
+        '''Seconds between a prompt of this many keys and the next prompt, at the current rate.'''
+        return keys / self.rate
+
+    def record(self, correct):
+        '''Count the result of a round. Returns a line of text about the step when a step has just finished, otherwise None.'''
+        self.rounds += 1
+        if correct:
+            self.correct += 1
+        if self.rounds < self.roundsPerStep:
+            return None
+        self.steps.append((self.rate, self.correct, self.rounds))
+        passed = self.correct >= self.accuracy * self.rounds
+        line = "Stress step at %.2f keys/s: %d of %d rounds correct, %s." % (self.rate, self.correct, self.rounds, "passed" if passed else "failed")
+        if passed:
+            self.bestRate = self.rate
+            self.rate += self.step
+            self.finished = self.rate > MAXIMUM_RATE
+        else:
+            self.finished = True
+        self.correct = 0
+        self.rounds = 0
+        return line
+
+    def status_text(self):
+        return "Target rate: %.2f keys/s, round %d of %d at this rate." % (self.rate, self.rounds + 1, self.roundsPerStep)
+
+    def result_text(self):
+        if self.bestRate is None:
+            return "Stress test: the accuracy was below %.0f%% even at %.2f keys/s." % (self.accuracy * 100.0, self.steps[0][0] if self.steps else self.rate)
+        return "Stress test: highest rate with at least %.0f%% accuracy: %.2f keys/s." % (self.accuracy * 100.0, self.bestRate)
+
+    def summary_lines(self):
+        '''Lines of text for the end-of-session summary.'''
+        lines = ["Stress test steps:"]
+        for (rate, correct, rounds) in self.steps:
+            lines.append("    %6.2f keys/s  %3d / %-3d correct  %5.1f%%" % (rate, correct, rounds, 100.0 * correct / rounds))
+        lines.append(self.result_text())
+        return lines
+
+
+# Issue prompts on the ramp's schedule until the ramp has finished, or "rounds" rounds have been played (if rounds > 0).
+async def paced_loop(session, keyreader, keyframer, renderer, ramp, before_round, show_prompt, rounds, journal):
+    source = open_key_source(asyncio.get_running_loop(), keyreader, keyframer)
+    (lines, statusLines) = ([], [])
+    echoed = ""
+    nextIssue = time.monotonic_ns()
+
+    try:
+        while not ramp.finished:
+            roundStart = time.monotonic_ns()
+            if before_round is not None:
+                with profiler.span("mapping updates"):
+                    lines.extend(before_round())
+            keyframer.take_queued()     # Drop late keys from the previous round, and keys typed while waiting for this one
+
+            try:
+                with profiler.span("next prompt"):
+                    prompt = session.next_prompt()
+            except EOFError:
+                renderer.frame(lines, statusLines, None, echoed)    # The drill file has ended
+                raise
+            # Wait until the prompt is due. If the previous round ran late, the schedule carries on from now instead of catching up.
+            delay = (nextIssue - time.monotonic_ns()) / 1e9
+            if delay > 0:
+                with profiler.span("wait for schedule", profiler.IDLE):
+                    await asyncio.sleep(delay)
+                keyframer.take_queued()
+            source.start_round()
+            if show_prompt is not None:
+                show_prompt(prompt.truth)
+            with profiler.span("draw frame"):
+                renderer.frame(lines, statusLines + [ramp.status_text()], prompt.line(), echoed)
+
+            timeStart = time.monotonic_ns()
+            deadline = timeStart + int(ramp.interval(len(prompt.expected)) * 1e9)
+            nextIssue = deadline
+
+            # Collect keys until the answer is complete, or until the next prompt is due.
+            typedKeys = []
+            keyTimes = []
+            timedOut = False
+            while True:
+                for (key, arrival) in keyframer.take_queued():
+                    typedKeys.append(key)
+                    keyTimes.append(arrival)
+                if len(keyTimes) >= len(prompt.expected):
+                    break
+                timeout = (deadline - time.monotonic_ns()) / 1e9
+                if timeout <= 0 or not await source.wait(timeout):
+                    timedOut = True
+                    break
+
+            correctBefore = session.tallyCorrect
+            with profiler.span("score round"):
+                (lines, statusLines) = session.score_round(prompt, typedKeys, timeStart, keyTimes, timedOut)
+            echoed = "".join(typedKeys)
+            with profiler.span("record step"):
+                stepLine = ramp.record(session.tallyCorrect > correctBefore)
+                if stepLine is not None:
+                    lines.append(stepLine)
+                    if journal is not None:
+                        journal.write_note(stepLine, session.rounds_played())
+            with profiler.span("prefetch prompts"):
+                session.prefetch_prompts()
+            profiler.add_span("round", profiler.ROUND, roundStart, time.monotonic_ns())
+            if rounds > 0 and session.rounds_played() >= rounds:
+                break
+        renderer.frame(lines, statusLines, None, echoed)
+        if journal is not None:
+            journal.write_note(ramp.result_text(), session.rounds_played())
+    finally:
+        source.close()
+
+
+# Run a paced stress test on an asyncio event loop, with the same arguments as run_async_session() plus:
+# ramp: the PacedRamp that sets the rate of each step, and keeps the results.
+# journal: an optional JournalWriter, to also record the result of each step.
+# Raises EOFError when a keystroke stream or the input ends.
+def run_paced_session(session, keyreader, keyframer, renderer, ramp, before_round=None, show_prompt=None, rounds=0, journal=None):
+    asyncio.run(paced_loop(session, keyreader, keyframer, renderer, ramp, before_round, show_prompt, rounds, journal))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# Thin client of "practice_server.py": sends the raw keystrokes of this terminal to the server, and shows whatever the server sends back.
+# All the mappings, prompts & scoring live in the server, so many trainees can practice together from one process.
+# There's also a stand-in mode, where one or more simulated trainees type each prompt by themselves, to try out or load test a server.
+#
+# eg:
+#   python practice_client.py --name Shervin
+#   python practice_client.py --stand_in 0.2 --clients 20 --rounds 50
+
+# Python 2/3 compatibility
+from __future__ import print_function
+
+import sys
+import time
+import random
+import codecs
+import getpass
+import asyncio
+import argparse
+
+from keyreader import KeyReader
+from practice_server import DEFAULT_PORT, PROMPT_MARKER, PROMPTS_OPTION
+
+
+async def connect(host, port, unixPath):
+    if unixPath:
+        return await asyncio.open_unix_connection(unixPath)
+    return await asyncio.open_connection(host, port)
+
+
+# Practice on this terminal: send each read of the keyboard straight to the server, and print the server's text as it arrives.
+async def run_terminal_client(host, port, unixPath, name):
+    (reader, writer) = await connect(host, port, unixPath)
+    writer.write((name + "\n").encode('utf-8'))
+    loop = asyncio.get_running_loop()
+    keyreader = KeyReader(echo=True, block=False)
+
+    def on_readable():
+        (text, arrival) = keyreader.read_stamped()
+        if text:
+            writer.write(text.encode('utf-8'))
+        elif text == "":
+            writer.close()      # The input has ended
+
+    loop.add_reader(keyreader.fd, on_readable)
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            sys.stdout.write(decoder.decode(data))
+            sys.stdout.flush()
+    finally:
+        loop.remove_reader(keyreader.fd)
+        keyreader.close()
+        writer.close()
+
+
+# Type the given text into the connection, one character every "seconds", replacing error_percent of the characters with a wrong one.
+async def type_text(writer, text, seconds, error_percent, rng):
+    for char in text:
+        await asyncio.sleep(seconds)
+        if rng.random() * 100.0 < error_percent:
+            char = "~" if char != "~" else "`"
+        writer.write(char.encode('utf-8'))
+
+# A simulated trainee, that types each prompt by itself. Stops after "rounds" rounds (if rounds > 0) or when the server ends the session.
+# Returns the list of lines that the server sent.
+async def run_stand_in(host, port, unixPath, name, seconds, error_percent, seed, rounds):
+    (reader, writer) = await connect(host, port, unixPath)
+    writer.write((name + "\t" + PROMPTS_OPTION + "\n").encode('utf-8'))
+    rng = random.Random(seed)
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    lines = []
+    partial = ""
+    prompts = 0
+    typing = None
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            text = partial + decoder.decode(data)
+            received = text.split("\n")
+            partial = received.pop()
+            for line in received:
+                if not line.startswith(PROMPT_MARKER):
+                    lines.append(line)
+                    continue
+                prompts += 1
+                if rounds > 0 and prompts > rounds:
+                    return lines
+                if typing is not None:
+                    typing.cancel()     # The previous round ran out of time
+                typing = asyncio.ensure_future(type_text(writer, line[len(PROMPT_MARKER):], seconds, error_percent, rng))
+    finally:
+        if typing is not None:
+            typing.cancel()
+        writer.close()
+    return lines
+
+async def run_stand_ins(args):
+    seed = args.random_seed if args.random_seed is not None else random.randrange(1 << 30)
+    names = ["%s %d" % (args.name, i + 1) if args.clients > 1 else args.name for i in range(args.clients)]
+    return await asyncio.gather(*[run_stand_in(args.host, args.port, args.unix, name, args.stand_in, args.stand_in_error, seed + i, args.rounds)
+                                  for (i, name) in enumerate(names)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage='%(prog)s [options]', description='Practice with a "practice_server.py" server, on this terminal or with simulated trainees.')
+    parser.add_argument('--name', help='Your name on the leaderboard. Default is your user name, or "stand-in" for stand-ins.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address of the server. Default is 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port of the server. Default is %d.' % DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='SOCKET_PATH', help='Connect to a Unix socket instead of TCP.')
+    parser.add_argument('--stand_in', type=float, metavar='SECONDS', help='Run simulated trainees that type each shown key after this many seconds, instead of using this terminal.')
+    parser.add_argument('--stand_in_error', type=float, default=0.0, metavar='PERCENT', help='Percentage of keys that the stand-ins get wrong. Default is 0.')
+    parser.add_argument('--clients', type=int, default=1, help='How many stand-ins to connect at the same time. Default is 1.')
+    parser.add_argument('--rounds', type=int, default=0, help='Stand-ins disconnect after this many rounds. Default is 0, to keep going until the server ends the session.')
+    parser.add_argument('-r', '--random_seed', type=int, help='Allows following a determinstic sequence of mistakes for the stand-ins. Default is the system timer.')
+    args = parser.parse_args()
+
+    try:
+        if args.stand_in is None:
+            asyncio.run(run_terminal_client(args.host, args.port, args.unix, args.name or getpass.getuser()))
+        else:
+            args.name = args.name or "stand-in"
+            timeStart = time.monotonic_ns()
+            results = asyncio.run(run_stand_ins(args))
+            seconds = (time.monotonic_ns() - timeStart) / 1e9
+            # Show what the server told the first stand-in at the end of its session, then how long all the stand-ins took.
+            lines = results[0]
+            for (i, line) in enumerate(lines):
+                if line.startswith("Session:"):
+                    lines = lines[i:]
+                    break
+            else:
+                lines = lines[-12:]
+            for line in lines:
+                print(line)
+            print("Stand-ins: %d clients in %.2f s." % (args.clients, seconds))
+    except (KeyboardInterrupt, ConnectionError) as e:
+        print()
+        if isinstance(e, ConnectionError):
+            print("Error: Lost the connection to the server:", e)
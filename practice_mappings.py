@@ -10,23 +10,49 @@ import os
 import sys
 import random
 import time
-import operator
 import argparse
 
+import profiler
+from practice_session import PracticeSession, add_prompt_options, parse_custom_weights, check_total_weight, mapping_sources, build_letter_list, build_vocabulary_weights, save_drill, load_drill
+from vocabulary import load_vocabulary
+from async_practice import run_async_session
+from paced_ramp import PacedRamp, run_paced_session
+from stats_store import StatsStore, DEFAULT_STATS_FILENAME
+from terminal_renderer import TerminalRenderer
+from session_journal import JournalWriter, new_journal_filename
+from mappings import load_mappings, MappingWatcher, cache_filename_for
+from confusability import CONFUSABILITY_CACHE_BASENAME
+from keyreader import KeyReader, KeyFramer, ScriptedKeyReader, SyntheticTypist, RecordingKeyReader, load_key_stream, timing_error_summary
+
 # Instantiate the argument parser
 parser = argparse.ArgumentParser(usage='%(prog)s [options] [combo_length]')
 
 # Process the command-line args before doing anything else, so we can load files based on the args.
 combo = 3
 parser.add_argument('combo_length', type=int, nargs='?', help='How many characters you will try to say at the same time. Default is 3.')
-parser.add_argument('-d', '--dragonfly', action='store_true', help='Use Dragonfly mode ("lettermap.py" + "punctuationmap.py"). Default is Talon mode.')
-parser.add_argument('-a', '--alphabetical', action='store_true', help='Sort the characters alphabetically. Default is random (ie: unsorted).')
-parser.add_argument('-s', '--symbols', action='store_true', help='Include some symbols in the mix. Default is just alphabet letters, not symbols.')
-parser.add_argument('-n', '--no_numbers', action='store_true', help='Skip numerals, only use letters (and possibly symbols). Default is to include numbers.')
-parser.add_argument('-c', '--no_crucial', action='store_true', help='Skip crucial symbols (commas and spaces). Default is to include crucial symbols.')
-parser.add_argument('-p', '--capitals_percentage', type=int, default=0, help='Percentage of characters that will be a capital letter. Default is 0.')
-parser.add_argument('-r', '--random_seed', type=int, help='Allows following a determinstic sequence of random values. Default is the system timer.')
+add_prompt_options(parser)
+parser.add_argument('--no_watch', action='store_true', help="Don't reload the mapping files when they change during a session. Default is to watch them.")
+parser.add_argument('--rounds', type=int, default=0, help='Stop after this many rounds. Default is 0, to keep going until Ctrl+C.')
+parser.add_argument('--record', metavar='STREAM_FILE', help='Save your keystrokes and their timing to a stream file, that can be replayed later with the same "--random_seed".')
+parser.add_argument('--replay', metavar='STREAM_FILE', help='Run headless, reading the keys from a recorded stream file instead of the terminal.')
+parser.add_argument('--synthetic', type=float, metavar='SECONDS', help='Run headless, with a synthetic typist that types each shown key after this many seconds.')
+parser.add_argument('--synthetic_error', type=float, default=0.0, metavar='PERCENT', help='Percentage of keys that the synthetic typist gets wrong. Default is 0.')
+parser.add_argument('--synthetic_burst', action='store_true', help='The synthetic typist types each whole combo at once, like a speech engine. Default is one key at a time.')
+parser.add_argument('--asyncio', action='store_true', help='Run the game on an asyncio event loop, showing a live timer while waiting for the keys.')
+parser.add_argument('-t', '--time_limit', type=float, default=0.0, metavar='SECONDS', help='Time limit for each round, after which it counts as a miss. Uses the asyncio loop. Default is 0 (no limit).')
+parser.add_argument('--stats_file', default=DEFAULT_STATS_FILENAME, help='Database of your results across sessions, that "stats_store.py" can show. Default is "%s".' % DEFAULT_STATS_FILENAME)
+parser.add_argument('--no_stats', action='store_true', help="Don't save the results of this session. Headless runs are never saved.")
+parser.add_argument('--journal', metavar='PATH', help='Record every prompt, keystroke & result of this session to a binary journal file, or to a new timestamped file if PATH is a folder. "session_journal.py" can print it.')
+parser.add_argument('--drill', metavar='DRILL_FILE', help='Practice the rounds of a drill file (from "--export_drill") instead of random keys.')
+parser.add_argument('--export_drill', metavar='DRILL_FILE', help='Save the rounds that would be practiced with these options (use "--rounds", default 100) to a drill file, then exit.')
+parser.add_argument('--stress', type=float, metavar='KEYS_PER_SECOND', help='Paced stress test: show the prompts on a schedule starting at this many keys per second, raising the rate until the accuracy drops, to find the highest rate you can keep up.')
+parser.add_argument('--stress_step', type=float, default=0.25, metavar='KEYS_PER_SECOND', help='How much faster each step of the stress test is. Default is 0.25.')
+parser.add_argument('--stress_rounds', type=int, default=10, metavar='ROUNDS', help='How many rounds are played at each rate of the stress test. Default is 10.')
+parser.add_argument('--stress_accuracy', type=float, default=90.0, metavar='PERCENT', help='Percentage of rounds that must be correct for a step of the stress test to pass. Default is 90.')
+parser.add_argument('--profile', metavar='TRACE_FILE', help='Profile the tool itself: save a timeline of each phase of each round to a Chrome trace file (for "https://ui.perfetto.dev" or "chrome://tracing"), and show how much time was the tool\'s own work.')
 args = parser.parse_args()
+if args.profile:
+    profiler.start()
 
 print("Practice keyboard mappings, such as to practice voice coding. By Shervin Emami (http://shervinemami.com), 2023.")
 print("By default, it will run as Talon knausj mode. Or to use Dragonfly mode, add '--dragonfly'.")
@@ -36,305 +62,200 @@ print("")
 if args.combo_length:
     combo = args.combo_length
 
-if args.random_seed:
+if args.random_seed is not None:
     print("Using", args.random_seed, "as the random seed instead of the current time")
     random.seed(args.random_seed)
 
 
-if args.dragonfly:
-    # Import the "letterMap" dictionary from the "lettermap.py" file that's in the MacroSystem folder.
-    # Make sure you adjust this path to where it's located on your machine, relative to this script.
-    sys.path.append('../MacroSystem')
-    from lettermap import letterMap
-
-    # Also potentially include symbols, not just alphabet letters
-    try:
-        # Long version of punctuation characters, that are slower but more reliable, hence good for general use at any time:
-        from punctuationmap import longPunctuationMap
-    except:
-        pass
-else:
-    # Talon filenames. You can use "~" to refer to the Talon user folder.
-    CSV_filename = "~/.talon/user/knausj_talon/settings/alphabet.csv"
-    keys_filename = "~/.talon/user/knausj_talon/core/keys/keys.py"
-
-    import csv
-
-
-crucialMap = {
-    "space":    " ",
-    "dot":      ".",
-}
-numberMap = {
-    "zero":     "0",
-    "one":      "1",
-    "two":      "2",
-    "three":    "3",
-    "four":     "4",
-    "five":     "5",
-    "six":      "6",
-    "seven":    "7",
-    "eight":    "8",
-    "nine":     "9",
-}
-
-#---------------------------------------
-# Keyboard input code, taken from "https://github.com/akkana/scripts/blob/master/keyreader.py" on Jan 1st 2019.
-import termios, fcntl
-import select
-
-class KeyReader :
-    '''
-    Read keypresses one at a time, without waiting for a newline.
-    echo: should characters be echoed?
-    block: should we block for each character, or return immediately?
-           (If !block, we'll return None if nothing is available to read.)
-    '''
-    def __init__(self, echo=False, block=True):
-        '''Put the terminal into cbreak and noecho mode.'''
-        self.fd = sys.stdin.fileno()
-
-        self.block = block
-
-        self.oldterm = termios.tcgetattr(self.fd)
-        self.oldflags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
-
-        # Sad hack: when the destructor __del__ is called,
-        # the fcntl module may already be unloaded, so we can no longer
-        # call fcntl.fcntl() to set the terminal back to normal.
-        # So just in case, store a reference to the fcntl module,
-        # and also to termios (though I haven't yet seen a case
-        # where termios was gone -- for some reason it's just fnctl).
-        # The idea of keeping references to the modules comes from
-        # http://bugs.python.org/issue5099
-        # though I don't know if it'll solve the problem completely.
-        self.fcntl = fcntl
-        self.termios = termios
-
-        newattr = termios.tcgetattr(self.fd)
-        # tcgetattr returns: [iflag, oflag, cflag, lflag, ispeed, ospeed, cc]
-        # where cc is a list of the tty special characters (length-1 strings)
-        # except for cc[termios.VMIN] and cc[termios.VTIME] which are ints.
-        self.cc_save = newattr[6]
-        newattr[3] = newattr[3] & ~termios.ICANON
-        if not echo:
-            newattr[3] = newattr[3] & ~termios.ECHO
-
-        if block and False:
-            # VMIN and VTIME are supposed to let us do blocking reads:
-            # VMIN is the minimum number of characters before it will return,
-            # VTIME is how long it will wait if for characters < VMIN.
-            # This is documented in man termios.
-            # However, it doesn't work in python!
-            # In Python, read() never returns in non-canonical mode;
-            # even typing a newline doesn't help.
-            cc = self.cc_save[:]   # Make a copy so we can restore VMIN, VTIME
-            cc[termios.VMIN] = 1
-            cc[termios.VTIME] = 0
-            newattr[6] = cc
-        else:
-            # Put stdin into non-blocking mode.
-            # We need to do this even if we're blocking, see above.
-            fcntl.fcntl(self.fd, fcntl.F_SETFL, self.oldflags | os.O_NONBLOCK)
-
-        termios.tcsetattr(self.fd, termios.TCSANOW, newattr)
-
-    def __del__(self):
-        '''Reset the terminal before exiting the program.'''
-        self.termios.tcsetattr(self.fd, self.termios.TCSAFLUSH, self.oldterm)
-        self.fcntl.fcntl(self.fd, self.fcntl.F_SETFL, self.oldflags)
-
-    def getch(self):
-        '''Read keyboard input, returning a string.
-           Note that one key may result in a string of more than one character,
-           e.g. arrow keys that send escape sequences.
-           There may also be multiple keystrokes queued up since the last read.
-           This function, sadly, cannot read special characters like VolumeUp.
-           They don't show up in ordinary CLI reads -- you have to be in
-           a window system like X to get those special keycodes.
-        '''
-        # Since we can't use the normal cbreak read from python,
-        # use select to see if there's anything there:
-        if self.block:
-            inp, outp, err = select.select([sys.stdin], [], [])
-        try:
-            return sys.stdin.read()
-        except (IOError, TypeError) as e:
-            return None
-#--------------------------------------
-
-
-# Try to load a given Talon alphabet CSV file, potentially ignoring the header (first row)
-def load_talon_lettermap(CSV_filename):
-    CSV_filename = os.path.expanduser(CSV_filename)   # Allow to hard-code "~" in this source file as the user's home folder
+mappingSources = mapping_sources(args.dragonfly)
 
-    new_lettermap = {}  # Create an empty Dictionary
-    with open(CSV_filename, newline='') as csvfile:
-        filereader = csv.reader(csvfile, delimiter=',', quotechar='|')
-        for row in filereader:
-            if ("Spoken Form" not in row) and (len(row) >= 2):
-                #print(row[0], "=== ", row[1])
-                # Note that in Shervin's Dragonfly lettermap file, the phrase is the 1st word and the character is the 2nd word,
-                # but in Talon's alphabet csv file, the character is the 1st word and the phrase is the 2nd word.
-                # So we swap them here.
-                new_lettermap[row[1]] = row[0]
-    return new_lettermap
 
-# Pull the dictionary mappings from the following lines in the file until a "}" line is found.
-# Stores the mappings directly into the dict in-place.
-# Assumes pyfile has already been opened and the file pointer is now at a new line containing the dictionary mappings (ie: after a "{").
-def extract_dictionary_from_part_of_python_file(pyfile, d={}):
-    # Scan the line to find the phrase, and the symbol it maps to.
-    # The line is typically something like the string: '  "question mark": "?",   # A random comment.\n'
-    for line in pyfile:
-        # Remove whitespace at the start of the string, then see if it starts with a '"' or "'" single-quote or double-quote character.
-        line = line.lstrip()
-        #print("line: ", line)
-        if len(line) >= 6 and (line[0] == '"' or line[0] == "'"):
-            # Make sure this phrase starts with an actual alphabetical letter, not a symbol such as ','.
-            if line[1].isalpha():
-                # Remove the potential whitespace & potential random stuff & line-ending at the end of the string after the comma.
-                # This should generate something like: '"question mark": "?"'
-                words = line.split(',')[0]
-                if len(words) >= 1:
-                    # Split up the string by ':'
-                    words = words.split(':')     # eg: ['"question mark"', '"?"']
-                    if len(words) >= 2 and len(words[0]) >= 1 and len(words[1]) >= 1:
-                        phrase = words[0].lstrip('"').rstrip('"')          # eg: 'question mark'
-                        symbol = words[1].lstrip(' "').rstrip('"')         # eg: '?'
-                        if len(phrase) >= 1 and len(symbol) >= 1:
-                            # If the symbol starts with a '\' character, remove it, but leave whatever is after it.
-                            if symbol[0] == '\\':
-                                symbol = symbol[1]
-                            # If the symbol starts & ends with a "'" character, remove it, but leave whatever is after it.
-                            if symbol[0] == "'" and len(symbol) > 1 and symbol[-1] == "'":
-                                symbol = symbol[1]
-                            #print("phrase=<" + phrase + ">, \t symbol=<" + symbol + ">.")
-                            # Add the mapping to our dictionary.
-                            d[phrase] = symbol
-        elif line.lstrip()[0] == "}":  # Check for a close brace, but skip close braces that are inside strings, since the user probably has a close brace in their alphabet!
-            break
+# Custom weights, from a file and then from the command-line.
+customWeights = parse_custom_weights(parser, args)
 
-# Try to load the symbolmap from a given Talon keys.py file
-def load_talon_symbolmap(filename):
-    filename = os.path.expanduser(filename)     # Allow to hard-code "~" in this source file as the user's home folder
-
-    new_symbolmap = {}  # Create an empty Dictionary
-    with open(filename, 'r') as pyfile:
-        current_line = ""
-        # Skip all lines in the Python file until we find the "punctuation_words" declaration line.
-        for line in pyfile:
-            if "punctuation_words = {" in line:
-                break
-        extract_dictionary_from_part_of_python_file(pyfile, new_symbolmap)
-        # Skip all lines in the Python file until we find the "symbol_key_words" declaration line.
-        for line in pyfile:
-            if "symbol_key_words = {" in line:
-                break
-        extract_dictionary_from_part_of_python_file(pyfile, new_symbolmap)
-    #print(new_symbolmap)
-    return new_symbolmap
-#--------------------------------------
-
-
-if not args.dragonfly:
-    # First try loading the alphabet CSV into a dictionary.
-    new_lettermap = load_talon_lettermap(CSV_filename)
-    if len(new_lettermap) > 0:
-        letterMap = new_lettermap
-
-    # Now try converting the "punctuation_words" and "" definitions in the user's "keys.py" file into a dictionary.
-    # Note that we aren't importing the python file directly, because that would require importing talon, which requires integration. 
-    new_symbolmap = load_talon_symbolmap(keys_filename)
-    if len(new_symbolmap) > 0:
-        longPunctuationMap = new_symbolmap
-
-# Sort the dictionary alphabetically, to allow showing characters in alphabetical order if desired.
-#letterMap = sorted(letterMap.iterkeys())
-letterMap = sorted(letterMap.items(), key=operator.itemgetter(1))
-if not args.no_numbers:
-    numbersAsList = sorted(numberMap.items(), key=operator.itemgetter(1))
-    letterMap.extend(numbersAsList)
-# Include the crucial list twice, so they will get chosen more often than other symbols.
-if not args.no_crucial:
-    crucialAsList = sorted(crucialMap.items(), key=operator.itemgetter(1))
-    letterMap.extend(crucialAsList)
-    letterMap.extend(crucialAsList)
-
-# Possibly include symbols in addition to letters.
-if args.symbols:
-    # Add double entries for the main characters, so they will get chosen more often than the other symbols.
-    letterMap.extend(letterMap)
-    # Other symbols
-    try:
-        symbolsAsList = sorted(longPunctuationMap.items(), key=operator.itemgetter(1))
-        letterMap.extend(symbolsAsList)
-        #print("SYMBOLS", symbolsAsList)
-        #print("LETTERMAP", letterMap)
-    except:
-        print("Warning: Couldn't find extra symbol files")
+separator = ""
+mapsByFile = {}
+if args.vocabulary:
+    # Word drill mode: practice whole words & phrases from vocabulary files instead of single characters.
+    with profiler.span("load vocabulary"):
+        vocabulary = load_vocabulary(args.vocabulary, use_cache=not args.no_cache)
+    letterMap = vocabulary.with_prefix(args.vocabulary_prefix) if args.vocabulary_prefix else vocabulary
+    if len(letterMap) == 0:
+        print("Error: No vocabulary entries to practice")
+        sys.exit(1)
+    letterWeights = build_vocabulary_weights(letterMap, customWeights)
+    check_total_weight(parser, letterWeights)
+    separator = " "
+    print("Loaded %d vocabulary entries" % len(letterMap))
+else:
+    # Load the mappings, from the compiled snapshot if the files haven't changed since last time.
+    with profiler.span("load mappings"):
+        loadedMaps = load_mappings(mappingSources, use_cache=not args.no_cache, maps_by_file=mapsByFile)
+    with profiler.span("build letterMap"):
+        (letterMap, letterWeights) = build_letter_list(loadedMaps, args, customWeights)
+    check_total_weight(parser, letterWeights)
+# Save each key's results across sessions, except when running headless, since those aren't a person's results.
+statsStore = None
+# Stress tests aren't saved either, since every round that can't be finished in time on purpose would count as a wrong key.
+if not (args.no_stats or args.replay or args.synthetic is not None or args.export_drill or args.stress):
+    statsStore = StatsStore(args.stats_file)
+journal = None
+if args.journal and not args.export_drill:
+    journal = JournalWriter(new_journal_filename(args.journal), note=" ".join(sys.argv[1:]))
+# The confusability index is cached in the same folder as the compiled snapshot of the mappings or vocabulary.
+confusabilityCache = None
+if args.confusable and not args.no_cache:
+    cacheFolder = os.path.dirname(os.path.abspath(os.path.expanduser(args.vocabulary[0]))) if args.vocabulary else os.path.dirname(cache_filename_for(mappingSources))
+    confusabilityCache = os.path.join(cacheFolder, CONFUSABILITY_CACHE_BASENAME)
+with profiler.span("create session"):
+    session = PracticeSession(letterMap, letterWeights, args, combo, statsStore=statsStore, journal=journal, separator=separator, confusabilityCache=confusabilityCache)
+if args.confusable:
+    print("Most confusable:", ", ".join(["%s ~ %s" % (phrase, other) for (score, phrase, other) in session.confusability.most_confusable(5)]))
+if args.drill:
+    session.use_drill(load_drill(args.drill))
+if args.export_drill:
+    drillRounds = args.rounds if args.rounds > 0 else 100
+    save_drill(args.export_drill, [session.next_prompt() for i in range(drillRounds)])
+    print("Saved %d rounds to %s" % (drillRounds, args.export_drill))
+    sys.exit(0)
+
+# Watch the mapping files in the background, so that fixing a misrecognized word doesn't need a restart.
+mappingWatcher = None
+if not (args.no_watch or args.vocabulary):
+    mappingWatcher = MappingWatcher(mappingSources, mapsByFile)
 
 
 print("Press the "+ str(combo) + " shown keys as fast as you can, using either a speech recognition engine or a physical keyboard!")
 
-keyreader = KeyReader(echo=True, block=True)
-tallyCorrect = 0
-tallyWrong = 0
-averagedSpeed = -1    # Initialize with the first measurement
-nextAlphabet = 0
-
-while (True):
-    truth = ""
-    chars = []
-    words = []
-    for i in range(combo):
-        if args.alphabetical:
-            r = nextAlphabet         # Pick the next letter
-            nextAlphabet = nextAlphabet + 1
-            if nextAlphabet >= len(letterMap):
-                nextAlphabet = 0
-        else:
-            r = random.randint(0, len(letterMap) - 1)    # Pick a random letter
-        (word, char) = letterMap[r]
-        if random.randint(0, 100) < args.capitals_percentage:    # Occasionally use a capital letter
-            char = char.upper()
-            word = word.upper()
-        #print("%25s %25s" % (word, char))
-        chars.append(char)
-        words.append(word)
-        truth += char
-
-    # Print all the characters on a single line
-    for i in range(combo):
-        print(chars[i], end='')
-    print("                                        ", end='')
-    for i in range(combo):
-        print(words[i], " ", end='')
-    print()    
-
-
-    timeStart = time.time()
-
-    typed = ""
-    for i in range(combo):
-        key = keyreader.getch()
-        typed += key
-
-    timeEnd = time.time()
-    rawSpeed = (timeEnd - timeStart) / combo
-    # Perform a running average alpha filter to smoothen the result but give more priority to recent results
-    if averagedSpeed < 0:
-        averagedSpeed = rawSpeed
-    alpha = 0.5    # The closer this is to 1.0, the stronger the filtering that will be applied.
-    averagedSpeed = ((1.0 - alpha) * rawSpeed) + (alpha * averagedSpeed)
-
-    print()
-    if typed == truth:
-        tallyCorrect = tallyCorrect+1
-        wordErrorRate = 100.0 * (tallyWrong / float(tallyCorrect + tallyWrong))
-        print("Correct.                                  Tally: %d correct = %.1f%% WER. Speed: %.2f s/key" % (tallyCorrect, wordErrorRate, averagedSpeed))
+# Read the keys from the terminal, or from a keystroke stream when running headless.
+scriptedReader = None
+if args.replay:
+    scriptedReader = ScriptedKeyReader(load_key_stream(args.replay), echo=True)
+elif args.synthetic is not None:
+    scriptedReader = SyntheticTypist(args.synthetic, args.synthetic_error, args.random_seed, echo=True, burst=args.synthetic_burst)
+terminalReader = None
+if scriptedReader is not None:
+    keyreader = scriptedReader
+else:
+    terminalReader = KeyReader(echo=True, block=True)
+    keyreader = terminalReader
+if args.record:
+    keyreader = RecordingKeyReader(keyreader, args.record)
+keyframer = KeyFramer(keyreader)
+renderer = TerminalRenderer(sys.stdout)
+
+# Swap in the new mappings between rounds if a mapping file was changed, keeping the tallies and speeds.
+# Returns the lines of text to show about it.
+def apply_mapping_updates():
+    if mappingWatcher is None:
+        return []
+    (newMaps, messages) = mappingWatcher.take_update()
+    lines = list(messages)
+    if newMaps is not None:
+        (newLetterMap, newLetterWeights) = build_letter_list(newMaps, args, customWeights, warnings=lines)
+        if len(newLetterMap) > 0 and sum(newLetterWeights) > 0.0:
+            session.set_mappings(newLetterMap, newLetterWeights)
+        lines.append("")
+    return lines
+
+# The normal game loop, that waits as long as it takes for each round's keys.
+def run_blocking_session():
+    (lines, statusLines) = ([], [])
+    echoed = ""
+    while (True):
+        roundStart = time.monotonic_ns()
+        with profiler.span("mapping updates"):
+            lines.extend(apply_mapping_updates())
+
+        # The prompt was generated ahead of time, so it can be shown straight away.
+        try:
+            with profiler.span("next prompt"):
+                prompt = session.next_prompt()
+        except EOFError:
+            renderer.frame(lines, statusLines, None, echoed)    # The drill file has ended
+            raise
+        if args.synthetic is not None:
+            scriptedReader.show_prompt(prompt.truth)
+
+        # Show the results of the previous round and all the characters of the new round in a single write.
+        with profiler.span("draw frame"):
+            renderer.frame(lines, statusLines, prompt.line(), echoed)
+
+        # Stamp every read with a monotonic nanosecond clock, so that NTP adjustments of the wall clock can't affect the timing,
+        # and so that we can tell the recognizer's delay (time to the first key) apart from how fast the words are spoken (gaps between keys).
+        timeStart = time.monotonic_ns()
+
+        # Read one key at a time even when a speech engine types the whole combo in one burst, keeping the arrival time of each read,
+        # and end the round as soon as "combo" keys have arrived.
+        typedKeys = []
+        keyTimes = []
+        while len(keyTimes) < len(prompt.expected):
+            (key, arrival) = keyframer.next_key()
+            typedKeys.append(key)
+            keyTimes.append(arrival)
+        # Any extra keys that arrived in the same burst are also part of this answer, such as an extra misrecognized word.
+        for (key, arrival) in keyframer.take_queued():
+            typedKeys.append(key)
+            keyTimes.append(arrival)
+
+        with profiler.span("score round"):
+            (lines, statusLines) = session.score_round(prompt, typedKeys, timeStart, keyTimes)
+        echoed = "".join(typedKeys)
+        # Prepare the next rounds now, between rounds, rather than after the next round has started.
+        with profiler.span("prefetch prompts"):
+            session.prefetch_prompts()
+        profiler.add_span("round", profiler.ROUND, roundStart, time.monotonic_ns())
+        if args.rounds > 0 and session.rounds_played() >= args.rounds:
+            renderer.frame(lines, statusLines, None, echoed)
+            return
+
+ramp = None
+if args.stress:
+    ramp = PacedRamp(args.stress, args.stress_step, args.stress_rounds, args.stress_accuracy / 100.0)
+
+timeSessionStart = time.monotonic_ns()
+try:
+    if ramp is not None:
+        # Show the prompts on a schedule at a rising rate, instead of waiting for each answer.
+        promptListener = scriptedReader.show_prompt if args.synthetic is not None else None
+        run_paced_session(session, keyreader, keyframer, renderer, ramp, apply_mapping_updates, promptListener, args.rounds, journal)
+    elif args.asyncio or args.time_limit > 0:
+        # Show a live timer while waiting, and possibly give up on rounds that take too long.
+        promptListener = scriptedReader.show_prompt if args.synthetic is not None else None
+        run_async_session(session, keyreader, keyframer, renderer, args.time_limit, apply_mapping_updates, promptListener, args.rounds)
     else:
-        tallyWrong = tallyWrong+1
-        print("### WRONG! ###### ", truth, typed, "############ Tally:", tallyCorrect, "correct,", tallyWrong, "wrong. ###################################")
+        run_blocking_session()
+except (EOFError, KeyboardInterrupt):
+    # The keystroke stream ran out, or Ctrl+C was pressed.
     print()
-
+renderer.finish()
+if terminalReader is not None:
+    terminalReader.close()      # Put the terminal back to normal before showing the summary
+
+for line in session.summary_lines():
+    print(line)
+if ramp is not None:
+    for line in ramp.summary_lines():
+        print(line)
+if statsStore is not None:
+    statsStore.close()
+if journal is not None:
+    journal.close()
+    print("Saved the session journal to", journal.filename)
+if args.profile:
+    print()
+    for line in profiler.active.summary_lines(session.latencyStats.overall.mean()):
+        print(line)
+    profiler.active.write_trace(args.profile)
+    print("Saved the profile to", args.profile)
+
+if args.record:
+    keyreader.save()
+    print("Saved the keystrokes to", args.record)
+if scriptedReader is not None:
+    # Report how fast the game loop runs without a person, and how accurately the keystrokes were replayed,
+    # so the latency numbers can be trusted and tracked across versions.
+    sessionSeconds = (time.monotonic_ns() - timeSessionStart) / 1e9
+    roundsPlayed = session.rounds_played()
+    print("Headless: %d rounds in %.3f s = %.1f rounds/s." % (roundsPlayed, sessionSeconds, roundsPlayed / max(sessionSeconds, 1e-9)))
+    print("Harness timing error:", timing_error_summary(scriptedReader.timing_errors_ns))
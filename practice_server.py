@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# Group practice server: many trainees practice at the same time, each in their own session, on a single asyncio loop in one process.
+# The server loads (and watches) the mappings once, then generates & scores the rounds of every trainee, and keeps a live leaderboard.
+# Clients are thin: "practice_client.py" just sends the raw keystrokes and shows whatever the server sends back, over a local TCP or Unix socket.
+#
+# Protocol: the client sends the trainee's name on the first line, then raw keystrokes. The server sends plain text to show.
+# If the name line ends with a tab and "prompts" (used by stand-in clients that type by themselves), the server also sends the expected
+# text of each round on its own line, starting with PROMPT_MARKER.
+# Keys are stamped by the server as they arrive, which on a local socket adds well under a millisecond to each latency.
+#
+# eg:
+#   python practice_server.py 3 --symbols
+#   python practice_client.py --name Shervin
+
+# Python 2/3 compatibility
+from __future__ import print_function
+
+import os
+import time
+import random
+import codecs
+import asyncio
+import argparse
+
+from practice_session import PracticeSession, add_prompt_options, parse_custom_weights, check_total_weight, mapping_sources, build_letter_list
+from async_practice import practice_loop
+from terminal_renderer import TerminalRenderer
+from mappings import load_mappings, MappingWatcher
+from keyreader import KeyFramer
+
+DEFAULT_PORT = 8765
+PROMPT_MARKER = "\x1e"          # ASCII record separator, at the start of a line with the expected text of a round
+PROMPTS_OPTION = "prompts"
+LEADERBOARD_SIZE = 5            # How many trainees are shown on the leaderboard
+LEADERBOARD_ROUNDS = 5          # Each trainee is shown the leaderboard every this many rounds
+LEADERBOARD_INTERVAL = 5.0      # Seconds between printing the leaderboard on the server's console, when it changed
+WATCH_INTERVAL = 1.0            # Seconds between taking updates of the mapping files
+
+
+class ClientStream:
+    '''A stream that sends text to a client, so that a TerminalRenderer can draw the client's rounds.'''
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, text):
+        self.writer.write(text.encode('utf-8'))
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class SocketKeySource:
+    '''Feed a KeyFramer from a client connection, in the same way as the key sources of "async_practice.py". Each read is stamped as it arrives.'''
+    def __init__(self, reader, keyframer):
+        self.reader = reader
+        self.keyframer = keyframer
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+    async def wait(self, timeout):
+        '''Wait until more keys have arrived, or the timeout (in seconds, or None). Returns False if it timed out.'''
+        try:
+            data = await asyncio.wait_for(self.reader.read(4096), self.keyframer.escape_timeout(timeout))
+        except asyncio.TimeoutError:
+            return self.keyframer.flush_escape()
+        if not data:
+            raise EOFError("The client has disconnected")
+        self.keyframer.feed(self.decoder.decode(data), time.monotonic_ns())
+        return True
+
+    def start_round(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Trainee:
+    '''One connected person: their name, their practice session, and which version of the mappings their session uses.'''
+    def __init__(self, name, session, generation):
+        self.name = name
+        self.session = session
+        self.generation = generation
+        self.connected = True
+        self.roundsShown = 0
+
+    def leaderboard_row(self):
+        '''Sort key for the leaderboard: the most correct rounds first, then the fastest speed.'''
+        speed = self.session.averagedSpeed if self.session.averagedSpeed >= 0 else float('inf')
+        return (-self.session.tallyCorrect, speed)
+
+
+class PracticeServer:
+    '''
+    The mappings, which are loaded & watched once for everyone, and the sessions of all the connected trainees.
+    Of the trainees that have left, only the best few are kept for the leaderboard, so a long-running server doesn't keep every session.
+    options: the parsed command-line args (the same mapping & prompt options as "practice_mappings.py").
+    '''
+    def __init__(self, options, combo, customWeights):
+        self.options = options
+        self.combo = combo
+        self.customWeights = customWeights
+        self.sources = mapping_sources(options.dragonfly)
+        mapsByFile = {}
+        loadedMaps = load_mappings(self.sources, use_cache=not options.no_cache, maps_by_file=mapsByFile)
+        (self.letterMap, self.letterWeights) = build_letter_list(loadedMaps, options, customWeights)
+        self.generation = 0         # Goes up each time the mappings are reloaded
+        self.mappingMessages = []   # What happened at the last reload, shown to each trainee when they get the new mappings
+        self.watcher = None
+        if not options.no_watch:
+            self.watcher = MappingWatcher(self.sources, mapsByFile)
+        self.trainees = []          # The connected trainees
+        self.departed = []          # The best LEADERBOARD_SIZE trainees that have left
+        self.joined = 0             # How many trainees have connected so far
+        self.leaderboardChanged = False
+
+    def new_session(self):
+        # Each trainee gets their own random generator. With "--random_seed", trainee n gets seed + n, so the whole group is repeatable.
+        seed = None
+        if self.options.random_seed is not None:
+            seed = self.options.random_seed + self.joined
+        return PracticeSession(self.letterMap, self.letterWeights, self.options, self.combo, rng=random.Random(seed))
+
+    async def watch_mappings(self):
+        '''Take the reloaded mappings from the watcher's thread, so every trainee's session can swap them in between their rounds.'''
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            (newMaps, messages) = self.watcher.take_update()
+            messages = list(messages)
+            if newMaps is not None:
+                # Any warnings also go to the trainees with the reload messages, rather than only to the server's console.
+                (newLetterMap, newLetterWeights) = build_letter_list(newMaps, self.options, self.customWeights, warnings=messages)
+            for message in messages:
+                print(message)
+            if newMaps is not None:
+                if len(newLetterMap) > 0 and sum(newLetterWeights) > 0.0:
+                    (self.letterMap, self.letterWeights) = (newLetterMap, newLetterWeights)
+                    self.generation += 1
+                    self.mappingMessages = messages
+
+    async def print_leaderboard(self):
+        while True:
+            await asyncio.sleep(LEADERBOARD_INTERVAL)
+            if self.leaderboardChanged:
+                self.leaderboardChanged = False
+                for line in self.leaderboard_lines(len(self.trainees) + len(self.departed)):
+                    print(line)
+
+    def leaderboard_lines(self, count=LEADERBOARD_SIZE):
+        trainees = sorted(self.trainees + self.departed, key=Trainee.leaderboard_row)[:count]
+        if len(trainees) == 0:
+            return []
+        lines = ["Leaderboard:"]
+        for (rank, trainee) in enumerate(trainees):
+            session = trainee.session
+            speed = "%.2f s/key" % session.averagedSpeed if session.averagedSpeed >= 0 else "-"
+            lines.append("  %2d. %-16s %4d correct %4d wrong  %5.1f%% CER  %s%s" % (rank + 1, trainee.name[:16], session.tallyCorrect, session.tallyWrong,
+                         session.char_error_rate(), speed, "" if trainee.connected else "  (left)"))
+        return lines
+
+    async def handle_client(self, reader, writer):
+        '''Run one trainee's practice session over their connection.'''
+        try:
+            hello = (await reader.readline()).decode('utf-8', 'replace').rstrip("\r\n").split("\t")
+        except (ConnectionError, ValueError):
+            writer.close()
+            return
+        name = hello[0].strip() or "trainee %d" % (self.joined + 1)
+        sendPrompts = PROMPTS_OPTION in hello[1:]
+        trainee = Trainee(name, self.new_session(), self.generation)
+        self.joined += 1
+        self.trainees.append(trainee)
+        print("%s joined, %d trainees connected." % (name, len(self.trainees)))
+
+        keyframer = KeyFramer(None)
+        renderer = TerminalRenderer(ClientStream(writer), inPlace=False)
+        renderer.write("Welcome %s! Press the %d shown keys as fast as you can, using either a speech recognition engine or a physical keyboard!\n" % (name, self.combo))
+
+        # Between the trainee's rounds: swap in reloaded mappings, and show the leaderboard every few rounds.
+        def before_round():
+            lines = []
+            if trainee.generation != self.generation:
+                trainee.session.set_mappings(self.letterMap, self.letterWeights)
+                trainee.generation = self.generation
+                lines.extend(self.mappingMessages + [""])
+            self.leaderboardChanged = self.leaderboardChanged or trainee.session.rounds_played() > 0
+            if trainee.session.rounds_played() >= trainee.roundsShown + LEADERBOARD_ROUNDS:
+                trainee.roundsShown = trainee.session.rounds_played()
+                lines.extend(self.leaderboard_lines() + [""])
+            return lines
+
+        def show_prompt(truth):
+            writer.write((PROMPT_MARKER + truth + "\n").encode('utf-8'))
+
+        try:
+            await practice_loop(trainee.session, None, keyframer, renderer, self.options.time_limit, before_round,
+                                show_prompt if sendPrompts else None, self.options.rounds, SocketKeySource(reader, keyframer))
+            renderer.write("".join([line + "\n" for line in [""] + trainee.session.summary_lines() + [""] + self.leaderboard_lines()]))
+            await writer.drain()
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            trainee.connected = False
+            self.trainees.remove(trainee)
+            self.departed = sorted(self.departed + [trainee], key=Trainee.leaderboard_row)[:LEADERBOARD_SIZE]
+            self.leaderboardChanged = True
+            print("%s left after %d rounds." % (name, trainee.session.rounds_played()))
+            writer.close()
+
+    async def serve(self, host, port, unixPath=None):
+        if unixPath:
+            server = await asyncio.start_unix_server(self.handle_client, unixPath)
+            print("Listening on", unixPath)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+            print("Listening on %s port %d" % (host, port))
+        tasks = [asyncio.ensure_future(self.print_leaderboard())]
+        if self.watcher is not None:
+            tasks.append(asyncio.ensure_future(self.watch_mappings()))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if unixPath:
+                try:
+                    os.remove(unixPath)
+                except OSError:
+                    pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage='%(prog)s [options] [combo_length]', description='Run group practice sessions for many trainees at once, that connect with "practice_client.py". With "--random_seed", trainee n follows the sequence of the seed + n.')
+    parser.add_argument('combo_length', type=int, nargs='?', default=3, help='How many characters each trainee will try to say at the same time. Default is 3.')
+    add_prompt_options(parser, words=False)
+    parser.add_argument('--no_watch', action='store_true', help="Don't reload the mapping files when they change. Default is to watch them, and give everyone the new mappings.")
+    parser.add_argument('--rounds', type=int, default=0, help='End each session after this many rounds. Default is 0, to keep going until the trainee disconnects.')
+    parser.add_argument('-t', '--time_limit', type=float, default=0.0, metavar='SECONDS', help='Time limit for each round, after which it counts as a miss. Default is 0 (no limit).')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on. Default is 127.0.0.1 (only this computer).')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port to listen on. Default is %d.' % DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='SOCKET_PATH', help='Listen on a Unix socket instead of TCP.')
+    args = parser.parse_args()
+
+    customWeights = parse_custom_weights(parser, args)
+
+    server = PracticeServer(args, args.combo_length, customWeights)
+    check_total_weight(parser, server.letterWeights)
+    print("Loaded %d keys for combos of %d." % (len(server.letterMap), args.combo_length))
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print()
+    for line in server.leaderboard_lines(len(server.trainees) + len(server.departed)):
+        print(line)
@@ -0,0 +1,491 @@
+# coding: utf-8
+# The state & rules of one practice session: which (phrase, character) pairs get practiced, how each round's prompt is chosen,
+# and how the typed answer is scored. Shared by the normal terminal loop and the asyncio loop of "practice_mappings.py".
+
+from __future__ import print_function
+
+import json
+import time
+import random
+import operator
+import collections
+
+from weighted_sampler import AliasSampler, load_weights_file, parse_weight_args
+from drill_scheduler import AdaptiveScheduler
+from latency_stats import LatencyStats
+from scoring import align, ConfusionMatrix
+from confusability import build_confusability_index
+from mappings import talon_sources, dragonfly_sources
+
+crucialMap = {
+    "space":    " ",
+    "dot":      ".",
+}
+numberMap = {
+    "zero":     "0",
+    "one":      "1",
+    "two":      "2",
+    "three":    "3",
+    "four":     "4",
+    "five":     "5",
+    "six":      "6",
+    "seven":    "7",
+    "eight":    "8",
+    "nine":     "9",
+}
+
+# How many rounds are generated ahead of time. Adaptive sessions only generate the next round, after the previous one was scored,
+# since the choice of keys depends on the latest results.
+PROMPT_BUFFER_SIZE = 16
+
+
+# Return the list of mapping sources to load, for Dragonfly mode or Talon mode.
+def mapping_sources(dragonfly):
+    if dragonfly:
+        # Load the "letterMap" dictionary from the "lettermap.py" file that's in the MacroSystem folder.
+        # Make sure you adjust this path to where it's located on your machine, relative to this script.
+        # Also potentially include symbols, not just alphabet letters, using the long version of punctuation characters
+        # in "punctuationmap.py", that are slower but more reliable, hence good for general use at any time.
+        return dragonfly_sources(['../MacroSystem'])
+
+    # Talon filenames. You can use "~" to refer to the Talon user folder.
+    CSV_filename = "~/.talon/user/knausj_talon/settings/alphabet.csv"
+    keys_filename = "~/.talon/user/knausj_talon/core/keys/keys.py"
+
+    # Note that we aren't importing the keys.py file directly, because that would require importing talon, which requires integration.
+    return talon_sources(CSV_filename, keys_filename)
+
+# Add the options that choose the keys and how each round is picked to an argparse parser. They're shared by "practice_mappings.py",
+# "practice_server.py" and "batch_score.py", since the same rounds can only be rebuilt from exactly the same options.
+# words: also add the options of the word drill mode.
+def add_prompt_options(parser, words=True):
+    parser.add_argument('-d', '--dragonfly', action='store_true', help='Use Dragonfly mode ("lettermap.py" + "punctuationmap.py"). Default is Talon mode.')
+    parser.add_argument('-a', '--alphabetical', action='store_true', help='Sort the characters alphabetically. Default is random (ie: unsorted).')
+    parser.add_argument('-s', '--symbols', action='store_true', help='Include some symbols in the mix. Default is just alphabet letters, not symbols.')
+    parser.add_argument('-n', '--no_numbers', action='store_true', help='Skip numerals, only use letters (and possibly symbols). Default is to include numbers.')
+    parser.add_argument('-c', '--no_crucial', action='store_true', help='Skip crucial symbols (commas and spaces). Default is to include crucial symbols.')
+    parser.add_argument('-p', '--capitals_percentage', type=int, default=0, help='Percentage of characters that will be a capital letter. Default is 0.')
+    parser.add_argument('-r', '--random_seed', type=int, help='Allows following a determinstic sequence of random values. Default is the system timer.')
+    parser.add_argument('-w', '--weight', action='append', metavar='KEY=WEIGHT', help='How often a key is chosen relative to others, by its phrase or character, eg: "dozen=3" or "?=0.5". Can be given multiple times.')
+    parser.add_argument('--weights_file', help='CSV file of "phrase or character,weight" lines, with the same meaning as "--weight".')
+    parser.add_argument('--adaptive', action='store_true', help='Show the slowest and most often wrong keys more often, based on the results so far. Default is to only use the weights.')
+    parser.add_argument('--no_cache', action='store_true', help='Always parse the mapping files, instead of using the compiled snapshot beside them when they have not changed.')
+    if words:
+        parser.add_argument('--vocabulary', action='append', metavar='FILE', help='Drill whole words & phrases from a vocabulary file (".talon-list", Talon ".csv", Dragonfly ".py", or one word per line) instead of single characters. Can be given multiple times.')
+        parser.add_argument('--vocabulary_prefix', metavar='PREFIX', help='Only drill the vocabulary entries whose spoken form starts with this prefix.')
+        parser.add_argument('--confusable', action='store_true', help='Fill each combo with keys or words that sound like its first one, to drill the ones a speech recognizer is likely to confuse.')
+    else:
+        parser.set_defaults(vocabulary=None, vocabulary_prefix=None, confusable=False)
+
+# Return the custom weights of the parsed options, from "--weights_file" and then "--weight", as a dictionary of {phrase or character: weight}.
+# A malformed weight or a weights file that can't be read is reported through the parser, which exits.
+def parse_custom_weights(parser, args):
+    customWeights = {}
+    try:
+        if args.weights_file:
+            customWeights.update(load_weights_file(args.weights_file))
+        customWeights.update(parse_weight_args(args.weight))
+    except ValueError as e:
+        parser.error(str(e))
+    except OSError as e:
+        parser.error("Can't read the weights file: %s" % e)
+    return customWeights
+
+# Report through the parser (which exits) if none of the keys can be chosen, such as when the custom weights set them all to 0.
+def check_total_weight(parser, letterWeights):
+    if sum(letterWeights) <= 0.0:
+        parser.error("At least 1 key needs a positive weight, but the weights of all %d keys are 0" % len(letterWeights))
+
+# Build the list of (phrase, character) pairs to practice, and the weight of each pair, from the loaded mapping dictionaries.
+# Each pair is only stored once, with a weight saying how often it should get chosen,
+# instead of duplicating entries in the list to make them more common.
+# options: the parsed command-line args of "practice_mappings.py" (uses no_numbers, no_crucial and symbols).
+# customWeights: dictionary of {phrase or character: weight} that override the default weights.
+# warnings: list to add any warnings to, such as when reloading during a session where printing would break the frame. They're printed if it's None.
+def build_letter_list(loadedMaps, options, customWeights={}, warnings=None):
+    letterMap = []
+    letterWeights = []
+    letterIndex = {}
+
+    # Add a list of (phrase, character) pairs to the letterMap list with the given weight.
+    # If a pair is already in the list (eg: "dot" is both a crucial symbol and a punctuation symbol), its weights are added together.
+    def add_weighted_pairs(pairs, weight):
+        for pair in pairs:
+            if pair in letterIndex:
+                letterWeights[letterIndex[pair]] += weight
+            else:
+                letterIndex[pair] = len(letterMap)
+                letterMap.append(pair)
+                letterWeights.append(weight)
+
+    # Sort the dictionary alphabetically, to allow showing characters in alphabetical order if desired.
+    add_weighted_pairs(sorted(loadedMaps.get("letterMap", {}).items(), key=operator.itemgetter(1)), 1.0)
+    if not options.no_numbers:
+        numbersAsList = sorted(numberMap.items(), key=operator.itemgetter(1))
+        add_weighted_pairs(numbersAsList, 1.0)
+    # Give the crucial list double weight, so they will get chosen more often than other symbols.
+    if not options.no_crucial:
+        crucialAsList = sorted(crucialMap.items(), key=operator.itemgetter(1))
+        add_weighted_pairs(crucialAsList, 2.0)
+
+    # Possibly include symbols in addition to letters.
+    if options.symbols:
+        # Double the weight of the main characters, so they will get chosen more often than the other symbols.
+        for i in range(len(letterWeights)):
+            letterWeights[i] = 2.0 * letterWeights[i]
+        # Other symbols
+        longPunctuationMap = loadedMaps.get("longPunctuationMap", {})
+        if len(longPunctuationMap) > 0:
+            symbolsAsList = sorted(longPunctuationMap.items(), key=operator.itemgetter(1))
+            add_weighted_pairs(symbolsAsList, 1.0)
+            #print("SYMBOLS", symbolsAsList)
+            #print("LETTERMAP", letterMap)
+        elif warnings is None:
+            print("Warning: Couldn't find extra symbol files")
+        else:
+            warnings.append("Warning: Couldn't find extra symbol files")
+
+    # Apply any custom weights. They can refer to either the phrase or the character.
+    for (i, (word, char)) in enumerate(letterMap):
+        if word in customWeights:
+            letterWeights[i] = customWeights[word]
+        elif char in customWeights:
+            letterWeights[i] = customWeights[char]
+
+    return (letterMap, letterWeights)
+
+# Return the weight of each entry of a vocabulary (or any letterMap), which is 1 unless customWeights says otherwise.
+# Only looks at each entry when there are custom weights, so huge vocabularies start quickly.
+def build_vocabulary_weights(letterMap, customWeights={}):
+    letterWeights = [1.0] * len(letterMap)
+    if len(customWeights) > 0:
+        for i in range(len(letterMap)):
+            (word, written) = letterMap[i]
+            if word in customWeights:
+                letterWeights[i] = customWeights[word]
+            elif written in customWeights:
+                letterWeights[i] = customWeights[written]
+    return letterWeights
+
+# Split the nanosecond timestamps of a round into the time until the first key arrived, the gaps between the following keys, and the total time.
+# All 3 are returned in seconds.
+def split_key_times(timeStart, keyTimes):
+    firstKeySeconds = (keyTimes[0] - timeStart) / 1e9
+    gapSeconds = [(keyTimes[i] - keyTimes[i-1]) / 1e9 for i in range(1, len(keyTimes))]
+    totalSeconds = (keyTimes[-1] - timeStart) / 1e9
+    return (firstKeySeconds, gapSeconds, totalSeconds)
+
+
+class Prompt:
+    '''
+    The keys shown in one round: the characters, their phrases, their indices into letterMap, their (phrase, character) pairs
+    from letterMap (before any capitalization), and the whole expected text.
+    In the word drill mode each "character" is a whole written word, and the words are joined by the separator.
+    expected: the list of single characters that should be typed, and spans: the (start, end) range of each key within it.
+    '''
+    def __init__(self, chars, words, indices, keys, separator=""):
+        self.chars = chars
+        self.words = words
+        self.indices = indices
+        self.keys = keys
+        self.separator = separator
+        self.truth = separator.join(chars)
+        self.expected = list(self.truth)
+        self.spans = []
+        start = 0
+        for char in chars:
+            self.spans.append((start, start + len(char)))
+            start += len(char) + len(separator)
+        # Build the displayed text now, so that it's ready to print as soon as the round starts.
+        self.text = self.truth + "                                        " + "".join([word + "  " for word in words])
+
+    def line(self):
+        '''The text shown to the user: all the characters on a single line, then their phrases.'''
+        return self.text
+
+
+# Save prompts to a drill file, with one JSON line per round, so that exactly the same rounds can be practiced again later.
+def save_drill(filename, prompts):
+    with open(filename, 'w', encoding='utf-8') as f:
+        for prompt in prompts:
+            f.write(json.dumps({"chars": prompt.chars, "words": prompt.words, "keys": prompt.keys, "separator": prompt.separator}) + "\n")
+
+# Load the rounds of a drill file, as a list of Prompt objects. Their letterMap indices are filled in by PracticeSession.use_drill().
+def load_drill(filename):
+    prompts = []
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                keys = [tuple(key) for key in item["keys"]]
+                prompts.append(Prompt(item["chars"], item["words"], [None] * len(keys), keys, item.get("separator", "")))
+    return prompts
+
+
+class PracticeSession:
+    '''
+    One person's practice session: the letterMap, how keys get picked, and the running tallies & speed.
+    options: the parsed command-line args of "practice_mappings.py" (uses alphabetical, capitals_percentage and adaptive).
+    rng: the random generator for picking keys, so that "--random_seed" gives a deterministic sequence.
+    statsStore: an optional StatsStore, to save the results of each key across sessions.
+    journal: an optional JournalWriter, to record every prompt, keystroke & result of this session.
+    separator: text typed between the keys of a round, such as a space between the words of the word drill mode.
+    confusabilityCache: cache file of the confusability index, used when options.confusable is set. None to not cache it.
+    '''
+    def __init__(self, letterMap, letterWeights, options, combo=3, rng=random, statsStore=None, journal=None, separator="", confusabilityCache=None):
+        self.options = options
+        self.separator = separator
+        self.confusabilityCache = confusabilityCache
+        self.confusability = None
+        self.phraseIndices = {}
+        self.statsStore = statsStore
+        self.journal = journal
+        self.combo = combo
+        self.rng = rng
+        self.tallyCorrect = 0
+        self.tallyWrong = 0
+        self.averagedSpeed = -1    # Initialize with the first measurement
+        self.nextAlphabet = 0
+        self.latencyStats = LatencyStats()
+        # Character-level errors from aligning each answer against its prompt, and what was typed for each mapping.
+        self.charErrors = 0
+        self.charCount = 0
+        self.substitutions = 0
+        self.insertions = 0
+        self.deletions = 0
+        self.confusions = ConfusionMatrix()
+        self.letterMap = []
+        self.letterSampler = None
+        # Rounds that were generated ahead of time, and where they come from: a seeded generator, or the rounds of a drill file.
+        self.pendingPrompts = collections.deque()
+        self.bufferSize = 1 if options.adaptive else PROMPT_BUFFER_SIZE
+        self.drillPrompts = None
+        self.promptSource = self.generate_prompts()
+        self.set_mappings(letterMap, letterWeights)
+
+    def set_mappings(self, letterMap, letterWeights):
+        '''Use a new letterMap, such as after the mapping files were changed, keeping the tallies and speeds.'''
+        self.letterMap = letterMap
+        if self.options.adaptive:
+            if self.letterSampler is None:
+                self.letterSampler = AdaptiveScheduler(letterMap, letterWeights, self.rng)
+            else:
+                self.letterSampler.set_keys(letterMap, letterWeights)
+        else:
+            self.letterSampler = AliasSampler(letterWeights, self.rng)
+        if self.nextAlphabet >= len(letterMap):
+            self.nextAlphabet = 0
+        if self.options.confusable:
+            # Only the phrases that are new or lost a neighbour get compared again, the rest comes from the cache.
+            self.phraseIndices = collections.defaultdict(list)
+            for (i, (phrase, char)) in enumerate(letterMap):
+                self.phraseIndices[phrase.lower()].append(i)
+            self.confusability = build_confusability_index(list(self.phraseIndices), self.confusabilityCache)
+        if self.drillPrompts is None:
+            # Rounds generated from the old mappings might use keys that were just removed or changed.
+            self.pendingPrompts.clear()
+        else:
+            self.resolve_drill_indices(self.pendingPrompts)
+
+    def use_drill(self, prompts):
+        '''Play the given list of prompts (such as from load_drill()) instead of picking random keys.'''
+        self.drillPrompts = prompts
+        self.resolve_drill_indices(prompts)
+        self.pendingPrompts.clear()
+        self.promptSource = iter(prompts)
+
+    def resolve_drill_indices(self, prompts):
+        '''Look up the letterMap index of each key of the drill rounds, or None for keys that aren't in the current mappings.'''
+        letterIndex = dict([(key, i) for (i, key) in enumerate(self.letterMap)])
+        for prompt in prompts:
+            prompt.indices = [letterIndex.get(key) for key in prompt.keys]
+
+    def rounds_played(self):
+        return self.tallyCorrect + self.tallyWrong
+
+    def pick_confusable(self, phrase, usedPhrases):
+        '''Return the letterMap index of a phrase that is easily confused with the given phrase, picked by similarity, or None if there's none.'''
+        neighbours = [(other, score) for (other, score) in self.confusability.neighbours_of(phrase.lower()) if other not in usedPhrases]
+        if len(neighbours) == 0:
+            return None
+        x = self.rng.random() * sum([score for (other, score) in neighbours])
+        for (other, score) in neighbours:
+            x -= score
+            if x < 0.0:
+                break
+        return self.rng.choice(self.phraseIndices[other])
+
+    def make_prompt(self):
+        '''Pick the keys for the next round.'''
+        chars = []
+        words = []
+        indices = []
+        keys = []
+        for i in range(self.combo):
+            if self.options.alphabetical:
+                r = self.nextAlphabet         # Pick the next letter
+                self.nextAlphabet = self.nextAlphabet + 1
+                if self.nextAlphabet >= len(self.letterMap):
+                    self.nextAlphabet = 0
+            else:
+                r = None
+                if self.confusability is not None and i > 0:
+                    # Confusable drill: the rest of the combo sounds like its first key.
+                    r = self.pick_confusable(keys[0][0], set([key[0].lower() for key in keys]))
+                if r is None:
+                    r = self.letterSampler.draw()    # Pick a random letter, based on its weight (and how hard it has been so far, if adaptive)
+            (word, char) = self.letterMap[r]
+            if self.rng.randint(0, 100) < self.options.capitals_percentage:    # Occasionally use a capital letter
+                char = char.upper()
+                word = word.upper()
+            #print("%25s %25s" % (word, char))
+            chars.append(char)
+            words.append(word)
+            indices.append(r)
+            keys.append(self.letterMap[r])
+        return Prompt(chars, words, indices, keys, self.separator)
+
+    def generate_prompts(self):
+        '''Generator of an endless series of rounds, following the session's random seed.'''
+        while True:
+            yield self.make_prompt()
+
+    def prefetch_prompts(self):
+        '''Generate rounds ahead of time, up to the buffer size. Called between rounds, right after scoring, so the next round is ready.'''
+        while len(self.pendingPrompts) < self.bufferSize:
+            prompt = next(self.promptSource, None)
+            if prompt is None:
+                break
+            self.pendingPrompts.append(prompt)
+
+    def next_prompt(self):
+        '''Return the next round's prompt, from the buffer of rounds generated ahead. Raises EOFError at the end of a drill file.'''
+        if len(self.pendingPrompts) == 0:
+            self.prefetch_prompts()
+            if len(self.pendingPrompts) == 0:
+                raise EOFError("The drill has no more rounds")
+        return self.pendingPrompts.popleft()
+
+    def key_results(self, prompt, alignment):
+        '''Return a list saying whether each key of the prompt was typed correctly, according to the alignment of the answer.'''
+        typedForExpected = alignment.typed_for_expected()
+        return [all([typedForExpected[j] == prompt.expected[j] for j in range(start, end)]) for (start, end) in prompt.spans]
+
+    def typed_for_keys(self, prompt, alignment):
+        '''Return what was typed for each key of the prompt, or None for a key that was missed completely.'''
+        typedForExpected = alignment.typed_for_expected()
+        typedForKeys = []
+        for (start, end) in prompt.spans:
+            typed = [typedForExpected[j] for j in range(start, end) if typedForExpected[j] is not None]
+            typedForKeys.append("".join(typed) if len(typed) > 0 else None)
+        return typedForKeys
+
+    def key_seconds(self, prompt, timeStart, keyTimes):
+        '''Latency of each key that was typed: from the previous key's last keystroke (or the prompt being shown) until its own last keystroke.'''
+        seconds = []
+        previous = timeStart
+        for (start, end) in prompt.spans:
+            if end > len(keyTimes):
+                break
+            seconds.append((keyTimes[end-1] - previous) / 1e9)
+            previous = keyTimes[end-1]
+        return seconds
+
+    def char_error_rate(self):
+        '''Percentage of expected characters that were substituted, deleted or had an extra character inserted.'''
+        return 100.0 * self.charErrors / float(self.charCount) if self.charCount > 0 else 0.0
+
+    def score_round(self, prompt, typedKeys, timeStart, keyTimes, timedOut=False):
+        '''
+        Score the typed answer of a round, updating the tallies & speed.
+        typedKeys: the list of keys that were typed.
+        timeStart & keyTimes are monotonic nanosecond timestamps of when the prompt was shown and when each key arrived.
+        timedOut: the round ran out of time, so it counts as a miss.
+        Returns (lines, statusLines): the lines of the result to keep on the screen, and the timing lines for the status region,
+        that only need to be shown until the next round is scored.
+        '''
+        lines = [""]
+        statusLines = []
+        truth = prompt.truth
+        typed = "".join(typedKeys)
+
+        # Align the answer against the prompt, to count the real substitutions, insertions & deletions instead of just right or wrong.
+        alignment = align(prompt.expected, typedKeys)
+        self.charErrors += alignment.errors()
+        self.charCount += alignment.expectedCount
+        self.substitutions += alignment.substitutions
+        self.insertions += alignment.insertions
+        self.deletions += alignment.deletions
+        # Count what was typed for each mapping. A correct key is counted as the mapping's own character, even if it was shown as a capital.
+        typedForKeys = self.typed_for_keys(prompt, alignment)
+        for i in range(len(prompt.keys)):
+            typedKey = typedForKeys[i]
+            if typedKey == prompt.chars[i]:
+                typedKey = prompt.keys[i][1]
+            self.confusions.add(prompt.keys[i], typedKey)
+        errorsText = "(%s)" % alignment.text()
+
+        if timedOut or len(keyTimes) == 0:
+            self.tallyWrong = self.tallyWrong+1
+            lines.append("### TIME UP! ###### " + " " + truth + " " + typed + " " + errorsText + " ############ Tally: %d correct, %d wrong, %.1f%% CER. ###################################" % (self.tallyCorrect, self.tallyWrong, self.char_error_rate()))
+            keySeconds = []
+        else:
+            (firstKeySeconds, gapSeconds, totalSeconds) = split_key_times(timeStart, keyTimes)
+            rawSpeed = totalSeconds / len(prompt.chars)
+            # Perform a running average alpha filter to smoothen the result but give more priority to recent results
+            if self.averagedSpeed < 0:
+                self.averagedSpeed = rawSpeed
+            alpha = 0.5    # The closer this is to 1.0, the stronger the filtering that will be applied.
+            self.averagedSpeed = ((1.0 - alpha) * rawSpeed) + (alpha * self.averagedSpeed)
+
+            if typed == truth:
+                self.tallyCorrect = self.tallyCorrect+1
+                comboErrorRate = 100.0 * (self.tallyWrong / float(self.tallyCorrect + self.tallyWrong))
+                lines.append("Correct.                                  Tally: %d correct = %.1f%% combo errors, %.1f%% CER. Speed: %.2f s/key" % (self.tallyCorrect, comboErrorRate, self.char_error_rate(), self.averagedSpeed))
+            else:
+                self.tallyWrong = self.tallyWrong+1
+                lines.append("### WRONG! ###### " + " " + truth + " " + typed + " " + errorsText + " ############ Tally: %d correct, %d wrong, %.1f%% CER. ###################################" % (self.tallyCorrect, self.tallyWrong, self.char_error_rate()))
+            keySeconds = self.key_seconds(prompt, timeStart, keyTimes)
+            # Keep streaming percentiles of the latency of each key, to find the keys with a slow tail rather than a slow average.
+            for i in range(min(len(prompt.keys), len(keySeconds))):
+                self.latencyStats.add(prompt.keys[i], keySeconds[i])
+            if prompt.separator:
+                gapSeconds = keySeconds[1:]     # Show the gaps between whole words, rather than between their letters
+            gapsText = " ".join(["%.3f" % gap for gap in gapSeconds])
+            statusLines.append("First key: %.3f s. Gaps: [%s] s. Total: %.3f s. Latency %s." % (firstKeySeconds, gapsText, totalSeconds, self.latencyStats.overall.text()))
+
+        keyResults = self.key_results(prompt, alignment)
+        if self.statsStore is not None:
+            # Save the results for the long-term statistics. This only queues them, the writing happens in the background.
+            for i in range(len(prompt.keys)):
+                self.statsStore.record_key(prompt.keys[i], keyResults[i], keySeconds[i] if i < len(keySeconds) else None)
+            self.statsStore.record_round((typed == truth) and not timedOut, (keyTimes[-1] - timeStart) / 1e9 if len(keyTimes) > 0 else None)
+        if self.journal is not None:
+            self.journal.write_round(self.rounds_played(), prompt, typedKeys, timeStart, keyTimes, time.monotonic_ns(),
+                                     (typed == truth) and not timedOut, timedOut, alignment)
+
+        if self.options.adaptive:
+            # Update the running error rate & latency of each key that was shown.
+            for i in range(len(prompt.indices)):
+                if prompt.indices[i] is not None:
+                    self.letterSampler.update(prompt.indices[i], keyResults[i], keySeconds[i] if i < len(keySeconds) else None)
+            if self.rounds_played() % 10 == 0:
+                hardestText = ", ".join(["%s (%.0f%% wrong, %.2f s)" % (word, 100.0 * stats.errorRate, stats.latency) for ((word, char), stats) in self.letterSampler.hardest(3)])
+                lines.append("Hardest keys so far: " + hardestText)
+        statusLines.append("")
+        return (lines, statusLines)
+
+    def summary_lines(self):
+        '''Lines of text for the end-of-session summary.'''
+        lines = ["Session: %d correct, %d wrong." % (self.tallyCorrect, self.tallyWrong)]
+        if self.charCount > 0:
+            lines.append("Character error rate: %.1f%% (%d substituted, %d inserted, %d deleted, out of %d characters)." % (
+                self.char_error_rate(), self.substitutions, self.insertions, self.deletions, self.charCount))
+        confusions = self.confusions.confusions()
+        if len(confusions) > 0:
+            lines.append("Most common confusions:")
+            for (count, (word, char), typedKey) in confusions[:10]:
+                typedText = "missed" if typedKey == ConfusionMatrix.MISSED else "typed as %r" % typedKey
+                lines.append("    %-20s %-4s %s, %d times" % (word, char, typedText, count))
+        lines.extend(self.latencyStats.summary_lines())
+        return lines
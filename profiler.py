@@ -0,0 +1,143 @@
+# coding: utf-8
+# Self-profiling, to show how much of each measured round is the program's own work rather than the person & the recognizer.
+# Each phase of each round (drawing the prompt, waiting for the terminal, reading it, scoring, ...) is recorded as a span of
+# monotonic nanosecond time, then exported as Chrome trace event JSON that can be opened in "https://ui.perfetto.dev" or
+# "chrome://tracing", with a summary of the tool's overhead compared to the time spent waiting for the person.
+#
+# Profiling is off unless start() was called. While it is off, span() returns a shared do-nothing span, so the instrumented code
+# costs about a function call per phase.
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import threading
+
+# Categories of spans.
+TOOL = "tool"       # The program's own work, such as drawing or scoring
+USER = "user"       # Waiting for the person & recognizer
+IO = "io"           # From the terminal waking us up to the keys being timestamped, which is part of the measured latencies
+IDLE = "idle"       # Waiting on purpose, such as for the schedule of a paced stress test
+ROUND = "round"     # A whole round, containing the other spans
+
+# The Profiler that is recording, or None when not profiling.
+active = None
+
+
+class Span:
+    '''Context manager that records one span into a Profiler, from when it's entered until it's exited.'''
+    def __init__(self, profiler, name, category):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, self.category, self.start, time.monotonic_ns())
+
+
+class NoSpan:
+    '''Context manager that does nothing, used while not profiling.'''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+NO_SPAN = NoSpan()
+
+
+class Profiler:
+    '''
+    The recorded spans: a list of (name, category, start, end, thread id), with monotonic nanosecond times.
+    Appending to a list is atomic in CPython, so background threads (such as the journal writer) can record spans too.
+    '''
+    def __init__(self):
+        self.spans = []
+        self.origin = time.monotonic_ns()
+        self.threadNames = {}
+
+    def add(self, name, category, start, end):
+        thread = threading.current_thread()
+        self.threadNames[thread.ident] = thread.name
+        self.spans.append((name, category, start, end, thread.ident))
+
+    def span(self, name, category=TOOL):
+        return Span(self, name, category)
+
+    def trace_events(self):
+        '''Return the spans as a list of Chrome trace events, with times in microseconds since profiling started.'''
+        pid = os.getpid()
+        events = []
+        for (threadId, threadName) in self.threadNames.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": threadId, "args": {"name": threadName}})
+        for (name, category, start, end, threadId) in self.spans:
+            events.append({"name": name, "cat": category, "ph": "X", "pid": pid, "tid": threadId,
+                           "ts": (start - self.origin) / 1e3, "dur": (end - start) / 1e3})
+        return events
+
+    def write_trace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+
+    def totals(self):
+        '''Return {(category, name): (count, total ns, max ns)} of the spans.'''
+        totals = {}
+        for (name, category, start, end, threadId) in self.spans:
+            (count, total, maximum) = totals.get((category, name), (0, 0, 0))
+            totals[(category, name)] = (count + 1, total + end - start, max(maximum, end - start))
+        return totals
+
+    def summary_lines(self, meanKeySeconds=float('nan')):
+        '''
+        Lines of text with the time of each phase, and the tool's overhead compared to the time spent waiting for the person.
+        meanKeySeconds: the mean measured key latency, to compare the terminal read overhead with.
+        '''
+        if len(self.spans) == 0:
+            return []
+        sessionNs = max([end for (name, category, start, end, threadId) in self.spans]) - self.origin
+        lines = ["%-24s %-6s %7s %11s %10s %10s" % ("Phase", "Kind", "Count", "Total ms", "Mean us", "Max us")]
+        totals = self.totals()
+        categoryTotals = {}
+        for ((category, name), (count, total, maximum)) in sorted(totals.items(), key=lambda item: item[1][1], reverse=True):
+            if category != ROUND:
+                categoryTotals[category] = categoryTotals.get(category, 0) + total
+            lines.append("%-24s %-6s %7d %11.2f %10.1f %10.1f" % (name, category, count, total / 1e6, total / 1e3 / count, maximum / 1e3))
+        toolNs = categoryTotals.get(TOOL, 0) + categoryTotals.get(IO, 0)
+        userNs = categoryTotals.get(USER, 0)
+        lines.append("Tool work: %.1f ms (%.2f%% of the %.1f s session). Waiting for the person & recognizer: %.1f s (%.2f%%)." % (
+            toolNs / 1e6, 100.0 * toolNs / max(sessionNs, 1), sessionNs / 1e9, userNs / 1e9, 100.0 * userNs / max(sessionNs, 1)))
+        reads = [span for span in self.spans if span[1] == IO]
+        if len(reads) > 0:
+            readNs = [end - start for (name, category, start, end, threadId) in reads]
+            meanReadNs = sum(readNs) / float(len(readNs))
+            text = "Inside the measured latencies: %.1f us per terminal read from wakeup to timestamp (max %.1f us)" % (meanReadNs / 1e3, max(readNs) / 1e3)
+            if meanKeySeconds > 0:      # Also False for NaN
+                text += ", %.3f%% of the mean key latency" % (100.0 * meanReadNs / (meanKeySeconds * 1e9))
+            lines.append(text + ".")
+        else:
+            lines.append("Inside the measured latencies: no terminal reads (the keys came from a scripted or synthetic reader).")
+        return lines
+
+
+# Start recording spans. Returns the new active Profiler.
+def start():
+    global active
+    active = Profiler()
+    return active
+
+# Return a context manager that records a span of the given phase, or does nothing when not profiling.
+def span(name, category=TOOL):
+    if active is None:
+        return NO_SPAN
+    return active.span(name, category)
+
+# Record a span that was timed elsewhere (such as around a syscall), if profiling.
+def add_span(name, category, start, end):
+    if active is not None:
+        active.add(name, category, start, end)
@@ -0,0 +1,128 @@
+# coding: utf-8
+# Alignment-based scoring of a typed answer against the expected keys, using the edit distance (Levenshtein) alignment.
+# This gives the real substitution, insertion & deletion counts and a character error rate, instead of just right or wrong,
+# and a confusion matrix of which keys the recognizer typed for each mapping (eg: "dozen" recognized as "t").
+
+from __future__ import print_function
+
+import collections
+
+# Operations in an alignment
+MATCH = "="
+SUBSTITUTION = "S"
+INSERTION = "I"
+DELETION = "D"
+
+
+class Alignment:
+    '''
+    The alignment of a typed answer against the expected keys.
+    ops: list of (operation, expected key or None, typed key or None), in order.
+    '''
+    def __init__(self, ops):
+        self.ops = ops
+        self.substitutions = sum([1 for op in ops if op[0] == SUBSTITUTION])
+        self.insertions = sum([1 for op in ops if op[0] == INSERTION])
+        self.deletions = sum([1 for op in ops if op[0] == DELETION])
+        self.expectedCount = sum([1 for op in ops if op[0] != INSERTION])
+
+    def errors(self):
+        return self.substitutions + self.insertions + self.deletions
+
+    def error_rate(self):
+        '''Character error rate, as a fraction of the number of expected keys.'''
+        return self.errors() / float(self.expectedCount) if self.expectedCount > 0 else 0.0
+
+    def typed_for_expected(self):
+        '''Return a list with what was typed for each expected key in order: the typed key, or None if it was deleted.'''
+        return [typed for (op, expected, typed) in self.ops if op != INSERTION]
+
+    def text(self):
+        '''Short description such as "1 substituted, 0 inserted, 1 deleted".'''
+        return "%d substituted, %d inserted, %d deleted" % (self.substitutions, self.insertions, self.deletions)
+
+
+# Align the typed keys against the expected keys with the minimum number of edits.
+# Both are sequences of keys (usually single characters). When there are several equally good alignments,
+# substitutions are preferred over a deletion + insertion pair.
+def align(expected, typed):
+    n = len(expected)
+    m = len(typed)
+    # cost[i][j] = edit distance between expected[:i] and typed[:j]
+    cost = [[0] * (m + 1) for i in range(n + 1)]
+    for i in range(1, n + 1):
+        cost[i][0] = i
+    for j in range(1, m + 1):
+        cost[0][j] = j
+    for i in range(1, n + 1):
+        row = cost[i]
+        previousRow = cost[i-1]
+        for j in range(1, m + 1):
+            diagonal = previousRow[j-1] + (0 if expected[i-1] == typed[j-1] else 1)
+            row[j] = min(diagonal, previousRow[j] + 1, row[j-1] + 1)
+
+    # Trace back from the end to find which edits were used.
+    ops = []
+    i = n
+    j = m
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and cost[i][j] == cost[i-1][j-1] + (0 if expected[i-1] == typed[j-1] else 1):
+            ops.append((MATCH if expected[i-1] == typed[j-1] else SUBSTITUTION, expected[i-1], typed[j-1]))
+            i -= 1
+            j -= 1
+        elif i > 0 and cost[i][j] == cost[i-1][j] + 1:
+            ops.append((DELETION, expected[i-1], None))
+            i -= 1
+        else:
+            ops.append((INSERTION, None, typed[j-1]))
+            j -= 1
+    ops.reverse()
+    return Alignment(ops)
+
+
+class ConfusionMatrix:
+    '''
+    Counts of what was typed for each expected mapping, with an empty string for a key that was missed.
+    Stored sparsely, as a Counter of the typed keys of each mapping (eg: ("dozen", "d")), so memory only grows with the number of
+    different (mapping, typed key) pairs that really happened, even when a word drill gets thousands of different wrong answers.
+    maxPerRow: if given, only this many different typed keys are kept for each mapping, and any others are counted together as OTHER.
+    '''
+    MISSED = ""
+    OTHER = ("other",)     # Not a string, so it can't be the same as a typed key
+
+    def __init__(self, maxPerRow=None):
+        self.rows = {}      # {mapping: Counter of {typed key: count}}
+        self.maxPerRow = maxPerRow
+
+    def add(self, mapping, typed, count=1):
+        '''Count that "typed" (or MISSED) was typed for the given mapping.'''
+        row = self.rows.get(mapping)
+        if row is None:
+            row = self.rows[mapping] = collections.Counter()
+        if typed is None:
+            typed = self.MISSED
+        if self.maxPerRow is not None and typed not in row and len(row) >= self.maxPerRow:
+            typed = self.OTHER
+        row[typed] += count
+
+    def count(self, mapping, typed):
+        row = self.rows.get(mapping)
+        return row[typed] if row is not None else 0
+
+    def row(self, mapping):
+        '''Return a dictionary of {typed key: count} for one mapping.'''
+        return dict(self.rows.get(mapping, {}))
+
+    def confusions(self, expectedChar=lambda mapping: mapping[1]):
+        '''
+        Return a list of (count, mapping, typed key) for every way that a mapping was typed wrongly, most common first.
+        expectedChar: function giving the correct key of a mapping, so that correct entries can be skipped.
+        '''
+        result = []
+        for (mapping, row) in self.rows.items():
+            correct = expectedChar(mapping)
+            for (typed, count) in row.items():
+                if count > 0 and typed != correct:
+                    result.append((count, mapping, typed))
+        result.sort(key=lambda item: item[0], reverse=True)
+        return result
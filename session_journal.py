@@ -0,0 +1,264 @@
+# coding: utf-8
+# Append-only binary journal of a practice session: every prompt, every keystroke with its timestamp, and every result,
+# stored as fixed-size 32 byte records. Records are appended to an in-memory buffer that a background thread writes to disk,
+# so the game loop never waits for the disk. Journals are read back by memory-mapping them, without copying the records.
+#
+# Each record is: type (1 byte), padding (1 byte), length (2 bytes), round number (4 bytes), time in nanoseconds (8 bytes), data (16 bytes).
+# Text longer than 16 bytes of UTF-8 continues in the data of the following CONTINUATION records, and "length" is the total byte length.
+
+from __future__ import print_function
+
+import os
+import sys
+import mmap
+import time
+import struct
+import threading
+
+import profiler
+
+RECORD = struct.Struct("<BxHIq16s")
+RECORD_SIZE = RECORD.size      # 32 bytes
+DATA_SIZE = 16
+
+JOURNAL_VERSION = 2         # Version 2 added the SPAN records
+JOURNAL_MAGIC = b"PRACTICEJOURNAL"
+JOURNAL_EXTENSION = ".psj"
+
+# Record types
+HEADER = 0          # round = journal version, time = wall clock (time.time_ns()) at the start, data = JOURNAL_MAGIC
+PROMPT = 1          # time = monotonic time the prompt was shown, data = the expected text
+WORD = 2            # time = same as the prompt, data = the phrase of one key of the prompt, in order
+KEY = 3             # time = monotonic time the key arrived, data = the key's text
+RESULT = 4          # time = monotonic time the round was scored, data = RESULT_DATA
+NOTE = 5            # time = wall clock, data = free text, such as the command-line options of the session
+CONTINUATION = 6    # data = more of the text of the previous record
+SPAN = 7            # time = same as the prompt, data = SPAN_DATA of one key of the prompt, in order
+
+# Result data: correct, timed out, substitutions, insertions, deletions (1 byte each), then padding.
+RESULT_DATA = struct.Struct("<BBBBB11x")
+# Span data: the (start, end) range of the key's characters within the expected text, such as a whole word of the word drill mode.
+SPAN_DATA = struct.Struct("<II8x")
+
+# How often the background thread writes the buffered records to disk, in seconds.
+FLUSH_SECONDS = 1.0
+
+
+# Pack a record with text data, plus any continuation records needed for long text. Returns the bytes.
+def pack_text_record(recordType, roundNumber, timeNs, text):
+    data = text.encode('utf-8')
+    packed = [RECORD.pack(recordType, len(data), roundNumber, timeNs, data[:DATA_SIZE])]
+    for start in range(DATA_SIZE, len(data), DATA_SIZE):
+        packed.append(RECORD.pack(CONTINUATION, 0, roundNumber, timeNs, data[start:start + DATA_SIZE]))
+    return b"".join(packed)
+
+
+# Return a journal filename for a new session: the path itself, or a timestamped file inside it if the path is a folder.
+def new_journal_filename(path):
+    path = os.path.expanduser(path)
+    if os.path.isdir(path):
+        path = os.path.join(path, time.strftime("session-%Y%m%d-%H%M%S") + JOURNAL_EXTENSION)
+    return path
+
+
+class JournalWriter:
+    '''
+    Append records to a journal file. The write_* functions only add to a memory buffer,
+    and a background thread appends the buffer to the file every FLUSH_SECONDS. Call close() at the end to write the rest.
+    '''
+    def __init__(self, filename, note=""):
+        self.filename = filename
+        self.file = open(filename, 'ab')
+        self.buffer = bytearray()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closing = False
+        self.append(RECORD.pack(HEADER, len(JOURNAL_MAGIC), JOURNAL_VERSION, time.time_ns(), JOURNAL_MAGIC))
+        if note:
+            self.write_note(note)
+        self.thread = threading.Thread(target=self.run, name="JournalWriter", daemon=True)
+        self.thread.start()
+
+    def append(self, packed):
+        with self.lock:
+            self.buffer += packed
+
+    def write_note(self, text, roundNumber=0):
+        '''Record a line of free text, such as the result of a step of a stress test.'''
+        self.append(pack_text_record(NOTE, roundNumber, time.time_ns(), text))
+
+    def write_round(self, roundNumber, prompt, typedKeys, timeStart, keyTimes, scoreTime, correct, timedOut, alignment):
+        '''Record one whole round: the prompt with its phrases, each key with its arrival time, and the result.'''
+        packed = [pack_text_record(PROMPT, roundNumber, timeStart, prompt.truth)]
+        for (word, (start, end)) in zip(prompt.words, prompt.spans):
+            packed.append(pack_text_record(WORD, roundNumber, timeStart, word))
+            packed.append(RECORD.pack(SPAN, 0, roundNumber, timeStart, SPAN_DATA.pack(start, end)))
+        for (key, arrival) in zip(typedKeys, keyTimes):
+            packed.append(pack_text_record(KEY, roundNumber, arrival, key))
+        resultData = RESULT_DATA.pack(1 if correct else 0, 1 if timedOut else 0,
+                                      min(alignment.substitutions, 255), min(alignment.insertions, 255), min(alignment.deletions, 255))
+        packed.append(RECORD.pack(RESULT, 0, roundNumber, scoreTime, resultData))
+        self.append(b"".join(packed))
+
+    def flush(self):
+        with self.lock:
+            data = bytes(self.buffer)
+            del self.buffer[:]
+        if data:
+            with profiler.span("journal flush"):
+                self.file.write(data)
+                self.file.flush()
+
+    def run(self):
+        while not self.closing:
+            self.wakeup.wait(FLUSH_SECONDS)
+            self.flush()
+
+    def close(self):
+        self.closing = True
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+#--------------------------------------
+
+
+class JournalRound:
+    '''One round read back from a journal.'''
+    def __init__(self, roundNumber, truth, timeStart):
+        self.roundNumber = roundNumber
+        self.truth = truth
+        self.timeStart = timeStart      # Monotonic nanoseconds when the prompt was shown
+        self.words = []
+        self.spans = []                 # The (start, end) range of each word's characters within the truth
+        self.keys = []                  # List of (key text, arrival time in monotonic nanoseconds)
+        self.scoreTime = 0
+        self.correct = False
+        self.timedOut = False
+        self.substitutions = 0
+        self.insertions = 0
+        self.deletions = 0
+
+    def typed(self):
+        return "".join([key for (key, arrival) in self.keys])
+
+    def key_seconds(self):
+        '''Latency of each key: the first key from when the prompt was shown, then the gaps between keys.'''
+        seconds = []
+        previous = self.timeStart
+        for (key, arrival) in self.keys:
+            seconds.append((arrival - previous) / 1e9)
+            previous = arrival
+        return seconds
+
+    def span_seconds(self):
+        '''Latency of each word that was typed: from the previous word's last keystroke (or the prompt being shown) until its own last keystroke.'''
+        seconds = []
+        previous = self.timeStart
+        for (start, end) in self.spans:
+            if end > len(self.keys):
+                break
+            seconds.append((self.keys[end-1][1] - previous) / 1e9)
+            previous = self.keys[end-1][1]
+        return seconds
+
+
+class JournalReader:
+    '''
+    Read a journal by memory-mapping it, unpacking records directly from the mapped pages.
+    A journal that is still being written (or was cut off by a crash) is read up to its last complete record.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // RECORD_SIZE
+        self.map = None
+        self.view = memoryview(b"")
+        if self.count > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+        self.startTime = 0
+        self.notes = []
+        if self.count > 0:
+            (recordType, length, version, timeNs, data) = RECORD.unpack_from(self.view, 0)
+            if recordType != HEADER or data[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+                self.close()
+                raise ValueError("'%s' isn't a practice session journal" % filename)
+            if version > JOURNAL_VERSION:
+                self.close()
+                raise ValueError("'%s' is a newer journal version (%d) than this program supports" % (filename, version))
+            self.startTime = timeNs
+
+    def close(self):
+        self.view.release()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def records(self):
+        '''Yield (type, round number, time in nanoseconds, text or data bytes) of each record, joining continuation records.'''
+        view = self.view
+        i = 0
+        while i < self.count:
+            (recordType, length, roundNumber, timeNs, data) = RECORD.unpack_from(view, i * RECORD_SIZE)
+            i += 1
+            if recordType in (PROMPT, WORD, KEY, NOTE):
+                if length > DATA_SIZE:
+                    # The text continues in the following records.
+                    extra = (length - 1) // DATA_SIZE
+                    dataStart = i * RECORD_SIZE - DATA_SIZE
+                    parts = [bytes(view[dataStart + j * RECORD_SIZE:dataStart + j * RECORD_SIZE + DATA_SIZE]) for j in range(extra + 1)]
+                    i += extra
+                    data = b"".join(parts)
+                yield (recordType, roundNumber, timeNs, data[:length].decode('utf-8', 'replace'))
+            elif recordType != CONTINUATION:
+                yield (recordType, roundNumber, timeNs, data)
+
+    def rounds(self):
+        '''Yield a JournalRound for each complete round in the journal.'''
+        current = None
+        for (recordType, roundNumber, timeNs, data) in self.records():
+            if recordType == PROMPT:
+                current = JournalRound(roundNumber, data, timeNs)
+            elif current is None:
+                if recordType == NOTE:
+                    self.notes.append(data)
+            elif recordType == WORD:
+                current.words.append(data)
+            elif recordType == SPAN:
+                current.spans.append(SPAN_DATA.unpack(data))
+            elif recordType == KEY:
+                current.keys.append((data, timeNs))
+            elif recordType == RESULT:
+                (correct, timedOut, substitutions, insertions, deletions) = RESULT_DATA.unpack(data)
+                current.scoreTime = timeNs
+                current.correct = bool(correct)
+                current.timedOut = bool(timedOut)
+                current.substitutions = substitutions
+                current.insertions = insertions
+                current.deletions = deletions
+                if len(current.spans) == 0 and len(current.truth) == len(current.words):
+                    current.spans = [(i, i + 1) for i in range(len(current.words))]    # Version 1 only journaled single characters
+                yield current
+                current = None
+
+
+if __name__ == "__main__":
+    # Print a journal as text, eg: "python session_journal.py session-20231201-093000.psj"
+    for filename in sys.argv[1:]:
+        with JournalReader(filename) as reader:
+            print("%s: %d records, started %s" % (filename, reader.count, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(reader.startTime / 1e9))))
+            for journalRound in reader.rounds():
+                secondsText = " ".join(["%.3f" % seconds for seconds in journalRound.key_seconds()])
+                print("%6d  %-12s %-12s %-7s  [%s] s" % (journalRound.roundNumber, journalRound.truth, journalRound.typed(),
+                                                    "correct" if journalRound.correct else "WRONG", secondsText))
+            for note in reader.notes:
+                print("Note:", note)
@@ -0,0 +1,342 @@
+# coding: utf-8
+# Report of many recorded practice sessions (the journals saved by "practice_mappings.py --journal"): the accuracy & latency
+# percentiles of each key, and how they improved from session to session. Written as a static HTML page plus CSV files.
+#
+# Each journal is parsed in a separate worker process into flat columns (key id, correct, latency), then all the columns are
+# joined and the per-key & per-session numbers are computed with NumPy array operations. NumPy is optional: without it the same
+# numbers are computed in plain Python, which is fine for a few thousand rounds but slow for a whole team's history.
+#
+# eg:
+#   python session_report.py ~/practice_journals/ --output practice_report
+
+from __future__ import print_function
+
+import os
+import sys
+import csv
+import html
+import math
+import time
+import argparse
+import concurrent.futures
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from session_journal import JournalReader, JOURNAL_EXTENSION
+from scoring import align
+from latency_stats import PERCENTILES
+
+
+class JournalSummary:
+    '''
+    The results of one journal, as flat columns with one entry per practiced key.
+    keys: list of distinct (phrase, character) keys in this journal, that keyIds refer to.
+    keyLatency is NaN for keys without a latency, such as missed keys or rounds that ran out of time.
+    '''
+    def __init__(self, filename, startTime):
+        self.filename = filename
+        self.startTime = startTime      # Wall clock nanoseconds
+        self.keys = []
+        self.keyIds = array('L')
+        self.keyCorrect = array('B')
+        self.keyLatency = array('d')
+        self.rounds = 0
+        self.correctRounds = 0
+        self.charErrors = 0
+        self.charCount = 0
+
+
+# Read one journal into a JournalSummary. Runs in a worker process.
+def summarize_journal(filename):
+    with JournalReader(filename) as reader:
+        summary = JournalSummary(filename, reader.startTime)
+        keyIndex = {}
+        for journalRound in reader.rounds():
+            summary.rounds += 1
+            summary.correctRounds += 1 if journalRound.correct else 0
+            summary.charErrors += journalRound.substitutions + journalRound.insertions + journalRound.deletions
+            summary.charCount += len(journalRound.truth)
+            if len(journalRound.spans) != len(journalRound.words):
+                continue    # Can't tell which characters belong to which phrase
+            expected = list(journalRound.truth)
+            typedKeys = [key for (key, arrival) in journalRound.keys]
+            typedForExpected = align(expected, typedKeys).typed_for_expected()
+            keySeconds = journalRound.span_seconds()
+            for (i, (start, end)) in enumerate(journalRound.spans):
+                key = (journalRound.words[i], journalRound.truth[start:end])
+                if key not in keyIndex:
+                    keyIndex[key] = len(summary.keys)
+                    summary.keys.append(key)
+                summary.keyIds.append(keyIndex[key])
+                summary.keyCorrect.append(1 if typedForExpected[start:end] == expected[start:end] else 0)
+                hasLatency = i < len(keySeconds) and not journalRound.timedOut
+                summary.keyLatency.append(keySeconds[i] if hasLatency else float('nan'))
+    return summary
+
+
+# Return the sorted list of journal files among the given files & folders.
+def find_journals(paths):
+    filenames = []
+    for path in paths:
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            filenames.extend([os.path.join(path, name) for name in os.listdir(path) if name.endswith(JOURNAL_EXTENSION)])
+        else:
+            filenames.append(path)
+    return sorted(filenames)
+
+
+# Summarize all the journals, in a pool of worker processes unless jobs is 1. Returns the summaries sorted by start time.
+def summarize_journals(filenames, jobs=None):
+    if jobs == 1 or len(filenames) <= 1:
+        summaries = [summarize_journal(filename) for filename in filenames]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            chunksize = max(1, len(filenames) // (4 * (jobs or os.cpu_count() or 1)))
+            summaries = list(pool.map(summarize_journal, filenames, chunksize=chunksize))
+    summaries.sort(key=lambda summary: summary.startTime)
+    return summaries
+#--------------------------------------
+
+
+class KeyReport:
+    '''Totals & latency percentiles of one key, across all sessions or within one session.'''
+    def __init__(self, key, rounds, errors, latencyCount, meanLatency, percentiles):
+        self.key = key
+        self.rounds = rounds
+        self.errors = errors
+        self.latencyCount = latencyCount
+        self.meanLatency = meanLatency
+        self.percentiles = percentiles      # In the same order as PERCENTILES, NaN when there are no latencies
+
+    def accuracy(self):
+        return 100.0 * (self.rounds - self.errors) / self.rounds if self.rounds > 0 else 0.0
+
+
+# Nearest-rank percentile of a sorted list, the same as LatencySketch uses for a few samples.
+def nearest_rank(sortedValues, p):
+    if len(sortedValues) == 0:
+        return float('nan')
+    index = int(math.ceil(p * len(sortedValues))) - 1
+    return sortedValues[min(max(index, 0), len(sortedValues) - 1)]
+
+
+# Compute a KeyReport for each group, from flat columns of group ids, correct flags & latencies.
+# Uses NumPy when available: counts with bincount, and percentiles by sorting the latencies by (group, latency) once.
+def group_reports(groups, groupIds, correct, latency):
+    count = len(groups)
+    if numpy is None:
+        rounds = [0] * count
+        errors = [0] * count
+        latencies = [[] for g in range(count)]
+        for (g, c, seconds) in zip(groupIds, correct, latency):
+            rounds[g] += 1
+            errors[g] += 0 if c else 1
+            if not math.isnan(seconds):
+                latencies[g].append(seconds)
+        reports = []
+        for g in range(count):
+            values = sorted(latencies[g])
+            mean = sum(values) / len(values) if len(values) > 0 else float('nan')
+            reports.append(KeyReport(groups[g], rounds[g], errors[g], len(values), mean, [nearest_rank(values, p) for p in PERCENTILES]))
+        return reports
+
+    groupIds = numpy.asarray(groupIds, dtype=numpy.int64)
+    correct = numpy.asarray(correct, dtype=numpy.int64)
+    latency = numpy.asarray(latency, dtype=numpy.float64)
+    rounds = numpy.bincount(groupIds, minlength=count)
+    errors = rounds - numpy.bincount(groupIds, weights=correct, minlength=count).astype(numpy.int64)
+    valid = ~numpy.isnan(latency)
+    validIds = groupIds[valid]
+    validLatency = latency[valid]
+    latencyCounts = numpy.bincount(validIds, minlength=count)
+    latencySums = numpy.bincount(validIds, weights=validLatency, minlength=count)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        means = numpy.where(latencyCounts > 0, latencySums / latencyCounts, numpy.nan)
+    # Sort by group then latency, so each group's latencies are a sorted slice starting at starts[g].
+    order = numpy.lexsort((validLatency, validIds))
+    sortedLatency = validLatency[order]
+    starts = numpy.cumsum(latencyCounts) - latencyCounts
+    percentiles = []
+    for p in PERCENTILES:
+        index = starts + numpy.clip(numpy.ceil(p * latencyCounts).astype(numpy.int64) - 1, 0, None)
+        index = numpy.minimum(index, max(len(sortedLatency) - 1, 0))
+        values = sortedLatency[index] if len(sortedLatency) > 0 else numpy.full(count, numpy.nan)
+        percentiles.append(numpy.where(latencyCounts > 0, values, numpy.nan))
+    return [KeyReport(groups[g], int(rounds[g]), int(errors[g]), int(latencyCounts[g]), float(means[g]),
+                      [float(values[g]) for values in percentiles]) for g in range(count)]
+
+
+class Report:
+    '''The per-key totals over all sessions, the totals of each session, and each key's totals within each session.'''
+    def __init__(self, summaries):
+        self.summaries = summaries
+        # Give every key a global id, then translate each journal's own key ids into the global ids.
+        globalIndex = {}
+        keys = []
+        keyIdColumns = []
+        sessionColumns = []
+        for (s, summary) in enumerate(summaries):
+            translate = []
+            for key in summary.keys:
+                if key not in globalIndex:
+                    globalIndex[key] = len(keys)
+                    keys.append(key)
+                translate.append(globalIndex[key])
+            if numpy is not None:
+                localIds = numpy.frombuffer(summary.keyIds, dtype='u%d' % summary.keyIds.itemsize)
+                keyIdColumns.append(numpy.asarray(translate, dtype=numpy.int64)[localIds] if len(localIds) > 0 else numpy.zeros(0, dtype=numpy.int64))
+                sessionColumns.append(numpy.full(len(summary.keyIds), s, dtype=numpy.int64))
+            else:
+                keyIdColumns.append([translate[k] for k in summary.keyIds])
+                sessionColumns.append([s] * len(summary.keyIds))
+        self.keys = keys
+
+        if numpy is not None and len(summaries) > 0:
+            keyIds = numpy.concatenate(keyIdColumns)
+            sessionIds = numpy.concatenate(sessionColumns)
+            correct = numpy.concatenate([numpy.frombuffer(summary.keyCorrect, dtype=numpy.uint8) for summary in summaries])
+            latency = numpy.concatenate([numpy.frombuffer(summary.keyLatency, dtype=numpy.float64) for summary in summaries])
+            # Number only the (session, key) pairs that were practiced, in order of session then key.
+            (pairIds, sessionKeyIds) = numpy.unique(sessionIds * len(keys) + keyIds, return_inverse=True)
+            pairIds = pairIds.tolist()
+        else:
+            keyIds = [k for column in keyIdColumns for k in column]
+            sessionIds = [s for column in sessionColumns for s in column]
+            correct = [c for summary in summaries for c in summary.keyCorrect]
+            latency = [seconds for summary in summaries for seconds in summary.keyLatency]
+            combinedIds = [s * len(keys) + k for (s, k) in zip(sessionIds, keyIds)]
+            pairIds = sorted(set(combinedIds))
+            pairIndex = dict([(pairId, i) for (i, pairId) in enumerate(pairIds)])
+            sessionKeyIds = [pairIndex[pairId] for pairId in combinedIds]
+
+        self.keyReports = group_reports(keys, keyIds, correct, latency)
+        self.sessionReports = group_reports(list(range(len(summaries))), sessionIds, correct, latency)
+        # Each key within each session, for the improvement curve of each key.
+        sessionKeys = [(pairId // len(keys), keys[pairId % len(keys)]) for pairId in pairIds]
+        self.sessionKeyReports = group_reports(sessionKeys, sessionKeyIds, correct, latency)
+
+    def worst_keys(self):
+        '''Key reports with the least accurate keys first, then the slowest median latency.'''
+        return sorted(self.keyReports, key=lambda report: (report.accuracy(), -nan_to_zero(report.percentiles[0])))
+#--------------------------------------
+
+
+def nan_to_zero(value):
+    return 0.0 if math.isnan(value) else value
+
+def session_date(summary):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(summary.startTime / 1e9))
+
+def seconds_text(value):
+    return "" if math.isnan(value) else "%.3f" % value
+
+def percentile_names():
+    return ["p%d s" % round(p * 100) for p in PERCENTILES]
+
+
+def write_csv_files(report, folder):
+    with open(os.path.join(folder, "keys.csv"), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["phrase", "char", "rounds", "errors", "accuracy %", "mean s"] + percentile_names())
+        for r in report.worst_keys():
+            writer.writerow([r.key[0], r.key[1], r.rounds, r.errors, "%.1f" % r.accuracy(), seconds_text(r.meanLatency)] + [seconds_text(v) for v in r.percentiles])
+
+    with open(os.path.join(folder, "sessions.csv"), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["session", "start", "file", "rounds", "correct rounds", "CER %", "keys", "key accuracy %", "mean s"] + percentile_names())
+        for (s, r) in enumerate(report.sessionReports):
+            summary = report.summaries[s]
+            cer = 100.0 * summary.charErrors / summary.charCount if summary.charCount > 0 else 0.0
+            writer.writerow([s + 1, session_date(summary), summary.filename, summary.rounds, summary.correctRounds, "%.1f" % cer,
+                             r.rounds, "%.1f" % r.accuracy(), seconds_text(r.meanLatency)] + [seconds_text(v) for v in r.percentiles])
+
+    with open(os.path.join(folder, "key_sessions.csv"), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["session", "start", "phrase", "char", "rounds", "errors", "accuracy %", "mean s"] + percentile_names())
+        for r in report.sessionKeyReports:
+            (s, (phrase, char)) = r.key
+            writer.writerow([s + 1, session_date(report.summaries[s]), phrase, char, r.rounds, r.errors, "%.1f" % r.accuracy(),
+                             seconds_text(r.meanLatency)] + [seconds_text(v) for v in r.percentiles])
+
+
+# An SVG line chart of the values, one point per session, skipping NaN values.
+def svg_line_chart(values, title, unit, width=640, height=200, margin=40):
+    points = [(i, v) for (i, v) in enumerate(values) if not math.isnan(v)]
+    parts = ['<svg width="%d" height="%d" xmlns="http://www.w3.org/2000/svg">' % (width, height),
+             '<text x="%d" y="16" font-size="14">%s</text>' % (margin, html.escape(title))]
+    if len(points) > 0:
+        low = min([v for (i, v) in points])
+        high = max([v for (i, v) in points])
+        if high - low < 1e-9:
+            (low, high) = (low - 1.0, high + 1.0)
+        xScale = (width - 2 * margin) / float(max(len(values) - 1, 1))
+        yScale = (height - 2 * margin) / (high - low)
+        coordinates = " ".join(["%.1f,%.1f" % (margin + i * xScale, height - margin - (v - low) * yScale) for (i, v) in points])
+        parts.append('<polyline fill="none" stroke="#3366cc" stroke-width="2" points="%s"/>' % coordinates)
+        parts.append('<text x="4" y="%d" font-size="11">%.2f%s</text>' % (margin, high, unit))
+        parts.append('<text x="4" y="%d" font-size="11">%.2f%s</text>' % (height - margin, low, unit))
+        parts.append('<text x="%d" y="%d" font-size="11">session 1 .. %d</text>' % (margin, height - 10, len(values)))
+    parts.append('</svg>')
+    return "\n".join(parts)
+
+def html_table(header, rows):
+    lines = ["<table>", "<tr>" + "".join(["<th>%s</th>" % html.escape(str(cell)) for cell in header]) + "</tr>"]
+    for row in rows:
+        lines.append("<tr>" + "".join(["<td>%s</td>" % html.escape(str(cell)) for cell in row]) + "</tr>")
+    lines.append("</table>")
+    return "\n".join(lines)
+
+def write_html_file(report, folder, count):
+    totalRounds = sum([summary.rounds for summary in report.summaries])
+    totalKeys = sum([r.rounds for r in report.keyReports])
+    parts = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>Practice report</title>',
+             '<style>body { font-family: sans-serif; } table { border-collapse: collapse; } '
+             'td, th { border: 1px solid #ccc; padding: 2px 8px; text-align: right; } th { background: #eee; }</style>',
+             '</head><body>', '<h1>Practice report</h1>',
+             '<p>%d sessions, %d rounds, %d keys. Generated %s.</p>' % (len(report.summaries), totalRounds, totalKeys, time.strftime("%Y-%m-%d %H:%M")),
+             '<h2>Improvement</h2>',
+             svg_line_chart([r.accuracy() for r in report.sessionReports], "Key accuracy per session", "%"),
+             svg_line_chart([r.percentiles[0] for r in report.sessionReports], "Median key latency per session", " s"),
+             '<h2>Hardest keys</h2>',
+             html_table(["Phrase", "Char", "Rounds", "Errors", "Accuracy %", "Mean s"] + percentile_names(),
+                        [[r.key[0], r.key[1], r.rounds, r.errors, "%.1f" % r.accuracy(), seconds_text(r.meanLatency)] +
+                         [seconds_text(v) for v in r.percentiles] for r in report.worst_keys()[:count]]),
+             '<h2>Sessions</h2>',
+             html_table(["Session", "Start", "Rounds", "Correct rounds", "Key accuracy %"] + percentile_names(),
+                        [[s + 1, session_date(report.summaries[s]), report.summaries[s].rounds, report.summaries[s].correctRounds,
+                          "%.1f" % r.accuracy()] + [seconds_text(v) for v in r.percentiles] for (s, r) in enumerate(report.sessionReports)]),
+             '<p>The results of every key in every session are in "key_sessions.csv".</p>',
+             '</body></html>']
+    with open(os.path.join(folder, "report.html"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(parts) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage='%(prog)s [options] journal_file_or_folder ...', description='Write an HTML & CSV report of many practice session journals (from "practice_mappings.py --journal").')
+    parser.add_argument('journals', nargs='+', help='Journal files, or folders of ".psj" journal files.')
+    parser.add_argument('-o', '--output', default="practice_report", help='Folder to write "report.html" and the CSV files into. Default is "practice_report".')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='How many worker processes read the journals. Default is the number of CPUs.')
+    parser.add_argument('-n', '--count', type=int, default=30, help='How many of the hardest keys to show in the HTML report. Default is 30.')
+    args = parser.parse_args()
+
+    filenames = find_journals(args.journals)
+    if len(filenames) == 0:
+        print("No journals found in", " ".join(args.journals))
+        sys.exit(1)
+    timeStart = time.monotonic()
+    summaries = summarize_journals(filenames, args.jobs)
+    timeRead = time.monotonic()
+    report = Report(summaries)
+    os.makedirs(args.output, exist_ok=True)
+    write_csv_files(report, args.output)
+    write_html_file(report, args.output, args.count)
+    timeEnd = time.monotonic()
+    print("Read %d journals (%d rounds) in %.2f s, computed the report in %.2f s%s." % (
+        len(summaries), sum([summary.rounds for summary in summaries]), timeRead - timeStart, timeEnd - timeRead,
+        "" if numpy is not None else " (without NumPy)"))
+    print("Wrote", os.path.join(args.output, "report.html"))
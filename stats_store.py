@@ -0,0 +1,247 @@
+# coding: utf-8
+# Persistent per-key practice statistics across sessions, stored in a local SQLite database (in WAL mode).
+# The game loop only puts each result into a queue, and a background thread writes them in batches,
+# so the keystroke loop never waits for the disk. Each key's totals are updated in place, in O(1) per round.
+#
+# Run this file directly to see your progress over the days, eg:
+#   python stats_store.py                 # Daily totals for the last 14 days
+#   python stats_store.py --keys          # Totals of each key, worst first
+#   python stats_store.py --key dozen     # Daily trend of one key
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+
+DEFAULT_STATS_FILENAME = "~/.practice_mappings_stats.sqlite3"
+
+# How often the writer thread commits a batch, in seconds.
+BATCH_SECONDS = 1.0
+
+# The latency aggregates allow the mean & standard deviation to be computed without keeping every sample.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS key_totals (
+    phrase TEXT NOT NULL,
+    char TEXT NOT NULL,
+    rounds INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    latency_sum REAL NOT NULL DEFAULT 0,
+    latency_sum_squares REAL NOT NULL DEFAULT 0,
+    latency_max REAL NOT NULL DEFAULT 0,
+    first_day TEXT NOT NULL,
+    last_day TEXT NOT NULL,
+    PRIMARY KEY (phrase, char)
+);
+CREATE TABLE IF NOT EXISTS daily_key_totals (
+    day TEXT NOT NULL,
+    phrase TEXT NOT NULL,
+    char TEXT NOT NULL,
+    rounds INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    latency_sum REAL NOT NULL DEFAULT 0,
+    latency_sum_squares REAL NOT NULL DEFAULT 0,
+    latency_max REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, phrase, char)
+);
+CREATE TABLE IF NOT EXISTS daily_rounds (
+    day TEXT PRIMARY KEY,
+    rounds INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0
+);
+'''
+
+UPSERT_KEY_TOTALS = '''
+INSERT INTO key_totals (phrase, char, rounds, errors, latency_count, latency_sum, latency_sum_squares, latency_max, first_day, last_day)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (phrase, char) DO UPDATE SET
+    rounds = rounds + excluded.rounds,
+    errors = errors + excluded.errors,
+    latency_count = latency_count + excluded.latency_count,
+    latency_sum = latency_sum + excluded.latency_sum,
+    latency_sum_squares = latency_sum_squares + excluded.latency_sum_squares,
+    latency_max = MAX(latency_max, excluded.latency_max),
+    last_day = excluded.last_day
+'''
+
+UPSERT_DAILY_KEY_TOTALS = '''
+INSERT INTO daily_key_totals (day, phrase, char, rounds, errors, latency_count, latency_sum, latency_sum_squares, latency_max)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, phrase, char) DO UPDATE SET
+    rounds = rounds + excluded.rounds,
+    errors = errors + excluded.errors,
+    latency_count = latency_count + excluded.latency_count,
+    latency_sum = latency_sum + excluded.latency_sum,
+    latency_sum_squares = latency_sum_squares + excluded.latency_sum_squares,
+    latency_max = MAX(latency_max, excluded.latency_max)
+'''
+
+UPSERT_DAILY_ROUNDS = '''
+INSERT INTO daily_rounds (day, rounds, correct, seconds) VALUES (?, ?, ?, ?)
+ON CONFLICT (day) DO UPDATE SET
+    rounds = rounds + excluded.rounds,
+    correct = correct + excluded.correct,
+    seconds = seconds + excluded.seconds
+'''
+
+
+# Open the database, creating the tables if needed. WAL mode lets the query tool read while a session is writing.
+def open_database(filename):
+    connection = sqlite3.connect(os.path.expanduser(filename), timeout=30.0)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class KeyTotals:
+    '''Totals of one key within a batch, before they get added to the database.'''
+    def __init__(self):
+        self.rounds = 0
+        self.errors = 0
+        self.latencyCount = 0
+        self.latencySum = 0.0
+        self.latencySumSquares = 0.0
+        self.latencyMax = 0.0
+
+    def add(self, correct, seconds):
+        self.rounds += 1
+        if not correct:
+            self.errors += 1
+        if seconds is not None:
+            self.latencyCount += 1
+            self.latencySum += seconds
+            self.latencySumSquares += seconds * seconds
+            self.latencyMax = max(self.latencyMax, seconds)
+
+
+class StatsStore:
+    '''
+    Collect per-key results and write them to the database in the background.
+    record_key() and record_round() only add to a queue, so they never block the game loop.
+    Call close() at the end of the session to write the last batch.
+    '''
+    def __init__(self, filename=DEFAULT_STATS_FILENAME):
+        self.filename = filename
+        self.queue = queue.Queue()
+        # Open the database here, so that problems such as a bad path are reported straight away.
+        open_database(filename).close()
+        self.thread = threading.Thread(target=self.run, name="StatsStore", daemon=True)
+        self.thread.start()
+
+    def record_key(self, key, correct, seconds):
+        '''Record one practiced (phrase, character) key, whether it was typed correctly, and its latency in seconds (or None).'''
+        self.queue.put(("key", key, correct, seconds))
+
+    def record_round(self, correct, seconds):
+        '''Record one whole round (combo), whether it was correct, and how long it took in seconds.'''
+        self.queue.put(("round", None, correct, seconds))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        connection = open_database(self.filename)
+        finished = False
+        while not finished:
+            # Wait for the first result, then collect everything else that arrives within the batch time.
+            items = [self.queue.get()]
+            deadline = time.monotonic() + BATCH_SECONDS
+            while items[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if items[-1] is None:
+                finished = True
+                items.pop()
+            if len(items) > 0:
+                self.write_batch(connection, items)
+        connection.close()
+
+    def write_batch(self, connection, items):
+        '''Add up the batch in memory, then apply it to the database in a single transaction.'''
+        day = time.strftime("%Y-%m-%d")
+        keyTotals = {}
+        (rounds, correctRounds, seconds) = (0, 0, 0.0)
+        for (kind, key, correct, latency) in items:
+            if kind == "key":
+                if key not in keyTotals:
+                    keyTotals[key] = KeyTotals()
+                keyTotals[key].add(correct, latency)
+            else:
+                rounds += 1
+                correctRounds += 1 if correct else 0
+                seconds += latency or 0.0
+
+        with connection:
+            connection.executemany(UPSERT_KEY_TOTALS, [
+                (phrase, char, t.rounds, t.errors, t.latencyCount, t.latencySum, t.latencySumSquares, t.latencyMax, day, day)
+                for ((phrase, char), t) in keyTotals.items()])
+            connection.executemany(UPSERT_DAILY_KEY_TOTALS, [
+                (day, phrase, char, t.rounds, t.errors, t.latencyCount, t.latencySum, t.latencySumSquares, t.latencyMax)
+                for ((phrase, char), t) in keyTotals.items()])
+            if rounds > 0:
+                connection.execute(UPSERT_DAILY_ROUNDS, (day, rounds, correctRounds, seconds))
+#--------------------------------------
+
+
+# Percentage, or 0 when there's nothing to divide by.
+def percent(part, whole):
+    return 100.0 * part / whole if whole > 0 else 0.0
+
+def print_daily_totals(connection, days):
+    print("%-12s %8s %9s %10s" % ("Day", "Rounds", "Correct", "s/round"))
+    rows = connection.execute("SELECT day, rounds, correct, seconds FROM daily_rounds ORDER BY day DESC LIMIT ?", (days,)).fetchall()
+    for (day, rounds, correct, seconds) in reversed(rows):
+        print("%-12s %8d %8.1f%% %10.2f" % (day, rounds, percent(correct, rounds), seconds / rounds if rounds > 0 else 0.0))
+
+def print_key_totals(connection, count):
+    print("%-24s %-5s %8s %8s %10s %10s %10s" % ("Phrase", "Char", "Rounds", "Errors", "Mean s", "Max s", "Last day"))
+    rows = connection.execute('''SELECT phrase, char, rounds, errors, latency_count, latency_sum, latency_max, last_day FROM key_totals
+                                 ORDER BY CAST(errors AS REAL) / rounds DESC, latency_sum / MAX(latency_count, 1) DESC LIMIT ?''', (count,)).fetchall()
+    for (phrase, char, rounds, errors, latencyCount, latencySum, latencyMax, lastDay) in rows:
+        mean = latencySum / latencyCount if latencyCount > 0 else 0.0
+        print("%-24s %-5s %8d %7.1f%% %10.3f %10.3f %10s" % (phrase, char, rounds, percent(errors, rounds), mean, latencyMax, lastDay))
+
+def print_key_trend(connection, phrase, days):
+    print("%-12s %-5s %8s %8s %10s %10s" % ("Day", "Char", "Rounds", "Errors", "Mean s", "Std dev s"))
+    rows = connection.execute('''SELECT day, char, rounds, errors, latency_count, latency_sum, latency_sum_squares FROM daily_key_totals
+                                 WHERE phrase = ? ORDER BY day DESC LIMIT ?''', (phrase, days)).fetchall()
+    for (day, char, rounds, errors, latencyCount, latencySum, latencySumSquares) in reversed(rows):
+        mean = latencySum / latencyCount if latencyCount > 0 else 0.0
+        variance = max(latencySumSquares / latencyCount - mean * mean, 0.0) if latencyCount > 0 else 0.0
+        print("%-12s %-5s %8d %7.1f%% %10.3f %10.3f" % (day, char, rounds, percent(errors, rounds), mean, variance ** 0.5))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage='%(prog)s [options]', description='Show practice statistics collected by "practice_mappings.py" over the days.')
+    parser.add_argument('-f', '--stats_file', default=DEFAULT_STATS_FILENAME, help='The statistics database. Default is "%s".' % DEFAULT_STATS_FILENAME)
+    parser.add_argument('-d', '--days', type=int, default=14, help='How many of the most recent days to show. Default is 14.')
+    parser.add_argument('-k', '--keys', action='store_true', help='Show the totals of each key, with the most often wrong keys first.')
+    parser.add_argument('--key', metavar='PHRASE', help='Show the daily trend of one key, by its phrase.')
+    parser.add_argument('-n', '--count', type=int, default=30, help='How many keys to show with "--keys". Default is 30.')
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.expanduser(args.stats_file)):
+        print("No statistics have been saved yet in", args.stats_file)
+        sys.exit(1)
+    connection = open_database(args.stats_file)
+    if args.key:
+        print_key_trend(connection, args.key, args.days)
+    elif args.keys:
+        print_key_totals(connection, args.count)
+    else:
+        print_daily_totals(connection, args.days)
+    connection.close()
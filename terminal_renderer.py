@@ -0,0 +1,79 @@
+# coding: utf-8
+# Frame-based terminal output. Each update of the screen is built in memory and sent with a single write, and on a terminal the
+# status lines & prompt at the bottom are redrawn in place using ANSI cursor movement, instead of scrolling a new copy each time.
+# This keeps the number of writes (and the display jitter over slow SSH connections) down while the keystrokes are being timed.
+# When the output isn't a terminal (eg: piped to a file, or a headless benchmark), frames are written as plain lines instead.
+
+from __future__ import print_function
+
+import sys
+import shutil
+
+ESC = "\x1b"
+CLEAR_TO_END_OF_LINE = ESC + "[K"
+CLEAR_TO_END_OF_SCREEN = ESC + "[J"
+
+
+def cursor_up(rows):
+    return ESC + "[%dA" % rows if rows > 0 else ""
+
+# How many rows of the screen a line of text takes up, when it wraps at the given width.
+def screen_rows(text, width):
+    return max(1, (len(text) + width - 1) // width)
+
+
+class TerminalRenderer:
+    '''
+    Draw frames made of: history lines that scroll up normally, then a status region and an optional prompt line that get replaced
+    by the next frame. The cursor is left at the start of the row below the prompt, where the typed keys get echoed.
+    inPlace: redraw the status region in place. Default is to do so when the stream is a terminal.
+    '''
+    def __init__(self, stream=None, inPlace=None):
+        self.stream = stream if stream is not None else sys.stdout
+        if inPlace is None:
+            inPlace = self.stream.isatty()
+        self.inPlace = inPlace
+        self.liveRows = 0       # Rows of the current status region + prompt + the cursor's row, that the next frame replaces
+        self.writes = 0
+
+    def width(self):
+        return max(shutil.get_terminal_size().columns, 1)
+
+    def write(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+        self.writes += 1
+
+    def frame(self, history, status, prompt=None, echoed=""):
+        '''
+        Draw one frame with a single write.
+        history: lines to add above the status region, that stay on the screen.
+        status: lines of the status region, replacing the previous status region.
+        prompt: line to show below the status region, or None.
+        echoed: the text that was echoed on the cursor's row since the last frame, in case it wrapped onto more rows.
+        '''
+        lines = list(history) + list(status)
+        if prompt is not None:
+            lines.append(prompt)
+        if not self.inPlace:
+            self.write("".join([line + "\n" for line in lines]))
+            return
+
+        # Go back up to the top of the previous status region and clear it, then draw the new frame from there.
+        width = self.width()
+        parts = []
+        if self.liveRows > 0:
+            parts.append("\r" + cursor_up(self.liveRows - 1 + screen_rows(echoed, width) - 1) + CLEAR_TO_END_OF_SCREEN)
+        liveLines = list(status) + ([prompt] if prompt is not None else [])
+        for line in history:
+            if line:        # The status region already separates the rounds, so blank lines aren't needed.
+                parts.append(line + "\n")
+        for line in liveLines:
+            if line:
+                parts.append(line + CLEAR_TO_END_OF_LINE + "\n")
+        self.liveRows = sum([screen_rows(line, width) for line in liveLines if line]) + 1
+        self.write("".join(parts))
+
+    def finish(self):
+        '''Stop redrawing in place, so that any following output scrolls normally below the last frame.'''
+        self.liveRows = 0
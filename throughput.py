@@ -0,0 +1,158 @@
+# coding: utf-8
+# Typing & dictation throughput over rolling time windows (eg: the last 5 s, the last 30 s, and the whole session), in characters per
+# second and words per minute. The keys of each window are counted in a ring buffer of short time slots, so every keystroke only
+# costs a bounded amount of work, and the rates are steady figures that can be compared between sessions, instead of the speed of
+# whichever word was typed last.
+
+from __future__ import print_function
+
+import bisect
+from array import array
+
+# Rolling windows shown by default, in seconds. The whole session is always shown too.
+DEFAULT_WINDOWS = (5.0, 30.0)
+# Width of each time slot of the ring buffers. The windows are accurate to about this much.
+SLOT_SECONDS = 0.1
+# Standard definition of a "word" for WPM: 5 characters, including spaces, so that WPM doesn't depend on the length of the words typed.
+CHARS_PER_WORD = 5.0
+# Upper edges of the latency histogram bins in seconds, on a 1-2-5 scale. The last bin holds everything slower.
+HISTOGRAM_EDGES = (0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+def words_per_minute(charsPerSecond):
+    return charsPerSecond * 60.0 / CHARS_PER_WORD
+
+
+class RollingCounter:
+    '''
+    How many keys arrived in the last "seconds", using a ring buffer of fixed-width time slots.
+    Moving the window forward clears at most one lap of the ring, so each key costs a bounded amount of work however long the gap.
+    '''
+    def __init__(self, seconds, slotSeconds=SLOT_SECONDS):
+        self.seconds = seconds
+        self.slotNs = int(slotSeconds * 1e9)
+        self.slots = array('I', [0]) * max(1, int(round(seconds / slotSeconds)))
+        self.total = 0
+        self.currentSlot = None     # Absolute slot number (time / slot width) of the newest slot
+
+    def advance(self, timeNs):
+        '''Move the window forward to the given time, forgetting the slots that fell out of it.'''
+        slot = timeNs // self.slotNs
+        if self.currentSlot is None or slot - self.currentSlot >= len(self.slots):
+            for i in range(len(self.slots)):
+                self.slots[i] = 0
+            self.total = 0
+        elif slot > self.currentSlot:
+            for s in range(self.currentSlot + 1, slot + 1):
+                i = s % len(self.slots)
+                self.total -= self.slots[i]
+                self.slots[i] = 0
+        else:
+            return
+        self.currentSlot = slot
+
+    def add(self, timeNs, count=1):
+        self.advance(timeNs)
+        self.slots[self.currentSlot % len(self.slots)] += count
+        self.total += count
+
+    def count(self, timeNs):
+        self.advance(timeNs)
+        return self.total
+
+
+class LatencyHistogram:
+    '''Counts of the times between keystrokes, in the bins of HISTOGRAM_EDGES.'''
+    def __init__(self, edges=HISTOGRAM_EDGES):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.edges, seconds)] += 1
+
+    def labels(self):
+        bounds = ["0"] + ["%g" % edge for edge in self.edges]
+        return ["%s-%s s" % (bounds[i], bounds[i+1]) for i in range(len(self.edges))] + ["> %g s" % self.edges[-1]]
+
+    def lines(self, width=40):
+        '''Lines of text with a bar for each bin, such as "  0.1-0.2 s   143 ##########".'''
+        total = sum(self.counts)
+        if total == 0:
+            return []
+        biggest = max(self.counts)
+        return ["    %-12s %6d %s" % (label, n, "#" * int(round(width * n / float(biggest))))
+                for (label, n) in zip(self.labels(), self.counts)]
+
+
+class ThroughputMeter:
+    '''
+    Characters per second & WPM over each rolling window and over the whole session, the peak sustained rate, and a histogram of the
+    time between keystrokes. The clock starts at the first key, so a pause before typing doesn't count.
+    windows: lengths of the rolling windows in seconds. The peak sustained rate is the highest rate seen over a full shortest window.
+    '''
+    def __init__(self, windows=DEFAULT_WINDOWS):
+        self.windows = sorted(windows)
+        self.counters = [RollingCounter(seconds) for seconds in self.windows]
+        self.histogram = LatencyHistogram()
+        self.keys = 0
+        self.firstNs = None
+        self.lastNs = None
+        self.peak = 0.0
+
+    def add(self, timeNs):
+        '''Count one keystroke that arrived at the given monotonic time in nanoseconds.'''
+        if self.firstNs is None:
+            self.firstNs = timeNs
+        else:
+            self.histogram.add((timeNs - self.lastNs) / 1e9)
+        self.lastNs = timeNs
+        self.keys += 1
+        for counter in self.counters:
+            counter.add(timeNs)
+        # Only a window that has been fully typed in counts as sustained, otherwise 2 quick keys would be a huge peak.
+        if (timeNs - self.firstNs) / 1e9 >= self.windows[0]:
+            self.peak = max(self.peak, self.counters[0].total / self.windows[0])
+
+    def rate(self, windowIndex, timeNs=None):
+        '''Characters per second over one of the rolling windows, up to the given time (default: the last key).'''
+        if self.firstNs is None:
+            return 0.0
+        if timeNs is None:
+            timeNs = self.lastNs
+        counter = self.counters[windowIndex]
+        elapsed = (timeNs - self.firstNs) / 1e9
+        if elapsed < counter.seconds:
+            # The window hasn't filled up yet, so it's the same as the whole session so far.
+            return (self.keys - 1) / elapsed if elapsed > 0.0 else 0.0
+        return counter.count(timeNs) / counter.seconds
+
+    def session_rate(self):
+        '''Characters per second over the whole session, from the first key to the last.'''
+        elapsed = (self.lastNs - self.firstNs) / 1e9
+        if self.keys < 2 or elapsed <= 0.0:
+            return 0.0      # Such as when the first keys all arrived in the same read
+        return (self.keys - 1) / elapsed
+
+    def status_text(self, timeNs=None):
+        '''Short description, such as "5 s: 4.1 cps 49 WPM | 30 s: 3.8 cps 46 WPM | session: 3.7 cps 44 WPM | peak 4.5 cps".'''
+        parts = []
+        for (i, seconds) in enumerate(self.windows):
+            cps = self.rate(i, timeNs)
+            parts.append("%g s: %.1f cps %3.0f WPM" % (seconds, cps, words_per_minute(cps)))
+        cps = self.session_rate()
+        parts.append("session: %.1f cps %3.0f WPM" % (cps, words_per_minute(cps)))
+        parts.append("peak %.1f cps" % self.peak)
+        return " | ".join(parts)
+
+    def summary_lines(self):
+        '''Lines of text for the end-of-session summary.'''
+        if self.keys < 2:
+            return []
+        seconds = (self.lastNs - self.firstNs) / 1e9
+        cps = self.session_rate()
+        lines = ["Session: %d keys in %.1f s = %.2f cps, %.1f WPM (%g characters per word)." % (self.keys, seconds, cps, words_per_minute(cps), CHARS_PER_WORD)]
+        if self.peak > 0.0:
+            lines.append("Peak sustained over %g s: %.2f cps, %.1f WPM." % (self.windows[0], self.peak, words_per_minute(self.peak)))
+        lines.append("Time between keystrokes:")
+        lines.extend(self.histogram.lines())
+        return lines
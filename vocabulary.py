@@ -0,0 +1,239 @@
+# coding: utf-8
+# Large word & phrase vocabularies for the word drill mode, loaded from Talon ".talon-list" files, Talon vocabulary CSV files,
+# Dragonfly Python files or plain word lists. Vocabularies can hold many thousands of entries, so instead of a Python object per
+# entry, all the strings are interned into a single UTF-8 buffer with an array of offsets, the entries are arrays of string ids,
+# and a sorted array of entry ids acts as a prefix index on the spoken forms. The buffers are saved in a compiled snapshot
+# (like the key mappings), so loading a big vocabulary again only costs a few array copies.
+
+import os
+import csv
+import runpy
+from array import array
+
+from mappings import file_signature, read_cache, write_cache
+
+# Name of the compiled snapshot file, stored beside the first vocabulary file.
+VOCABULARY_CACHE_BASENAME = ".practice_vocabulary.cache"
+
+
+# Split an entry line such as "spoken form: written form" or just "word" into (spoken, written), removing any quotes.
+def split_entry(line):
+    if ":" in line:
+        (spoken, written) = line.split(":", 1)
+    else:
+        (spoken, written) = (line, line)
+    spoken = spoken.strip().strip('"\'')
+    written = written.strip()
+    if len(written) >= 2 and written[0] == written[-1] and written[0] in '"\'':
+        written = written[1:-1]
+    return (spoken, written if written else spoken)
+
+# Load a Talon ".talon-list" file: a header (eg: "list: user.vocabulary") then a "-" line, then one "spoken: written" or "word" entry per line.
+def load_talon_list(filename):
+    entries = []
+    with open(filename, encoding='utf-8') as f:
+        inHeader = any([line.strip() == "-" for line in f])
+        f.seek(0)
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if inHeader:
+                if line == "-":
+                    inHeader = False
+                continue
+            if line:
+                entries.append(split_entry(line))
+    return entries
+
+# Load a Talon vocabulary CSV file, such as knausj's "additional_words.csv": "written form,spoken form (if different)" on each row.
+def load_vocabulary_csv(filename):
+    entries = []
+    with open(filename, newline='', encoding='utf-8') as csvfile:
+        for row in csv.reader(csvfile):
+            if len(row) == 0 or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            if "spoken form" in ",".join(row).lower():
+                continue    # Header row
+            written = row[0].strip()
+            spoken = row[1].strip() if len(row) >= 2 and row[1].strip() else written
+            entries.append((spoken, written))
+    return entries
+
+# Load the vocabulary of a Dragonfly Python file: every {spoken: written} dictionary and every list of words defined in it.
+def load_vocabulary_python(filename):
+    entries = []
+    for (name, value) in runpy.run_path(filename).items():
+        if name.startswith("_"):
+            continue
+        if isinstance(value, dict):
+            entries.extend([(spoken, written) for (spoken, written) in value.items() if isinstance(spoken, str) and isinstance(written, str)])
+        elif isinstance(value, (list, tuple)):
+            entries.extend([(word, word) for word in value if isinstance(word, str)])
+    return entries
+
+# Load a plain text file with one "spoken: written" or "word" entry per line.
+def load_word_list(filename):
+    entries = []
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                entries.append(split_entry(line))
+    return entries
+
+# Load any supported vocabulary file, based on its extension. Returns a list of (spoken, written) pairs.
+def load_vocabulary_file(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".talon-list":
+        return load_talon_list(filename)
+    elif extension == ".csv":
+        return load_vocabulary_csv(filename)
+    elif extension == ".py":
+        return load_vocabulary_python(filename)
+    return load_word_list(filename)
+#--------------------------------------
+
+
+class StringPool:
+    '''
+    Interned strings, stored as UTF-8 in one bytearray with an array of offsets, so each distinct string is only stored once
+    and there's no Python object per string. String i is data[offsets[i]:offsets[i+1]].
+    '''
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('I', [0])
+        self.index = {}     # {string: id}, only needed while adding strings
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, text):
+        '''Return the id of the string, adding it if it's new.'''
+        stringId = self.index.get(text)
+        if stringId is None:
+            stringId = len(self)
+            self.index[text] = stringId
+            self.data += text.encode('utf-8')
+            self.offsets.append(len(self.data))
+        return stringId
+
+    def get(self, stringId):
+        return self.data[self.offsets[stringId]:self.offsets[stringId + 1]].decode('utf-8')
+
+    def freeze(self):
+        '''Drop the lookup table once all the strings have been added, to save memory.'''
+        self.index = None
+
+
+class Vocabulary:
+    '''
+    A list of (spoken form, written form) entries, that behaves like the letterMap list of (phrase, character) pairs.
+    spokenIds & writtenIds: the StringPool ids of each entry. When both forms are the same, the string is only stored once.
+    sortedIds: entry ids sorted by their spoken form, used as a prefix index.
+    '''
+    def __init__(self):
+        self.pool = StringPool()
+        self.spokenIds = array('I')
+        self.writtenIds = array('I')
+        self.sortedIds = array('I')
+
+    @classmethod
+    def from_entries(cls, entries):
+        '''Build a vocabulary from (spoken, written) pairs, skipping duplicate pairs.'''
+        vocabulary = cls()
+        seen = set()
+        for (spoken, written) in entries:
+            if not spoken or not written:
+                continue
+            spokenId = vocabulary.pool.add(spoken)
+            writtenId = vocabulary.pool.add(written)
+            if (spokenId, writtenId) in seen:
+                continue
+            seen.add((spokenId, writtenId))
+            vocabulary.spokenIds.append(spokenId)
+            vocabulary.writtenIds.append(writtenId)
+        vocabulary.pool.freeze()
+        vocabulary.sortedIds = array('I', sorted(range(len(vocabulary)), key=vocabulary.spoken))
+        return vocabulary
+
+    def snapshot(self):
+        '''Return the vocabulary as a tuple of bytes, for the compiled snapshot file.'''
+        return (bytes(self.pool.data), self.pool.offsets.tobytes(), self.spokenIds.tobytes(), self.writtenIds.tobytes(), self.sortedIds.tobytes())
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        vocabulary = cls()
+        (data, offsets, spokenIds, writtenIds, sortedIds) = snapshot
+        vocabulary.pool.data = bytearray(data)
+        vocabulary.pool.offsets = array('I')
+        vocabulary.pool.offsets.frombytes(offsets)
+        vocabulary.pool.freeze()
+        for (target, source) in ((vocabulary.spokenIds, spokenIds), (vocabulary.writtenIds, writtenIds), (vocabulary.sortedIds, sortedIds)):
+            target.frombytes(source)
+        return vocabulary
+
+    def __len__(self):
+        return len(self.spokenIds)
+
+    def __getitem__(self, i):
+        if i < 0 or i >= len(self.spokenIds):
+            raise IndexError("Vocabulary index out of range")
+        return (self.pool.get(self.spokenIds[i]), self.pool.get(self.writtenIds[i]))
+
+    def spoken(self, i):
+        return self.pool.get(self.spokenIds[i])
+
+    def prefix_range(self, prefix):
+        '''Return (start, end) of the entries in sortedIds whose spoken form starts with the prefix, by binary search.'''
+        def lower_bound(text):
+            (low, high) = (0, len(self.sortedIds))
+            while low < high:
+                middle = (low + high) // 2
+                if self.spoken(self.sortedIds[middle]) < text:
+                    low = middle + 1
+                else:
+                    high = middle
+            return low
+        start = lower_bound(prefix)
+        # Every string that starts with the prefix sorts before the prefix followed by the highest character.
+        end = lower_bound(prefix + "\U0010ffff")
+        return (start, end)
+
+    def with_prefix(self, prefix):
+        '''Return a VocabularySlice of the entries whose spoken form starts with the prefix.'''
+        (start, end) = self.prefix_range(prefix)
+        return VocabularySlice(self, self.sortedIds[start:end])
+
+
+class VocabularySlice:
+    '''Some of the entries of a Vocabulary, by their entry ids. Also behaves like the letterMap list.'''
+    def __init__(self, vocabulary, entryIds):
+        self.vocabulary = vocabulary
+        self.entryIds = entryIds
+
+    def __len__(self):
+        return len(self.entryIds)
+
+    def __getitem__(self, i):
+        if i < 0 or i >= len(self.entryIds):
+            raise IndexError("Vocabulary index out of range")
+        return self.vocabulary[self.entryIds[i]]
+
+
+# Load the given vocabulary files into one Vocabulary, from the compiled snapshot if none of the files have changed since last time.
+# If use_cache is False, the snapshot is neither read nor written.
+def load_vocabulary(filenames, use_cache=True):
+    filenames = [os.path.abspath(os.path.expanduser(filename)) for filename in filenames]
+    signatures = [(filename, file_signature(filename)) for filename in filenames]
+    cache_filename = os.path.join(os.path.dirname(filenames[0]), VOCABULARY_CACHE_BASENAME)
+    if use_cache:
+        cached = read_cache(cache_filename).get("vocabulary")
+        if cached is not None and [tuple(item) for item in cached[0]] == signatures:
+            return Vocabulary.from_snapshot(cached[1])
+
+    entries = []
+    for filename in filenames:
+        entries.extend(load_vocabulary_file(filename))
+    vocabulary = Vocabulary.from_entries(entries)
+    if use_cache and all([signature is not None for (filename, signature) in signatures]):
+        write_cache(cache_filename, {"vocabulary": (signatures, vocabulary.snapshot())})
+    return vocabulary
@@ -0,0 +1,115 @@
+# coding: utf-8
+# Weighted random choice of keys, so that some keys can be shown more often than others without duplicating them in the list.
+# Uses Vose's alias method, so each draw takes O(1) time no matter how many keys and symbols are in the mapping.
+
+import os
+import csv
+import random
+
+
+class AliasSampler:
+    '''
+    Randomly pick an index 0 .. n-1, with a probability proportional to the weight of that index.
+    Building the alias tables takes O(n) time, and is done on the first draw. A new sampler is made when the weights change.
+    rng: the random generator to use, so that "--random_seed" still gives a deterministic sequence.
+    '''
+    def __init__(self, weights, rng=random):
+        self.rng = rng
+        self.weights = []
+        for weight in weights:
+            self.weights.append(self.check_weight(weight))
+        self.prob = []
+        self.alias = []
+        self.dirty = True
+
+    def __len__(self):
+        return len(self.weights)
+
+    def check_weight(self, weight):
+        weight = float(weight)
+        if weight < 0.0:
+            raise ValueError("Weights can't be negative, but got %s" % weight)
+        return weight
+
+    def rebuild(self):
+        '''Build the probability & alias tables from the current weights.'''
+        n = len(self.weights)
+        total = sum(self.weights)
+        if n == 0 or total <= 0.0:
+            raise ValueError("Need at least 1 key with a positive weight")
+
+        # Scale the weights so that the average is 1.0, then pair up each "small" column with a "large" column.
+        scaled = [weight * n / total for weight in self.weights]
+        prob = [0.0] * n
+        alias = list(range(n))
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Whatever is left over is only due to rounding errors, so is full.
+        for i in large + small:
+            prob[i] = 1.0
+
+        self.prob = prob
+        self.alias = alias
+        self.dirty = False
+
+    def draw(self):
+        '''Return a random index, in O(1) time.'''
+        if self.dirty:
+            self.rebuild()
+        # Use a single random number for both the column and the coin flip within that column.
+        u = self.rng.random() * len(self.prob)
+        i = int(u)
+        if (u - i) < self.prob[i]:
+            return i
+        return self.alias[i]
+
+
+# Load a file of per-key weights, where each line is something like "dozen,3" or "d,3" or ".,0.5".
+# Lines starting with "#" are comments. Returns a dictionary of {phrase or character: weight}.
+# Raises ValueError with a message for the user if a weight is negative, or OSError if the file can't be read.
+def load_weights_file(filename):
+    filename = os.path.expanduser(filename)   # Allow to use "~" as the user's home folder
+
+    weights = {}
+    with open(filename, newline='') as csvfile:
+        filereader = csv.reader(csvfile, delimiter=',', quotechar='|')
+        for row in filereader:
+            if len(row) < 2 or row[0].startswith("#"):
+                continue
+            # Allow the key itself to be a comma, such as ",,2"
+            key = ",".join(row[:-1])
+            try:
+                weight = float(row[-1])
+            except ValueError:
+                continue    # Probably a header row
+            if weight < 0.0:
+                raise ValueError("Weights can't be negative, but '%s' got %s in '%s'" % (key, row[-1], filename))
+            weights[key] = weight
+    return weights
+
+
+# Parse a list of "--weight" command-line values such as ["dozen=3", "?=0.5"] into a dictionary of {phrase or character: weight}.
+# Raises ValueError with a message for the user if a value is malformed.
+def parse_weight_args(weight_args):
+    weights = {}
+    for text in weight_args or []:
+        key, sep, value = text.rpartition("=")
+        if not sep or not key:
+            raise ValueError("Expected a weight such as 'dozen=3', but got '%s'" % text)
+        try:
+            weights[key] = float(value)
+        except ValueError:
+            raise ValueError("Expected a number for the weight of '%s', but got '%s'" % (key, value))
+        if weights[key] < 0.0:
+            raise ValueError("Weights can't be negative, but '%s' got %s" % (key, value))
+    return weights